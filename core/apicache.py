@@ -0,0 +1,98 @@
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import add_never_cache_headers, patch_cache_control
+from django.views.decorators.http import condition
+
+from .catalog import get_catalog, read_catalog_version
+from .metrics import timed
+
+
+def catalog_key(name, *parts):
+    """
+    Ключ кэша ответа API, привязанный к штампу версии каталога.
+
+    generate_index меняет штамп при любом изменении данных, поэтому после
+    переиндексации все процессы сразу читают новые ключи, а старые записи
+    истекают по таймауту.
+    """
+    suffix = ':'.join('' if part is None else str(part) for part in parts)
+    return f'catalog:{read_catalog_version()}:{name}:{suffix}'
+
+
+def cached_catalog_data(name, parts, build):
+    """
+    Данные из общего кэша или результат build(), сохраненный в кэш.
+
+    Пустые результаты не кэшируются: они бывают до первой индексации,
+    и запись на сутки скрыла бы появившиеся данные.
+    """
+    key = catalog_key(name, *parts)
+    with timed('cache'):
+        data = cache.get(key)
+    if data is None:
+        data = build()
+        if data:
+            with timed('cache'):
+                cache.set(key, data, settings.CATALOG_CACHE_TIMEOUT)
+    return data
+
+
+def _request_catalog(request):
+    """(штамп версии, поколение каталога, время изменения в нс), один раз за запрос"""
+    if not hasattr(request, '_catalog_state'):
+        catalog = get_catalog()
+        request._catalog_state = (read_catalog_version(), catalog.generation, catalog.modified_ns)
+    return request._catalog_state
+
+
+def catalog_etag(request, *args, **kwargs):
+    """
+    ETag ответа: штамп версии, поколение каталога в памяти (mtime директорий)
+    и полный URL запроса
+    """
+    version, generation, _ = _request_catalog(request)
+    if not version and not generation:
+        return None
+    return hashlib.sha1(f'{version}:{generation}:{request.get_full_path()}'.encode('utf-8')).hexdigest()
+
+
+def catalog_last_modified(request, *args, **kwargs):
+    """Last-Modified: последнее изменение штампа версии или директорий архива"""
+    modified_ns = _request_catalog(request)[2]
+    if not modified_ns:
+        return None
+    return datetime.fromtimestamp(modified_ns / 1e9, tz=timezone.utc)
+
+
+# Условный GET по версии каталога: при совпадении валидаторов view не
+# вызывается и сразу отдается 304
+catalog_condition = condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified)
+
+
+def catalog_cached(max_age):
+    """
+    catalog_condition и публичное кэширование на max_age секунд только для
+    успешных ответов (200 и 304). Ошибки (400/404/500/503) отдаются без
+    валидаторов и с запретом кэширования, чтобы прокси не держали их.
+    """
+    def decorator(view):
+        conditional_view = catalog_condition(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                patch_cache_control(response, public=True, max_age=max_age)
+            else:
+                del response['ETag']
+                del response['Last-Modified']
+                add_never_cache_headers(response)
+            return response
+
+        return wrapper
+
+    return decorator
@@ -1,5 +1,18 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+
+def instrument_connection(sender, connection, **kwargs):
+    """Учет времени и числа SQL-запросов в core.metrics"""
+    from .metrics import db_wrapper
+
+    if db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(db_wrapper)
+
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'core'
\ No newline at end of file
+    name = 'core'
+
+    def ready(self):
+        connection_created.connect(instrument_connection, dispatch_uid='core.instrument_connection')
\ No newline at end of file
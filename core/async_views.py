@@ -0,0 +1,173 @@
+"""
+Асинхронные версии представлений core.views для ASGI.
+
+Каждое представление выполняется в общем ограниченном пуле потоков
+(settings.ASYNC_IO_WORKERS) с таймаутом на запрос, поэтому медленное
+хранилище занимает только потоки пула, а цикл событий продолжает
+обслуживать остальных клиентов. Подключаются в core.urls при
+settings.ASYNC_VIEWS (его включает project/asgi.py).
+
+Поток, зависший в вызове к архиву (например, на недоступном сетевом
+томе), нельзя прервать: после таймаута он остается занятым. Такие потоки
+считает StorageBreaker, и когда их набирается
+settings.ASYNC_STORAGE_STUCK_LIMIT, запросы к архиву сразу получают 503,
+а остаток пула остается представлениям, которые к архиву не обращаются.
+Ограничение: зависшие потоки освобождаются, только когда вызов все же
+вернется; чтение кусков потокового ответа (iterate_in_pool) таймаутом
+не ограничено и предохранителем не учитывается.
+"""
+import asyncio
+import contextlib
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import JsonResponse
+
+from . import views
+
+
+_io_executor = None
+_executor_lock = threading.Lock()
+
+
+def io_executor():
+    """Пул потоков для блокирующих обращений к диску и базе"""
+    global _io_executor
+    with _executor_lock:
+        if _io_executor is None:
+            _io_executor = ThreadPoolExecutor(
+                max_workers=settings.ASYNC_IO_WORKERS, thread_name_prefix='core-io'
+            )
+    return _io_executor
+
+
+class StorageBreaker:
+    """
+    Предохранитель хранилища: число вызовов, переживших таймаут и все еще
+    занимающих поток пула. Открыт, пока их не меньше limit.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.stuck = 0
+        self._lock = threading.Lock()
+
+    def is_open(self):
+        return self.stuck >= self.limit
+
+    def hold(self, future):
+        """Учитывает зависший вызов до его завершения"""
+        with self._lock:
+            self.stuck += 1
+        future.add_done_callback(self._release)
+
+    def _release(self, future):
+        with self._lock:
+            self.stuck -= 1
+
+
+_breakers = {}
+
+
+def storage_breaker():
+    """Предохранитель архива settings.DATA_ROOT"""
+    root = str(settings.DATA_ROOT)
+    with _executor_lock:
+        if root not in _breakers:
+            _breakers[root] = StorageBreaker(
+                getattr(settings, 'ASYNC_STORAGE_STUCK_LIMIT', settings.ASYNC_IO_WORKERS)
+            )
+        return _breakers[root]
+
+
+_END = object()
+
+
+async def iterate_in_pool(iterator):
+    """
+    Синхронное тело потокового ответа как асинхронный итератор: каждый
+    кусок читается в пуле. Иначе Django под ASGI собирает такое тело
+    целиком в память перед отправкой.
+    """
+    pending = None
+    try:
+        while True:
+            pending = io_executor().submit(next, iterator, _END)
+            chunk = await asyncio.wrap_future(pending)
+            if chunk is _END:
+                break
+            yield chunk
+    finally:
+        # Итератор закрывает response.close(); к этому моменту он не должен
+        # выполняться в потоке пула (клиент отключился во время чтения)
+        if pending is not None and not pending.done():
+            with contextlib.suppress(Exception):
+                await asyncio.wrap_future(pending)
+
+
+def offload(view, timeout=None, storage=True):
+    """
+    Асинхронная обертка синхронного представления.
+
+    Если ответ не готов за timeout секунд (по умолчанию
+    settings.ASYNC_VIEW_TIMEOUT), клиент получает 504. Ожидание в очереди
+    пула входит в таймаут, и не начатый вызов отменяется; уже начатый
+    доработает в своем потоке, но ответ будет отброшен. Для представлений
+    с storage=True такой вызов учитывается предохранителем архива, и при
+    открытом предохранителе клиент сразу получает 503.
+    """
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        breaker = storage_breaker() if storage else None
+        if breaker is not None and breaker.is_open():
+            return JsonResponse({'error': 'Storage is not responding, try again later'}, status=503)
+
+        def call():
+            close_old_connections()
+            try:
+                return view(request, *args, **kwargs)
+            finally:
+                close_old_connections()
+
+        # Контекст передается в поток, чтобы операции попали в счетчики запроса
+        context = contextvars.copy_context()
+        future = io_executor().submit(context.run, call)
+        try:
+            response = await asyncio.wait_for(
+                asyncio.wrap_future(future), timeout or settings.ASYNC_VIEW_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            # Не начатый вызов отменен вместе с ожиданием, начатый занимает поток
+            if breaker is not None and not future.done():
+                breaker.hold(future)
+            return JsonResponse({'error': 'Storage did not respond in time'}, status=504)
+
+        if response.streaming and not response.is_async:
+            response.streaming_content = iterate_in_pool(iter(response.streaming_content))
+        return response
+
+    return wrapper
+
+
+index = offload(views.index, storage=False)
+api_available_dates = offload(views.api_available_dates)
+api_image_for_date = offload(views.api_image_for_date)
+api_stats = offload(views.api_stats)
+api_timeline = offload(views.api_timeline)
+api_timeseries = offload(views.api_timeseries)
+api_search = offload(views.api_search)
+# Отправка проверяет исходные файлы и кэш разниц, статус - файлы результата
+api_difference_submit = offload(views.api_difference_submit)
+api_difference_status = offload(views.api_difference_status)
+download_product = offload(views.download_product)
+# Вырезка окна распаковывает и сжимает растр, как генерация тайлов
+download_product_crop = offload(views.download_product_crop, timeout=30)
+download_product_bulk = offload(views.download_product_bulk)
+# Генерация тайлов и копий превью при промахе кэша дольше обычного запроса
+preview_rendition = offload(views.preview_rendition, timeout=30)
+map_tile = offload(views.map_tile, timeout=30)
+metrics = offload(views.metrics, storage=False)
@@ -0,0 +1,489 @@
+import hashlib
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, wait
+from datetime import date, datetime
+from pathlib import Path
+
+from django.conf import settings
+
+from .metrics import track
+from .utils import split_scene_name
+
+
+PREVIEW_EXTENSIONS = ('.jpg', '.jpeg')
+PRODUCT_EXTENSIONS = ('.tiff', '.tif')
+
+# Файл-штамп версии каталога. generate_index перезаписывает его после
+# каждого изменения базы, и все процессы сбрасывают свои каталоги.
+VERSION_FILE = Path('index_files') / 'catalog.version'
+
+Scene = namedtuple('Scene', ['tile', 'datetime', 'date', 'product', 'preview_path', 'product_path'])
+
+
+def _walk(root, visit, executor=None):
+    """
+    Обход дерева директорий: visit(path) -> список поддиректорий.
+
+    С executor директории читаются параллельно: каждая директория -
+    отдельная задача, поддиректории ставятся в очередь по мере готовности.
+    На сетевых хранилищах обход упирается в задержки, а не в CPU.
+    """
+    if executor is None:
+        stack = [root]
+        while stack:
+            stack.extend(visit(stack.pop()))
+        return
+
+    pending = {executor.submit(visit, root)}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            for child in future.result():
+                pending.add(executor.submit(visit, child))
+
+
+@track('fs')
+def walk_tree(root, extensions, with_stat=False, executor=None):
+    """
+    Один проход os.scandir по дереву.
+
+    Возвращает пару словарей: файлы с подходящим расширением
+    (путь -> (size, mtime_ns, inode) или None) и директории (путь -> mtime_ns).
+    """
+    files = {}
+    dirs = {}
+
+    def visit(current):
+        children = []
+        try:
+            dirs[current] = os.stat(current).st_mtime_ns
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        children.append(entry.path)
+                        continue
+
+                    if os.path.splitext(entry.name)[1].lower() not in extensions:
+                        continue
+
+                    if with_stat:
+                        st = entry.stat()
+                        files[entry.path] = (st.st_size, st.st_mtime_ns, st.st_ino)
+                    else:
+                        files[entry.path] = None
+        except (FileNotFoundError, NotADirectoryError):
+            dirs.pop(current, None)
+        return children
+
+    _walk(str(root), visit, executor)
+    return files, dirs
+
+
+@track('fs')
+def walk_tree_changes(root, extensions, previous=None, executor=None, verify=False):
+    """
+    Инкрементальный обход дерева по результатам прошлого запуска.
+
+    Файлы сгруппированы по директориям: files - директория -> {имя: (size,
+    mtime_ns, inode)}, dirs - директория -> mtime_ns. Директории с прежним
+    mtime не читаются и файлы в них не проверяются stat: их записи и
+    поддиректории берутся из previous ({'files': ..., 'dirs': ...}), так что
+    обход стоит stat на директорию плюс чтение изменившихся директорий.
+
+    Находятся добавленные, удаленные и переименованные файлы, а также
+    замена через временный файл и rename: все это меняет mtime директории.
+    Перезапись файла на месте (запись в открытый файл, touch) mtime
+    директории не меняет и находится только с verify=True, при котором
+    каждый известный файл неизменившихся директорий проверяется stat.
+
+    Возвращает (files, dirs, changed), где changed - пути добавленных,
+    измененных и удаленных файлов; без previous обход полный и changed
+    равен None.
+    """
+    root = str(root)
+    prev_files = previous['files'] if previous else {}
+    prev_dirs = previous['dirs'] if previous else {}
+
+    subdirs = {}
+    for path in prev_dirs:
+        if path != root:
+            subdirs.setdefault(os.path.dirname(path), []).append(path)
+
+    files = {}
+    dirs = {}
+    changed = set()
+
+    def visit(current):
+        try:
+            mtime = os.stat(current).st_mtime_ns
+        except (FileNotFoundError, NotADirectoryError):
+            return []
+
+        known = prev_files.get(current, {})
+        dirs[current] = mtime
+        if prev_dirs.get(current) == mtime:
+            # Список директории не менялся
+            if not verify:
+                files[current] = known
+                return subdirs.get(current, [])
+
+            current_files = {}
+            for name, previous_st in known.items():
+                path = os.path.join(current, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    changed.add(path)
+                    continue
+                current_files[name] = (st.st_size, st.st_mtime_ns, st.st_ino)
+                if tuple(previous_st) != current_files[name]:
+                    changed.add(path)
+            files[current] = current_files
+            return subdirs.get(current, [])
+
+        children = []
+        current_files = {}
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        children.append(entry.path)
+                        continue
+
+                    if os.path.splitext(entry.name)[1].lower() not in extensions:
+                        continue
+
+                    st = entry.stat()
+                    current_files[entry.name] = (st.st_size, st.st_mtime_ns, st.st_ino)
+                    previous_st = known.get(entry.name)
+                    if previous_st is None or tuple(previous_st) != current_files[entry.name]:
+                        changed.add(entry.path)
+        except (FileNotFoundError, NotADirectoryError):
+            dirs.pop(current, None)
+            return []
+
+        changed.update(os.path.join(current, name) for name in known if name not in current_files)
+        files[current] = current_files
+        return children
+
+    _walk(root, visit, executor)
+
+    if not previous:
+        return files, dirs, None
+
+    # Файлы исчезнувших директорий
+    for path, names in prev_files.items():
+        if path not in dirs:
+            changed.update(os.path.join(path, name) for name in names)
+    return files, dirs, changed
+
+
+def tree_paths(files, directories=None):
+    """Полные пути файлов из результата walk_tree_changes (по умолчанию всех директорий)"""
+    if directories is None:
+        directories = files
+    return [
+        os.path.join(directory, name)
+        for directory in directories
+        for name in files.get(directory, ())
+    ]
+
+
+def scene_key(path):
+    """(tile, date) сцены по имени файла или None"""
+    parsed = split_scene_name(os.path.basename(path))
+    if not parsed:
+        return None
+
+    try:
+        return parsed[0], datetime.strptime(parsed[1][:8], '%Y%m%d').date()
+    except ValueError:
+        return None
+
+
+def _product_rank(path):
+    """Порядок предпочтения файлов продукта: сначала без _10m, сначала .tiff"""
+    name = os.path.basename(path)
+    stem, ext = os.path.splitext(name)
+    return len(stem.split('_')), ext.lower() != '.tiff', path
+
+
+def index_products(product_paths):
+    """
+    Строит словари для сопоставления превью с продуктами.
+
+    exact: (tile, datetime, product) -> путь
+    loose: (tile, YYYYMMDD, product) -> путь (снимок того же дня с другим временем)
+    """
+    exact = {}
+    loose = {}
+
+    for path in sorted(product_paths, key=_product_rank):
+        parsed = split_scene_name(os.path.basename(path))
+        if not parsed:
+            continue
+
+        tile, date_time_str, product = parsed
+        product = product.upper()
+        exact.setdefault((tile, date_time_str, product), path)
+        loose.setdefault((tile, date_time_str[:8], product), path)
+
+    return exact, loose
+
+
+def pair_scenes(product_type, preview_paths, product_paths, relative_to=None):
+    """
+    Сопоставляет превью с файлами продуктов за O(N) через словари.
+
+    Возвращает (scenes, skipped): список Scene и список (путь, причина)
+    для превью, которые не удалось разобрать.
+    """
+    exact, loose = index_products(product_paths)
+    product_type = product_type.upper()
+
+    scenes = []
+    skipped = []
+
+    for preview in sorted(set(preview_paths)):
+        filename = os.path.basename(preview)
+        parsed = split_scene_name(filename)
+        if not parsed:
+            skipped.append((preview, 'Неверный формат имени файла'))
+            continue
+
+        tile, date_time_str, file_product_type = parsed
+        if file_product_type.upper() != product_type:
+            skipped.append((preview, f'Тип продукта не совпадает: {file_product_type} != {product_type}'))
+            continue
+
+        try:
+            date_obj = datetime.strptime(date_time_str[:8], '%Y%m%d').date()
+        except ValueError:
+            skipped.append((preview, f'Неверный формат даты: {date_time_str[:8]}'))
+            continue
+
+        product = exact.get((tile, date_time_str, product_type)) \
+            or loose.get((tile, date_time_str[:8], product_type))
+
+        if relative_to is not None:
+            preview = _relative(preview, relative_to)
+            product = _relative(product, relative_to) if product else None
+
+        scenes.append(Scene(tile, date_time_str, date_obj, product_type, preview, product))
+
+    return scenes, skipped
+
+
+def _relative(path, root):
+    try:
+        return str(Path(path).relative_to(root))
+    except ValueError:
+        return str(path)
+
+
+@track('fs')
+def read_catalog_version(data_root=None):
+    """Текущий штамп версии каталога ('' если индекс еще не строился)"""
+    version_file = Path(data_root or settings.DATA_ROOT) / VERSION_FILE
+    try:
+        return version_file.read_text(encoding='utf-8').strip()
+    except OSError:
+        return ''
+
+
+def bump_catalog_version(data_root=None):
+    """Записывает новый штамп версии каталога (атомарно через rename)"""
+    version_file = Path(data_root or settings.DATA_ROOT) / VERSION_FILE
+    version_file.parent.mkdir(parents=True, exist_ok=True)
+
+    version = str(time.time_ns())
+    tmp_file = version_file.with_name(f'{version_file.name}.{os.getpid()}.tmp')
+    tmp_file.write_text(version, encoding='utf-8')
+    os.replace(tmp_file, version_file)
+    return version
+
+
+class Catalog:
+    """
+    Каталог снимков в памяти процесса: (tile, datetime, product) -> пути.
+
+    Строится одним проходом по дереву Sentinel-2 и перестраивается только
+    при смене штампа версии или mtime одной из просмотренных директорий.
+    """
+
+    def __init__(self, data_root):
+        self.data_root = Path(data_root)
+        self.version = None
+        self.dir_mtimes = {}
+        self.scenes = {}
+        self.dates = {}
+        self.ascending_dates = {}
+        self.tile_dates = {}
+        self.by_date = {}
+        self.generation = ''
+        self.modified_ns = 0
+        self.checked_at = 0.0
+
+    @track('fs')
+    def build(self):
+        base_path = self.data_root / 'Sentinel-2'
+        preview_root = base_path / 'preview'
+
+        version = read_catalog_version(self.data_root)
+        dir_mtimes = {}
+        scenes = {}
+
+        try:
+            dir_mtimes[str(preview_root)] = os.stat(preview_root).st_mtime_ns
+            product_types = sorted(entry.name for entry in os.scandir(preview_root) if entry.is_dir())
+        except FileNotFoundError:
+            dir_mtimes[str(preview_root)] = None
+            product_types = []
+
+        for product_type in product_types:
+            preview_files, preview_dirs = walk_tree(preview_root / product_type, PREVIEW_EXTENSIONS)
+            product_files, product_dirs = walk_tree(base_path / product_type, PRODUCT_EXTENSIONS)
+            dir_mtimes.update(preview_dirs)
+            dir_mtimes.update(product_dirs)
+            # Директория продукта может появиться позже превью
+            dir_mtimes.setdefault(str(base_path / product_type), None)
+
+            scenes[product_type], _ = pair_scenes(
+                product_type, preview_files, product_files, relative_to=self.data_root
+            )
+
+        by_date = {}
+        for product_type, product_scenes in scenes.items():
+            grouped = by_date.setdefault(product_type, {})
+            for scene in product_scenes:
+                grouped.setdefault(scene.date.isoformat(), []).append(scene)
+
+        self.version = version
+        self.dir_mtimes = dir_mtimes
+        # Поколение каталога: меняется и без переиндексации, когда файл
+        # добавлен или удален (меняется mtime директории)
+        state = repr((version, sorted(dir_mtimes.items())))
+        self.generation = hashlib.sha1(state.encode('utf-8')).hexdigest()[:16]
+        self.modified_ns = max(
+            [int(version) if version.isdigit() else 0]
+            + [mtime for mtime in dir_mtimes.values() if mtime is not None]
+        )
+        self.scenes = scenes
+        self.by_date = by_date
+        # Даты по возрастанию для бинарного поиска ближайшей даты:
+        # по продукту целиком и по каждому тайлу
+        self.ascending_dates = {product_type: sorted(grouped) for product_type, grouped in by_date.items()}
+        self.dates = {
+            product_type: dates[::-1]
+            for product_type, dates in self.ascending_dates.items()
+        }
+        tile_dates = {}
+        for product_type, product_scenes in scenes.items():
+            per_tile = tile_dates.setdefault(product_type, {})
+            for scene in product_scenes:
+                per_tile.setdefault(scene.tile, set()).add(scene.date.isoformat())
+        self.tile_dates = {
+            product_type: {tile: sorted(dates) for tile, dates in per_tile.items()}
+            for product_type, per_tile in tile_dates.items()
+        }
+        self.checked_at = time.monotonic()
+
+    @track('fs')
+    def is_stale(self):
+        """Проверка актуальности: один read штампа и stat по каждой директории"""
+        if self.version is None:
+            return True
+
+        if read_catalog_version(self.data_root) != self.version:
+            return True
+
+        for path, mtime in self.dir_mtimes.items():
+            try:
+                current = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                current = None
+            if current != mtime:
+                return True
+
+        return False
+
+    def available_dates(self, product_type):
+        """Даты по убыванию (новые сначала)"""
+        return self.dates.get(product_type, [])
+
+    def scenes_for_date(self, product_type, date_iso):
+        return self.by_date.get(product_type, {}).get(date_iso, [])
+
+    def scenes_near_date(self, product_type, date_iso, tile=None, direction='before'):
+        """
+        Сцены ближайшей к date_iso даты в направлении direction, как
+        find_images_by_date: бинарный поиск по датам продукта (или тайла),
+        для 'closest' при равном удалении берется более ранняя дата.
+        """
+        if tile:
+            dates = self.tile_dates.get(product_type, {}).get(tile, [])
+        else:
+            dates = self.ascending_dates.get(product_type, [])
+
+        position = bisect_right(dates, date_iso)
+        before = dates[position - 1] if position else None
+        position = bisect_left(dates, date_iso)
+        after = dates[position] if position < len(dates) else None
+
+        if direction == 'before':
+            found = before
+        elif direction == 'after':
+            found = after
+        else:
+            target = date.fromisoformat(date_iso)
+            found = min(
+                (candidate for candidate in (before, after) if candidate),
+                key=lambda candidate: (abs((date.fromisoformat(candidate) - target).days), candidate),
+                default=None
+            )
+
+        if found is None:
+            return []
+        return sorted(
+            (scene for scene in self.scenes_for_date(product_type, found) if not tile or scene.tile == tile),
+            key=lambda scene: scene.tile
+        )
+
+
+_catalogs = {}
+_lock = threading.Lock()
+
+
+def get_catalog(data_root=None):
+    """
+    Каталог текущего процесса.
+
+    Проверка актуальности выполняется не чаще CATALOG_CHECK_INTERVAL секунд,
+    между проверками запросы обслуживаются без обращения к диску.
+    """
+    data_root = str(data_root or settings.DATA_ROOT)
+    interval = getattr(settings, 'CATALOG_CHECK_INTERVAL', 5)
+
+    catalog = _catalogs.get(data_root)
+    if catalog is not None and time.monotonic() - catalog.checked_at < interval:
+        return catalog
+
+    with _lock:
+        catalog = _catalogs.get(data_root)
+        if catalog is not None and time.monotonic() - catalog.checked_at < interval:
+            return catalog
+
+        if catalog is None or catalog.is_stale():
+            # Новый каталог подменяет старый целиком, чтобы параллельные
+            # запросы не видели наполовину перестроенные словари
+            catalog = Catalog(data_root)
+            catalog.build()
+            _catalogs[data_root] = catalog
+        else:
+            catalog.checked_at = time.monotonic()
+
+    return catalog
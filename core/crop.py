@@ -0,0 +1,128 @@
+"""
+Вырезка окна из TIFF продукта для скачивания (/download-product/crop/).
+
+Окно читается TiffReader.read_window блоками строк, поэтому распаковываются
+только полосы/плитки, которые его пересекают (несжатые файлы - через mmap),
+и пишется в новый GeoTIFF со сдвинутой геопривязкой.
+"""
+import math
+import tempfile
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils.http import http_date
+
+from .downloads import not_modified
+from .metrics import track
+from .tiff import TiffReader, TiffWriter
+
+# Сколько пикселей окна читается и сжимается за один шаг
+CROP_BLOCK_PIXELS = 4 * 1024 * 1024
+
+# Результат до этого размера собирается в памяти, больше - во временном файле
+CROP_SPOOL_BYTES = 16 * 1024 * 1024
+
+
+class WindowTooLarge(ValueError):
+    """Окно больше settings.CROP_MAX_PIXELS"""
+
+
+def parse_window(value):
+    """'x,y,ширина,высота' в пикселях -> кортеж; некорректное окно - ValueError"""
+    try:
+        x, y, width, height = (int(part) for part in value.split(','))
+    except (AttributeError, ValueError):
+        raise ValueError('window must be x,y,width,height in pixels')
+
+    if x < 0 or y < 0 or width <= 0 or height <= 0:
+        raise ValueError('window must have non-negative offset and positive size')
+    return x, y, width, height
+
+
+def bbox_window(reader, value):
+    """
+    Окно пикселей, покрывающее bbox 'xmin,ymin,xmax,ymax' в системе координат
+    файла (для Sentinel-2 - метры UTM), обрезанное по растру.
+    """
+    try:
+        xmin, ymin, xmax, ymax = (float(part) for part in value.split(','))
+    except (AttributeError, ValueError):
+        raise ValueError('bbox must be xmin,ymin,xmax,ymax')
+    if not (xmin < xmax and ymin < ymax):
+        raise ValueError('bbox must have xmin < xmax and ymin < ymax')
+
+    transform = reader.geo_transform()
+    if transform is None:
+        raise ValueError('File has no georeferencing, use window=')
+    x0, scale_x, y0, scale_y = transform
+
+    left = max(0, math.floor((xmin - x0) / scale_x))
+    right = min(reader.width, math.ceil((xmax - x0) / scale_x))
+    top = max(0, math.floor((y0 - ymax) / scale_y))
+    bottom = min(reader.height, math.ceil((y0 - ymin) / scale_y))
+
+    if left >= right or top >= bottom:
+        raise ValueError('bbox does not intersect the raster')
+    return left, top, right - left, bottom - top
+
+
+def check_window(reader, window):
+    """Окно внутри растра и не больше settings.CROP_MAX_PIXELS"""
+    x, y, width, height = window
+    if x + width > reader.width or y + height > reader.height:
+        raise ValueError(f'window is outside the raster ({reader.width}x{reader.height})')
+
+    max_pixels = getattr(settings, 'CROP_MAX_PIXELS', 25_000_000)
+    if width * height > max_pixels:
+        raise WindowTooLarge(f'window is larger than {max_pixels} pixels')
+
+
+@track('render')
+def write_crop(reader, window, target):
+    """Пишет окно из reader в target (путь или файл с seek/tell) как GeoTIFF"""
+    x, y, width, height = window
+    chunk = reader.chunk_height
+    # Блоки выравниваются по полосам исходника, чтобы не распаковывать их дважды
+    rows = max(chunk, CROP_BLOCK_PIXELS // width // chunk * chunk)
+
+    with TiffWriter(target, width, height, reader.dtype, samples=reader.samples, compression='deflate',
+                    extra_tags=reader.window_geo_tags(x, y), nodata=reader.nodata) as writer:
+        top = y
+        while top < y + height:
+            # Первый блок заканчивается на границе полосы
+            bottom = min(y + height, (top // chunk) * chunk + rows)
+            writer.write_rows(reader.read_window(x, top, width, bottom - top))
+            top = bottom
+
+
+def crop_response(request, full_path, window=None, bbox=None):
+    """
+    GeoTIFF окна продукта (window - 'x,y,w,h' в пикселях, bbox - в координатах
+    файла). ETag зависит от файла и окна, поэтому повторный запрос того же
+    окна получает 304. Некорректное окно - ValueError / WindowTooLarge.
+    """
+    st = full_path.stat()
+
+    with TiffReader(full_path) as reader:
+        x, y, width, height = parse_window(window) if window else bbox_window(reader, bbox)
+        check_window(reader, (x, y, width, height))
+
+        etag = f'"{st.st_size:x}-{st.st_mtime_ns:x}-{x}-{y}-{width}-{height}"'
+        if not_modified(request, etag, st.st_mtime):
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+
+        output = tempfile.SpooledTemporaryFile(max_size=CROP_SPOOL_BYTES)
+        try:
+            write_crop(reader, (x, y, width, height), output)
+        except Exception:
+            output.close()
+            raise
+
+    output.seek(0)
+    filename = f'{full_path.stem}_{x}_{y}_{width}x{height}.tif'
+    response = FileResponse(output, as_attachment=True, filename=filename, content_type='image/tiff')
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(st.st_mtime)
+    return response
@@ -0,0 +1,242 @@
+import json
+import os
+
+import numpy as np
+from django.conf import settings
+from PIL import Image
+
+from .diskcache import BoundedDiskCache
+from .tiff import TiffReader, TiffWriter
+
+
+# Меняется при любом изменении алгоритма, чтобы старые результаты не переиспользовались
+ALGORITHM_VERSION = 1
+
+# Сколько пикселей читается из каждого снимка за один блок строк.
+# Пиковая память ~ BLOCK_PIXELS * (байт на пиксель исходника * 2 + 4 * 3)
+BLOCK_PIXELS = 4 * 1024 * 1024
+
+PREVIEW_SIZE = 1024
+
+# Цвета превью: уменьшение -> без изменений -> увеличение
+COLOR_STOPS = {
+    'NDVI': ((165, 0, 38), (247, 247, 247), (0, 104, 55)),
+    'NDWI': ((140, 81, 10), (247, 247, 247), (1, 102, 94)),
+}
+# Для TCI - величина изменения цвета: нет изменений -> сильные
+MAGNITUDE_STOPS = ((0, 0, 0), (253, 174, 97), (215, 25, 28))
+NODATA_COLOR = (128, 128, 128)
+
+
+def valid_mask(block, nodata):
+    """Пиксели блока (rows, cols, samples) без nodata и NaN во всех каналах"""
+    mask = np.ones(block.shape[:2], dtype=bool)
+    if nodata is not None and not np.isnan(nodata):
+        mask &= ~np.any(block == nodata, axis=2)
+    if block.dtype.kind == 'f':
+        mask &= ~np.any(np.isnan(block), axis=2)
+    return mask
+
+
+def difference_block(block1, block2, product_type, nodata1=None, nodata2=None):
+    """
+    Попиксельная разница двух блоков (rows, cols, samples) -> float32 (rows, cols).
+
+    NDVI/NDWI: значение второго снимка минус первого.
+    TCI: модуль изменения цвета (евклидово расстояние по каналам / sqrt(каналов)).
+    Пиксели без данных в любом из снимков получают NaN.
+    """
+    valid = valid_mask(block1, nodata1) & valid_mask(block2, nodata2)
+
+    first = block1.astype(np.float32)
+    second = block2.astype(np.float32)
+
+    if product_type == 'TCI':
+        bands = min(3, first.shape[2])
+        delta = second[:, :, :bands] - first[:, :, :bands]
+        result = np.sqrt(np.einsum('ijk,ijk->ij', delta, delta) / bands)
+    else:
+        result = second[:, :, 0] - first[:, :, 0]
+
+    result[~valid] = np.nan
+    return result
+
+
+def _value_limit(dtype, product_type):
+    """Значение разницы, которое в превью показывается максимально ярким цветом"""
+    if dtype.kind == 'f':
+        return 1.0
+    info = np.iinfo(dtype)
+    if product_type == 'TCI':
+        return float(info.max)
+    return (float(info.max) - float(info.min)) / 2
+
+
+def colorize(values, product_type, limit):
+    """Окраска разницы в RGB uint8 (NaN - серый)"""
+    if product_type == 'TCI':
+        stops = MAGNITUDE_STOPS
+        position = np.clip(values / limit, 0, 1)
+    else:
+        stops = COLOR_STOPS.get(product_type, COLOR_STOPS['NDVI'])
+        position = np.clip(values / limit, -1, 1) / 2 + 0.5
+
+    nan = np.isnan(position)
+    position = np.where(nan, 0, position)
+
+    rgb = np.empty(values.shape + (3,), dtype=np.uint8)
+    anchors = np.linspace(0, 1, len(stops))
+    for channel in range(3):
+        rgb[:, :, channel] = np.interp(position, anchors, [stop[channel] for stop in stops]).astype(np.uint8)
+
+    rgb[nan] = NODATA_COLOR
+    return rgb
+
+
+def compute_difference(path1, path2, out_tiff, out_preview, product_type,
+                       block_pixels=BLOCK_PIXELS, preview_size=PREVIEW_SIZE):
+    """
+    Разница двух продуктов одной сцены (второй минус первый).
+
+    Оба TIFF читаются блоками строк во всю ширину, разница пишется в
+    float32 GeoTIFF (Deflate, геопривязка первого снимка) полосами по мере
+    расчета. Превью JPG набирается прореживанием тех же блоков, поэтому
+    пиковая память зависит от block_pixels и preview_size, но не от сцены.
+    Результаты пишутся во временные файлы и переименовываются в конце.
+    """
+    tmp_tiff = f'{out_tiff}.{os.getpid()}.tmp'
+    tmp_preview = f'{out_preview}.{os.getpid()}.tmp'
+
+    try:
+        with TiffReader(path1) as first, TiffReader(path2) as second:
+            if (first.width, first.height) != (second.width, second.height):
+                raise ValueError(
+                    f'Размеры снимков не совпадают: {first.width}x{first.height} '
+                    f'и {second.width}x{second.height}'
+                )
+
+            width, height = first.width, first.height
+            step = max(1, -(-max(width, height) // preview_size))
+            preview = np.full((-(-height // step), -(-width // step)), np.nan, dtype=np.float32)
+
+            rows = max(first.block_rows(block_pixels), step)
+            rows -= rows % step
+
+            stats = {'valid_pixels': 0, 'sum': 0.0, 'min': None, 'max': None}
+
+            with TiffWriter(tmp_tiff, width, height, np.float32, compression='deflate',
+                            extra_tags=first.geo_tags(), nodata=float('nan')) as writer:
+                for y, block1 in first.iter_row_blocks(rows):
+                    block2 = second.read_window(0, y, width, block1.shape[0])
+                    diff = difference_block(block1, block2, product_type, first.nodata, second.nodata)
+                    writer.write_rows(diff)
+
+                    preview[y // step:(y + diff.shape[0] + step - 1) // step] = diff[::step, ::step]
+
+                    valid = diff[~np.isnan(diff)]
+                    if valid.size:
+                        stats['valid_pixels'] += int(valid.size)
+                        stats['sum'] += float(valid.sum(dtype=np.float64))
+                        low, high = float(valid.min()), float(valid.max())
+                        stats['min'] = low if stats['min'] is None else min(stats['min'], low)
+                        stats['max'] = high if stats['max'] is None else max(stats['max'], high)
+
+            limit = _value_limit(first.dtype, product_type)
+
+        Image.fromarray(colorize(preview, product_type, limit)).save(tmp_preview, format='JPEG', quality=90)
+
+        os.replace(tmp_tiff, out_tiff)
+        os.replace(tmp_preview, out_preview)
+    finally:
+        for path in (tmp_tiff, tmp_preview):
+            if os.path.exists(path):
+                os.remove(path)
+
+    total = width * height
+    return {
+        'width': width,
+        'height': height,
+        'valid_fraction': stats['valid_pixels'] / total if total else 0.0,
+        'mean': stats['sum'] / stats['valid_pixels'] if stats['valid_pixels'] else None,
+        'min': stats['min'],
+        'max': stats['max'],
+    }
+
+
+_difference_cache = None
+
+
+def difference_cache():
+    """Кэш результатов разницы (размер ограничен settings.DIFF_CACHE_MAX_BYTES)"""
+    global _difference_cache
+    if _difference_cache is None:
+        _difference_cache = BoundedDiskCache(settings.DIFF_CACHE_DIR, settings.DIFF_CACHE_MAX_BYTES)
+    return _difference_cache
+
+
+def difference_key(path1, path2, product_type):
+    """
+    Ключ результата: пути, размеры и mtime обоих исходников, тип продукта
+    и версия алгоритма. Перезаписанный снимок или новый алгоритм дают
+    другой ключ, старые записи уходят по LRU.
+    """
+    parts = []
+    for path in (path1, path2):
+        st = os.stat(path)
+        parts.append(f'{os.path.realpath(path)}:{st.st_size}:{st.st_mtime_ns}')
+    return '|'.join(parts + [product_type, f'v{ALGORITHM_VERSION}', str(PREVIEW_SIZE)])
+
+
+def lookup_difference(path1, path2, product_type):
+    """
+    Готовый результат из кэша без расчета: (путь к TIFF, путь к превью,
+    статистика) или None.
+
+    Запись состоит из трех файлов с одним ключом (.tiff, .jpg, .json);
+    .json со статистикой кладется последним, и попаданием считается
+    только наличие всех трех.
+    """
+    cache = difference_cache()
+    key = difference_key(path1, path2, product_type)
+
+    paths = [cache.get(key, suffix, count=False) for suffix in ('.tiff', '.jpg', '.json')]
+    if None in paths:
+        return None
+
+    try:
+        with open(paths[2], encoding='utf-8') as f:
+            stats = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    cache.record_lookup(True)
+    # Расчеты редкие, поэтому счетчики сразу сбрасываются в stats.json
+    cache.flush_stats()
+    return paths[0], paths[1], stats
+
+
+def cached_difference(path1, path2, product_type):
+    """
+    Разница двух продуктов через кэш: (путь к TIFF, путь к превью, статистика, попадание).
+    """
+    found = lookup_difference(path1, path2, product_type)
+    if found is not None:
+        return found + (True,)
+
+    cache = difference_cache()
+    key = difference_key(path1, path2, product_type)
+    cache.record_lookup(False)
+
+    tmp_tiff = cache.temp_path('.tiff')
+    tmp_preview = cache.temp_path('.jpg')
+    try:
+        stats = compute_difference(path1, path2, str(tmp_tiff), str(tmp_preview), product_type)
+        tiff_path = cache.put_file(key, tmp_tiff, '.tiff')
+        preview_path = cache.put_file(key, tmp_preview, '.jpg')
+        cache.put(key, json.dumps(stats).encode('utf-8'), '.json')
+    finally:
+        for path in (tmp_tiff, tmp_preview):
+            if path.exists():
+                path.unlink()
+
+    return tiff_path, preview_path, stats, False
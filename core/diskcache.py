@@ -0,0 +1,208 @@
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import uuid
+from pathlib import Path
+
+from .metrics import track
+
+
+class BoundedDiskCache:
+    """
+    Файловый кэш с ограничением суммарного размера и вытеснением LRU.
+
+    Время последнего обращения хранится в mtime файла (os.utime при попадании),
+    поэтому кэш общий для всех процессов на машине. Счетчики попаданий,
+    промахов и вытеснений копятся в памяти и сбрасываются в stats.json
+    при каждой записи.
+    """
+
+    STATS_FILE = 'stats.json'
+    # Сколько попаданий копить в памяти, прежде чем сбросить их в stats.json
+    FLUSH_EVERY = 100
+    COUNTERS = ('hits', 'misses', 'stores', 'evictions', 'evicted_bytes')
+
+    def __init__(self, root, max_bytes, low_water=0.9):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        self._pending = dict.fromkeys(self.COUNTERS, 0)
+        self._size = None
+        self._lock = threading.Lock()
+
+    def path_for(self, key, suffix=''):
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return self.root / digest[:2] / f'{digest}{suffix}'
+
+    @track('fs')
+    def get(self, key, suffix='', count=True):
+        """
+        Путь к записи или None; попадание обновляет время обращения.
+
+        count=False - не учитывать обращение в счетчиках (для вспомогательных
+        файлов записи, состоящей из нескольких файлов).
+        """
+        path = self.path_for(key, suffix)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            if count:
+                self._count('misses')
+            return None
+
+        if not count:
+            return path
+
+        self._count('hits')
+        if self._pending['hits'] >= self.FLUSH_EVERY:
+            self.flush_stats()
+        return path
+
+    def open_entry(self, key, suffix=''):
+        """
+        Запись, открытая на чтение, или None.
+
+        Открытый файл остается читаемым, даже если другой процесс вытеснит
+        запись сразу после get; путь из get такой гарантии не дает.
+        """
+        path = self.get(key, suffix)
+        if path is None:
+            return None
+        try:
+            return open(path, 'rb')
+        except FileNotFoundError:
+            return None
+
+    def record_lookup(self, hit):
+        """Учитывает обращение к записи, проверенной через get(count=False)"""
+        self._count('hits' if hit else 'misses')
+
+    def temp_path(self, suffix=''):
+        """Временный файл на той же файловой системе, что и кэш (для put_file)"""
+        tmp_dir = self.root / 'tmp'
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        return tmp_dir / f'{uuid.uuid4().hex}{suffix}'
+
+    @track('fs')
+    def put(self, key, data, suffix=''):
+        tmp_path = self.temp_path(suffix)
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        return self.put_file(key, tmp_path, suffix)
+
+    @track('fs')
+    def put_file(self, key, src_path, suffix=''):
+        """Переносит готовый файл (обычно из temp_path) в кэш атомарным rename"""
+        path = self.path_for(key, suffix)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        size = os.stat(src_path).st_size
+        # При перезаписи ключа прежний файл уходит из кэша, его размер вычитается
+        try:
+            size -= os.stat(path).st_size
+        except FileNotFoundError:
+            pass
+        os.replace(src_path, path)
+
+        self._count('stores')
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan()[1]
+            else:
+                self._size += size
+            over_budget = self._size > self.max_bytes
+
+        if over_budget:
+            self.evict()
+        self.flush_stats()
+        return path
+
+    def _scan(self):
+        """Все записи кэша: ([(время обращения, size, path)], общий размер)"""
+        entries = []
+        total = 0
+        try:
+            buckets = [entry for entry in os.scandir(self.root) if entry.is_dir() and entry.name != 'tmp']
+        except FileNotFoundError:
+            return entries, total
+
+        for bucket in buckets:
+            with os.scandir(bucket.path) as files:
+                for entry in files:
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((st.st_mtime_ns, st.st_size, entry.path))
+                    total += st.st_size
+
+        return entries, total
+
+    def evict(self):
+        """Удаляет самые давно использованные записи до low_water * max_bytes"""
+        with self._lock:
+            entries, total = self._scan()
+            target = self.max_bytes * self.low_water
+
+            for _, size, path in sorted(entries):
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                total -= size
+                self._pending['evictions'] += 1
+                self._pending['evicted_bytes'] += size
+
+            self._size = total
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self._pending[name] += value
+
+    def flush_stats(self):
+        """Добавляет накопленные счетчики процесса в общий stats.json"""
+        with self._lock:
+            pending = self._pending
+            self._pending = dict.fromkeys(self.COUNTERS, 0)
+
+        if not any(pending.values()):
+            return
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        stats_path = self.root / self.STATS_FILE
+        with open(self.root / f'{self.STATS_FILE}.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            stats = self._read_stats()
+            for name, value in pending.items():
+                stats[name] = stats.get(name, 0) + value
+
+            tmp_path = stats_path.with_name(f'{stats_path.name}.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(stats, f)
+            os.replace(tmp_path, stats_path)
+
+    def _read_stats(self):
+        try:
+            with open(self.root / self.STATS_FILE, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def stats(self):
+        """Счетчики всех процессов плюс текущий размер и число записей"""
+        stats = dict.fromkeys(self.COUNTERS, 0)
+        stats.update(self._read_stats())
+        with self._lock:
+            for name, value in self._pending.items():
+                stats[name] += value
+
+        entries, total = self._scan()
+        stats.update({
+            'entries': len(entries),
+            'size_bytes': total,
+            'max_bytes': self.max_bytes,
+        })
+        return stats
@@ -0,0 +1,228 @@
+import logging
+import mimetypes
+import re
+import zipfile
+from pathlib import Path
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import content_disposition_header, http_date, parse_etags, parse_http_date_safe
+
+from .metrics import timed, track
+
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+@track('fs')
+def resolve_data_path(relative_path, data_root=None):
+    """
+    Абсолютный путь к файлу внутри DATA_ROOT (или data_root).
+
+    Возвращает None для путей, которые после разрешения '..' и симлинков
+    выходят за пределы корня.
+    """
+    root = Path(data_root or settings.DATA_ROOT).resolve()
+    full_path = (root / relative_path).resolve()
+
+    if not full_path.is_relative_to(root):
+        return None
+    return full_path
+
+
+def data_file(relative_path):
+    """Существующий файл внутри DATA_ROOT или None (в том числе для NOT_FOUND)"""
+    if not relative_path or relative_path == 'NOT_FOUND':
+        return None
+
+    with timed('fs'):
+        full_path = resolve_data_path(relative_path)
+        if full_path is None or not full_path.is_file():
+            return None
+    return full_path
+
+
+def file_etag(st):
+    """ETag из размера и mtime_ns файла (меняется при любой перезаписи)"""
+    return f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+
+def not_modified(request, etag, mtime):
+    """Проверка If-None-Match / If-Modified-Since"""
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        return '*' in etags or etag in etags
+
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return if_modified_since is not None and int(mtime) <= if_modified_since
+
+
+def _parse_range(request, size, etag, mtime):
+    """
+    Разбор заголовка Range.
+
+    Возвращает (start, end) включительно, None если нужно отдать файл
+    целиком, или 'invalid' для неудовлетворимого диапазона.
+    Поддерживается один диапазон; составные отдаются целиком.
+    """
+    header = request.META.get('HTTP_RANGE', '').strip()
+    match = RANGE_RE.match(header)
+    if not match:
+        return None
+
+    if_range = request.META.get('HTTP_IF_RANGE', '').strip()
+    if if_range:
+        if if_range.startswith('"') or if_range.startswith('W/'):
+            if if_range != etag:
+                return None
+        elif parse_http_date_safe(if_range) != int(mtime):
+            return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+
+    if not first:
+        # bytes=-N: последние N байт; у пустого файла их нет
+        length = int(last)
+        if length == 0 or size == 0:
+            return 'invalid'
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return 'invalid'
+    return start, end
+
+
+def _iter_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def file_response(request, full_path, filename=None):
+    """
+    Отдача файла с поддержкой Range (206), ETag/Last-Modified (304)
+    и передачей файла фронт-прокси через X-Accel-Redirect / X-Sendfile.
+    """
+    st = full_path.stat()
+    etag = file_etag(st)
+    filename = filename or full_path.name
+
+    if not_modified(request, etag, st.st_mtime):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(st.st_mtime)
+        return response
+
+    content_type = mimetypes.guess_type(full_path.name)[0] or 'application/octet-stream'
+    accel_mode = getattr(settings, 'DOWNLOAD_ACCEL_MODE', None)
+
+    if accel_mode:
+        # Байты отдает nginx/apache (sendfile, Range на стороне прокси)
+        response = HttpResponse(content_type=content_type)
+        if accel_mode == 'nginx':
+            relative = full_path.relative_to(Path(settings.DATA_ROOT).resolve())
+            prefix = getattr(settings, 'DOWNLOAD_ACCEL_PREFIX', '/protected-data/')
+            response['X-Accel-Redirect'] = quote(f"{prefix.rstrip('/')}/{relative.as_posix()}")
+        else:
+            response['X-Sendfile'] = str(full_path)
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+    else:
+        byte_range = _parse_range(request, st.st_size, etag, st.st_mtime)
+
+        if byte_range == 'invalid':
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{st.st_size}'
+            return response
+
+        if byte_range is None:
+            # FileResponse использует wsgi.file_wrapper (sendfile), если сервер его дает
+            response = FileResponse(open(full_path, 'rb'), as_attachment=True, filename=filename)
+        else:
+            start, end = byte_range
+            length = end - start + 1
+            response = StreamingHttpResponse(
+                _iter_range(full_path, start, length), status=206, content_type=content_type
+            )
+            response['Content-Length'] = str(length)
+            response['Content-Range'] = f'bytes {start}-{end}/{st.st_size}'
+            response['Content-Disposition'] = content_disposition_header(True, filename)
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(st.st_mtime)
+    return response
+
+
+class _ZipStream:
+    """
+    Несдвигаемый приемник для zipfile: накопленные байты забираются
+    через drain(). Без seek/tell zipfile пишет размеры записей в data
+    descriptor после данных, поэтому архив строится за один проход.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_zip(files):
+    """
+    ZIP-архив из files [(имя в архиве, путь)] кусками по ~CHUNK_SIZE.
+
+    Файлы пишутся без сжатия (ZIP_STORED: TIFF и JPG уже сжаты), ZIP64
+    включается для больших файлов и архивов автоматически. Память не
+    зависит от размера файлов. При обрыве соединения сервер закрывает
+    генератор, и чтение прекращается без записи оглавления.
+    """
+    stream = _ZipStream()
+    archive = zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_STORED, allowZip64=True)
+    written = 0
+
+    try:
+        for arcname, path in files:
+            info = zipfile.ZipInfo.from_file(path, arcname)
+            info.compress_type = zipfile.ZIP_STORED
+
+            with open(path, 'rb') as source, archive.open(info, 'w') as target:
+                for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+                    target.write(chunk)
+                    yield stream.drain()
+            written += 1
+
+        archive.close()
+        yield stream.drain()
+
+    except GeneratorExit:
+        logger.info('ZIP download aborted by client after %d of %d files', written, len(files))
+        raise
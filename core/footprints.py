@@ -0,0 +1,162 @@
+"""
+Реестр охватов тайлов MGRS и пространственный индекс для поиска по bbox.
+
+Охваты хранятся в JSON-файле settings.TILE_FOOTPRINTS_FILE вида
+{"T45VUC": [запад, юг, восток, север], ...} в градусах WGS84 (его пишет
+import_tile_footprints). Тайл, пересекающий антимеридиан, записывается
+с запад > восток.
+"""
+import json
+import math
+import os
+import threading
+import time
+
+from django.conf import settings
+
+from .metrics import track
+
+
+def split_bbox(bbox):
+    """Прямоугольники без перехода через антимеридиан (один или два)"""
+    west, south, east, north = bbox
+    if west <= east:
+        return [(west, south, east, north)]
+    return [(west, south, 180.0, north), (-180.0, south, east, north)]
+
+
+def _intersects(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def parse_bbox(value):
+    """'запад,юг,восток,север' -> кортеж чисел; некорректный bbox - ValueError"""
+    try:
+        west, south, east, north = (float(part) for part in value.split(','))
+    except (AttributeError, ValueError):
+        raise ValueError('bbox must be west,south,east,north')
+
+    if not all(math.isfinite(v) for v in (west, south, east, north)):
+        raise ValueError('bbox must be finite')
+    if not (-180 <= west <= 180 and -180 <= east <= 180 and -90 <= south <= north <= 90):
+        raise ValueError('bbox is out of range')
+    return west, south, east, north
+
+
+class TileIndex:
+    """
+    Равномерная сетка по ячейкам cell градусов: ячейка -> тайлы, охват
+    которых ее задевает. Запрос просматривает только ячейки bbox и
+    проверяет пересечение у найденных в них тайлов.
+    """
+
+    def __init__(self, footprints, cell=1.0, path=None, version=None):
+        self.footprints = footprints
+        self.cell = cell
+        # Файл реестра и его mtime_ns, из которых построен индекс
+        self.path = path
+        self.version = version
+        self.checked_at = 0.0
+        self.cells = {}
+
+        for tile, bbox in footprints.items():
+            for key in self._cells(bbox):
+                self.cells.setdefault(key, []).append(tile)
+
+    def _cells(self, bbox):
+        for west, south, east, north in split_bbox(bbox):
+            for ix in range(math.floor(west / self.cell), math.floor(east / self.cell) + 1):
+                for iy in range(math.floor(south / self.cell), math.floor(north / self.cell) + 1):
+                    yield ix, iy
+
+    def _cell_count(self, bbox):
+        return sum(
+            (math.floor(east / self.cell) - math.floor(west / self.cell) + 1)
+            * (math.floor(north / self.cell) - math.floor(south / self.cell) + 1)
+            for west, south, east, north in split_bbox(bbox)
+        )
+
+    def query(self, bbox):
+        """Отсортированные имена тайлов, охват которых пересекает bbox"""
+        boxes = split_bbox(bbox)
+
+        # Для bbox на полмира перебор реестра дешевле перебора ячеек
+        if self._cell_count(bbox) > len(self.footprints):
+            candidates = self.footprints
+        else:
+            candidates = {tile for key in self._cells(bbox) for tile in self.cells.get(key, ())}
+
+        return sorted(
+            tile for tile in candidates
+            if any(_intersects(box, part) for box in boxes for part in split_bbox(self.footprints[tile]))
+        )
+
+    def __len__(self):
+        return len(self.footprints)
+
+
+def load_footprints(path):
+    """Охваты из JSON-файла реестра; некорректная запись - ValueError"""
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+
+    footprints = {}
+    for tile, bbox in data.items():
+        try:
+            west, south, east, north = (float(value) for value in bbox)
+        except (TypeError, ValueError):
+            raise ValueError(f'{tile}: ожидается [запад, юг, восток, север]')
+        footprints[tile] = (west, south, east, north)
+    return footprints
+
+
+def write_footprints(path, footprints):
+    """Атомарная запись реестра (через временный файл и rename)"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({tile: list(bbox) for tile, bbox in sorted(footprints.items())}, f)
+    os.replace(tmp_path, path)
+
+
+_index = None
+_lock = threading.Lock()
+
+
+@track('fs')
+def _footprints_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def get_tile_index():
+    """
+    Индекс охватов текущего процесса.
+
+    Файл реестра перечитывается при смене mtime; mtime проверяется не
+    чаще CATALOG_CHECK_INTERVAL секунд. Без файла индекс пустой.
+    """
+    global _index
+    interval = getattr(settings, 'CATALOG_CHECK_INTERVAL', 5)
+
+    index = _index
+    if index is not None and index.path == settings.TILE_FOOTPRINTS_FILE \
+            and time.monotonic() - index.checked_at < interval:
+        return index
+
+    with _lock:
+        path = settings.TILE_FOOTPRINTS_FILE
+        mtime = _footprints_mtime(path)
+
+        index = _index
+        if index is None or index.path != path or index.version != mtime:
+            footprints = load_footprints(path) if mtime is not None else {}
+            cell = getattr(settings, 'TILE_INDEX_CELL_DEGREES', 1.0)
+            index = TileIndex(footprints, cell, path, mtime)
+            _index = index
+
+        index.checked_at = time.monotonic()
+
+    return index
@@ -0,0 +1,169 @@
+import os
+import socket
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .downloads import data_file
+from .management.commands.generate_difference import cached_difference_result
+from .models import DifferenceJob
+
+
+# Статус в API для готового задания, файлы результата которого вытеснены из кэша
+EXPIRED = 'expired'
+
+
+def worker_name():
+    """Имя воркера: хост и PID процесса, который взял задание"""
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def submit_difference_job(date1, date2, product_type, tile=''):
+    """
+    Ставит расчет разницы в очередь и возвращает (задание, создано ли новое).
+
+    Сначала проверяется кэш разниц (ключ по исходным файлам и версии
+    алгоритма): при попадании возвращается готовое задание со статусом
+    done, и в очередь ничего не ставится. Если такое же задание уже в
+    очереди или выполняется, возвращается оно: условный уникальный индекс
+    не дает создать дубликат даже при гонке двух запросов. Новое задание
+    создается только при промахе, в том числе когда результат прежнего
+    готового задания уже вытеснен из кэша.
+    """
+    params = {'date1': date1, 'date2': date2, 'product_type': product_type, 'tile': tile or ''}
+
+    result = cached_difference_result(date1, date2, product_type, tile or None)
+    if result is not None:
+        return _done_job(params, result), False
+
+    active = DifferenceJob.objects.filter(
+        status__in=[DifferenceJob.QUEUED, DifferenceJob.RUNNING], **params
+    )
+
+    existing = active.first()
+    if existing is not None:
+        return existing, False
+
+    try:
+        with transaction.atomic():
+            return DifferenceJob.objects.create(**params), True
+    except IntegrityError:
+        existing = active.first()
+        if existing is None:
+            raise
+        return existing, False
+
+
+def _done_job(params, result):
+    """
+    Готовое задание для результата из кэша: последнее завершенное с теми же
+    файлами результата или новая запись сразу со статусом done.
+    """
+    job = DifferenceJob.objects.filter(
+        status=DifferenceJob.DONE, result__product_path=result['product_path'], **params
+    ).order_by('-finished_at', '-id').first()
+    if job is not None:
+        return job
+
+    now = timezone.now()
+    return DifferenceJob.objects.create(
+        status=DifferenceJob.DONE, result=result, started_at=now, finished_at=now, **params
+    )
+
+
+def claim_next_job(worker=None):
+    """
+    Атомарно переводит самое старое задание из очереди в running.
+
+    UPDATE с условием status='queued' выполняется только одним из
+    конкурирующих воркеров; проигравший берет следующее задание.
+    """
+    worker = worker or worker_name()
+    queued = DifferenceJob.objects.filter(status=DifferenceJob.QUEUED)
+
+    while True:
+        job_id = queued.order_by('created_at', 'id').values_list('id', flat=True).first()
+        if job_id is None:
+            return None
+
+        claimed = queued.filter(id=job_id).update(
+            status=DifferenceJob.RUNNING, worker=worker, started_at=timezone.now()
+        )
+        if claimed:
+            return DifferenceJob.objects.get(id=job_id)
+
+
+def finish_job(job_id, result):
+    """Сохраняет результат generate_difference в задании"""
+    if result.get('status') == 'success':
+        fields = {'status': DifferenceJob.DONE, 'result': result, 'error': ''}
+    else:
+        fields = {'status': DifferenceJob.FAILED, 'error': result.get('message', 'Неизвестная ошибка')}
+
+    DifferenceJob.objects.filter(id=job_id).update(finished_at=timezone.now(), **fields)
+
+
+def result_available(job):
+    """Файлы результата готового задания еще лежат в кэше разниц"""
+    return all(data_file(job.result.get(field)) for field in ('preview_path', 'product_path'))
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def requeue_orphaned_jobs():
+    """
+    Возвращает в очередь задания, чей воркер на этом хосте уже не работает
+    (например, run_workers был остановлен посреди расчета).
+    """
+    host = socket.gethostname()
+    requeued = 0
+
+    for job in DifferenceJob.objects.filter(status=DifferenceJob.RUNNING, worker__startswith=f'{host}:'):
+        pid = job.worker.rsplit(':', 1)[1]
+        if pid.isdigit() and _process_alive(int(pid)):
+            continue
+        requeued += DifferenceJob.objects.filter(id=job.id, status=DifferenceJob.RUNNING).update(
+            status=DifferenceJob.QUEUED, worker='', started_at=None
+        )
+
+    return requeued
+
+
+def job_payload(job):
+    """JSON-представление задания для API"""
+    payload = {
+        'job_id': job.id,
+        'status': job.status,
+        'date1': job.date1.isoformat(),
+        'date2': job.date2.isoformat(),
+        'product_type': job.product_type,
+        'tile': job.tile or None,
+        'created_at': job.created_at.isoformat(),
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+    if job.status == DifferenceJob.DONE and job.result and not result_available(job):
+        # Результат вытеснен из кэша (LRU): задание не меняется, повторная
+        # отправка того же запроса поставит расчет в очередь заново
+        payload['status'] = EXPIRED
+        payload['message'] = 'Result was evicted from the cache, submit the job again'
+    elif job.status == DifferenceJob.DONE and job.result:
+        payload['result'] = {
+            'tile': job.result['tile'],
+            'preview_url': f"/media/{job.result['preview_path']}",
+            'download_url': f"/download-product/?path={job.result['product_path']}",
+            'stats': job.result.get('stats'),
+        }
+    elif job.status == DifferenceJob.FAILED:
+        payload['error'] = job.error
+
+    return payload
@@ -0,0 +1,55 @@
+import json
+from core.difference import difference_cache
+from core.metrics import InstrumentedCommand
+from core.renditions import rendition_cache
+from core.tiles import tile_cache
+
+
+CACHES = {
+    'tiles': ('Тайлы карты', tile_cache),
+    'renditions': ('Копии превью', rendition_cache),
+    'differences': ('Результаты разницы', difference_cache),
+}
+
+
+class Command(InstrumentedCommand):
+    help = 'Показывает размер и счетчики попаданий/промахов/вытеснений дисковых кэшей'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Вывести статистику в JSON'
+        )
+        parser.add_argument(
+            '--evict',
+            action='store_true',
+            help='Сначала вытеснить записи сверх бюджета'
+        )
+
+    def handle(self, *args, **options):
+        report = {}
+        for name, (_, get_cache) in CACHES.items():
+            cache = get_cache()
+            if options['evict']:
+                cache.evict()
+                cache.flush_stats()
+            report[name] = cache.stats()
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        for name, stats in report.items():
+            requests = stats['hits'] + stats['misses']
+            hit_rate = stats['hits'] / requests * 100 if requests else 0
+            self.stdout.write(self.style.SUCCESS(CACHES[name][0]))
+            self.stdout.write(
+                f"  {stats['entries']} файлов, {stats['size_bytes'] / 1024 / 1024:.1f} МБ "
+                f"из {stats['max_bytes'] / 1024 / 1024:.0f} МБ"
+            )
+            self.stdout.write(
+                f"  попаданий {stats['hits']}, промахов {stats['misses']} ({hit_rate:.1f}% попаданий), "
+                f"записей {stats['stores']}, вытеснено {stats['evictions']} "
+                f"({stats['evicted_bytes'] / 1024 / 1024:.1f} МБ)"
+            )
@@ -1,30 +1,310 @@
-from django.core.management.base import BaseCommand
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from pathlib import Path
 from django.conf import settings
-from core.models import SatelliteImage
+from django.db import transaction
+from core.downloads import resolve_data_path
+from core.metrics import InstrumentedCommand
+from core.models import FileChecksum, SatelliteImage
 
+# Версия формата файла состояния для --resume
+STATE_VERSION = 2
 
-class Command(BaseCommand):
-    help = 'Проверяет целостность данных (наличие файлов)'
+HASH_BLOCK_SIZE = 1024 * 1024
+
+FILE_FIELDS = (('preview', 'preview_path'), ('product', 'product_path'))
+
+
+def file_sha256(path):
+    """SHA-256 файла, читается блоками по HASH_BLOCK_SIZE"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Command(InstrumentedCommand):
+    help = 'Проверяет целостность данных (наличие файлов и, по желанию, контрольные суммы)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--product',
+            type=str,
+            help='Проверить только указанный тип продукта (TCI, NDVI, NDWI)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=8,
+            help='Число потоков для stat/чтения файлов (по умолчанию 8)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Сколько записей читать из базы за раз (по умолчанию 500)'
+        )
+        parser.add_argument(
+            '--checksums',
+            action='store_true',
+            help='Считать SHA-256 новых и изменившихся (по размеру/mtime) файлов'
+        )
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Перечитать все файлы и сверить с сохраненными суммами (включает --checksums)'
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Продолжить прерванную проверку с места остановки'
+        )
+        parser.add_argument(
+            '--report',
+            type=str,
+            help='Записать отчет в JSON-файл'
+        )
 
     def handle(self, *args, **options):
-        missing_previews = 0
-        missing_products = 0
+        checksums = options['checksums'] or options['verify']
+        chunk_size = max(1, options['chunk_size'])
+        # Записи без продукта (NOT_FOUND) перечисляются только при -v2
+        self.verbose = options['verbosity'] > 1
+
+        run_options = {
+            'product': options['product'],
+            'checksums': checksums,
+            'verify': options['verify'],
+        }
+
+        state = self._load_state() if options['resume'] else None
+        if state is not None and state['options'] != run_options:
+            self.stdout.write(self.style.WARNING("Параметры не совпадают с прерванной проверкой, начинаем заново"))
+            state = None
+
+        if state is None:
+            state = self._new_state(run_options)
+            self._truncate_issues(0)
+        else:
+            # Проблемы, записанные после последнего сохранения состояния, будут найдены снова
+            self._truncate_issues(state['issues_size'])
+            self.stdout.write(f"Продолжение проверки после записи id={state['last_id']}")
+
+        images = SatelliteImage.objects.filter(pk__gt=state['last_id']).order_by('pk')
+        if options['product']:
+            images = images.filter(product_type=options['product'])
+
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as executor:
+            chunk = []
+            for image in images.iterator(chunk_size=chunk_size):
+                chunk.append(image)
+                if len(chunk) >= chunk_size:
+                    self._check_chunk(chunk, state, executor, checksums, options['verify'])
+                    chunk = []
+            if chunk:
+                self._check_chunk(chunk, state, executor, checksums, options['verify'])
+
+        state['finished_at'] = datetime.now().isoformat()
+
+        if options['report']:
+            self._write_report(options['report'], state)
+        self._clear_state()
+
+        self._print_summary(state)
+
+    def _check_file(self, relative_path, known, checksums, verify):
+        """
+        Проверка одного файла (выполняется в потоке пула).
+
+        Возвращает (статус, запись FileChecksum для сохранения или None).
+        Статусы: ok, missing, not_indexed (NOT_FOUND в базе), outside
+        (путь вне DATA_ROOT), corrupt (сумма изменилась без изменения файла).
+        """
+        if not relative_path or relative_path == 'NOT_FOUND':
+            return 'not_indexed', None
+
+        full_path = resolve_data_path(relative_path)
+        if full_path is None:
+            return 'outside', None
+
+        try:
+            st = os.stat(full_path)
+        except FileNotFoundError:
+            return 'missing', None
+
+        unchanged = known is not None and known.size == st.st_size and known.mtime_ns == st.st_mtime_ns
+        if not checksums or (unchanged and not verify):
+            return 'ok', None
+
+        sha256 = file_sha256(full_path)
+        if unchanged and sha256 != known.sha256:
+            return 'corrupt', None
+
+        record = FileChecksum(path=relative_path, size=st.st_size, mtime_ns=st.st_mtime_ns, sha256=sha256)
+        return 'ok', record
 
-        for image in SatelliteImage.objects.all():
-            preview = Path(settings.DATA_ROOT) / image.preview_path
-            product = Path(settings.DATA_ROOT) / image.product_path
+    def _check_chunk(self, images, state, executor, checksums, verify):
+        """Проверяет пачку записей в пуле потоков и сохраняет состояние"""
+        jobs = [
+            (image, kind, getattr(image, field))
+            for image in images
+            for kind, field in FILE_FIELDS
+        ]
 
-            if not preview.exists():
-                self.stdout.write(f"❌ Превью отсутствует: {image}")
-                missing_previews += 1
+        known = {}
+        if checksums:
+            paths = [path for _, _, path in jobs if path and path != 'NOT_FOUND']
+            known = FileChecksum.objects.in_bulk(paths, field_name='path')
 
-            if not product.exists():
-                self.stdout.write(f"❌ Продукт отсутствует: {image}")
-                missing_products += 1
+        results = executor.map(
+            lambda job: self._check_file(job[2], known.get(job[2]), checksums, verify), jobs
+        )
+
+        records = []
+        issues = []
+        for (image, kind, path), (status, record) in zip(jobs, results):
+            state['counts'][kind][status] = state['counts'][kind].get(status, 0) + 1
+
+            if record is not None:
+                records.append(record)
+                state['checksums']['hashed'] += 1
+            elif checksums and status == 'ok':
+                state['checksums']['reused'] += 1
+
+            if status != 'ok':
+                issues.append({
+                    'id': image.id,
+                    'tile': image.tile,
+                    'date': image.date.isoformat(),
+                    'product_type': image.product_type,
+                    'file': kind,
+                    'path': path,
+                    'status': status,
+                })
+                if status != 'not_indexed' or self.verbose:
+                    self.stdout.write(f"❌ {kind} ({status}): {image} {path}")
+
+        if records:
+            with transaction.atomic():
+                FileChecksum.objects.bulk_create(
+                    records,
+                    update_conflicts=True,
+                    unique_fields=['path'],
+                    update_fields=['size', 'mtime_ns', 'sha256', 'checked_at'],
+                )
+
+        if issues:
+            state['issues_size'] = self._append_issues(issues)
+
+        state['total'] += len(images)
+        state['last_id'] = images[-1].pk
+        self._save_state(state)
+
+    def _state_path(self):
+        return Path(settings.DATA_ROOT) / 'index_files' / 'check_data.state.json'
+
+    def _issues_path(self):
+        """Найденные проблемы, по одной JSON-записи на строку (в состоянии только размер файла)"""
+        return Path(settings.DATA_ROOT) / 'index_files' / 'check_data.issues.ndjson'
+
+    def _append_issues(self, issues):
+        """Дописывает проблемы пачки и возвращает новый размер файла"""
+        issues_path = self._issues_path()
+        issues_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(issues_path, 'a', encoding='utf-8') as f:
+            for issue in issues:
+                f.write(json.dumps(issue, ensure_ascii=False) + '\n')
+            return f.tell()
+
+    def _truncate_issues(self, size):
+        try:
+            with open(self._issues_path(), 'r+b') as f:
+                f.truncate(size)
+        except FileNotFoundError:
+            pass
+
+    def _write_report(self, report_path, state):
+        """JSON-отчет: итоги из состояния и список проблем, переписанный из NDJSON построчно"""
+        report = {
+            key: value for key, value in state.items()
+            if key not in ('version', 'last_id', 'issues_size')
+        }
+        header = json.dumps(report, ensure_ascii=False, indent=2)
+
+        with open(report_path, 'w', encoding='utf-8') as f:
+            f.write(header[:-2] + ',\n  "issues": [')
+            separator = '\n    '
+            try:
+                with open(self._issues_path(), encoding='utf-8') as issues:
+                    for line in issues:
+                        f.write(separator + line.rstrip('\n'))
+                        separator = ',\n    '
+            except FileNotFoundError:
+                pass
+            f.write('\n  ]\n}\n')
+
+    def _new_state(self, run_options):
+        return {
+            'version': STATE_VERSION,
+            'options': run_options,
+            'started_at': datetime.now().isoformat(),
+            'last_id': 0,
+            'total': 0,
+            'counts': {kind: {} for kind, _ in FILE_FIELDS},
+            'checksums': {'hashed': 0, 'reused': 0},
+            'issues_size': 0,
+        }
+
+    def _load_state(self):
+        """Состояние прерванной проверки или None"""
+        try:
+            with open(self._state_path(), encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if state.get('version') != STATE_VERSION:
+            return None
+        return state
+
+    def _save_state(self, state):
+        """Атомарная запись состояния (через временный файл и rename)"""
+        state_path = self._state_path()
+        state_path.parent.mkdir(parents=True, exist_ok=True)
+
+        tmp_path = state_path.with_name(f'{state_path.name}.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, state_path)
+
+    def _clear_state(self):
+        for path in (self._state_path(), self._issues_path()):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _print_summary(self, state):
+        previews = state['counts']['preview']
+        products = state['counts']['product']
 
-        total = SatelliteImage.objects.count()
         self.stdout.write(f"\nСтатистика проверки:")
-        self.stdout.write(f"Всего записей: {total}")
-        self.stdout.write(f"Отсутствует превью: {missing_previews}")
-        self.stdout.write(f"Отсутствует продуктов: {missing_products}")
\ No newline at end of file
+        self.stdout.write(f"Всего записей: {state['total']}")
+        self.stdout.write(f"Отсутствует превью: {previews.get('missing', 0)}")
+        self.stdout.write(f"Отсутствует продуктов: {products.get('missing', 0)}")
+        self.stdout.write(f"Продукт не найден при индексации (NOT_FOUND): {products.get('not_indexed', 0)}")
+
+        outside = previews.get('outside', 0) + products.get('outside', 0)
+        if outside:
+            self.stdout.write(f"Путь вне DATA_ROOT: {outside}")
+
+        if state['options']['checksums']:
+            corrupt = previews.get('corrupt', 0) + products.get('corrupt', 0)
+            self.stdout.write(
+                f"Контрольные суммы: посчитано {state['checksums']['hashed']}, "
+                f"без изменений {state['checksums']['reused']}, повреждено {corrupt}"
+            )
@@ -0,0 +1,137 @@
+import multiprocessing
+import os
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ProcessPoolExecutor, wait
+from django.db import transaction
+from core.catalog import bump_catalog_version
+from core.downloads import resolve_data_path
+from core.metrics import InstrumentedCommand
+from core.models import ImageStatistics, SatelliteImage
+from core.rasterstats import compute_raster_stats
+
+
+class Command(InstrumentedCommand):
+    help = 'Считает статистику растров продуктов (min/max/mean/std, гистограмма) для новых и изменившихся файлов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--product',
+            type=str,
+            help='Обработать только указанный тип продукта (TCI, NDVI, NDWI)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Число процессов для чтения растров (по умолчанию число CPU)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Сколько результатов сохранять в базу за раз (по умолчанию 200)'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Пересчитать статистику и для неизменившихся файлов'
+        )
+        parser.add_argument(
+            '--data-dir',
+            type=str,
+            default=None,
+            help='Путь к директории с данными (по умолчанию settings.DATA_ROOT)'
+        )
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        batch_size = max(1, options['batch_size'])
+        verbose = options['verbosity'] > 1
+        data_dir = options['data_dir']
+
+        images = SatelliteImage.objects.exclude(product_path='NOT_FOUND') \
+            .select_related('statistics').order_by('pk')
+        if options['product']:
+            images = images.filter(product_type=options['product'])
+
+        skipped = missing = failed = 0
+        pending = {}
+        results = []
+        stored = 0
+
+        # spawn: процессы пула не наследуют соединение с базой
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            for image in images.iterator(chunk_size=500):
+                full_path = resolve_data_path(image.product_path, data_dir)
+                if full_path is None or not full_path.is_file():
+                    missing += 1
+                    if verbose:
+                        self.stdout.write(f"  ⚠️ Файл не найден: {image}")
+                    continue
+
+                st = os.stat(full_path)
+
+                known = getattr(image, 'statistics', None)
+                if not options['force'] and known is not None \
+                        and (known.source_size, known.source_mtime_ns) == (st.st_size, st.st_mtime_ns):
+                    skipped += 1
+                    continue
+
+                future = pool.submit(compute_raster_stats, str(full_path), image.product_type)
+                pending[future] = (image, st)
+
+                # Очередь ограничена, чтобы не держать в памяти весь архив
+                if len(pending) >= workers * 4:
+                    failed += self._collect(pending, results, wait_all=False)
+                if len(results) >= batch_size:
+                    stored += self._save(results)
+
+            failed += self._collect(pending, results, wait_all=True)
+            stored += self._save(results)
+
+        # Ответы API со статистикой кэшируются по версии каталога
+        if stored:
+            bump_catalog_version(data_dir)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово! Посчитано: {stored}, без изменений: {skipped}, "
+            f"нет файла: {missing}, ошибок: {failed}"
+        ))
+
+    def _collect(self, pending, results, wait_all):
+        """Забирает готовые результаты из pending в results; возвращает число ошибок"""
+        done, _ = wait(pending, return_when=ALL_COMPLETED if wait_all else FIRST_COMPLETED)
+        failed = 0
+
+        for future in done:
+            image, st = pending.pop(future)
+            try:
+                stats = future.result()
+            except Exception as e:
+                failed += 1
+                self.stdout.write(f"  ❌ {image}: {e}")
+                continue
+
+            results.append(ImageStatistics(
+                image=image, source_size=st.st_size, source_mtime_ns=st.st_mtime_ns, **stats
+            ))
+
+        return failed
+
+    def _save(self, results):
+        if not results:
+            return 0
+
+        with transaction.atomic():
+            ImageStatistics.objects.bulk_create(
+                results,
+                update_conflicts=True,
+                unique_fields=['image'],
+                update_fields=[
+                    'min', 'max', 'mean', 'std', 'histogram', 'histogram_min', 'histogram_max',
+                    'valid_pixels', 'valid_fraction', 'source_size', 'source_mtime_ns', 'computed_at',
+                ],
+            )
+
+        count = len(results)
+        results.clear()
+        return count
@@ -1,12 +1,32 @@
-import shutil
-from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from core.management.commands.generate_difference import generate_difference
+from core.metrics import InstrumentedCommand
+from core.models import SatelliteImage
 
-class Command(BaseCommand):
-    help = 'Эмуляция создания разницы между двумя снимками'
+
+class Command(InstrumentedCommand):
+    help = 'Пробный расчет разницы между двумя последними датами продукта'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--product',
+            type=str,
+            default='TCI',
+            help='Тип продукта (TCI, NDVI, NDWI)'
+        )
 
     def handle(self, *args, **options):
-        # Эмулируем работу скрипта: копируем первый файл как результат
-        source_preview = 'path/to/first_preview.jpg'
-        target_preview = 'path/to/diff_preview.jpg'
-        shutil.copy(source_preview, target_preview)
-        self.stdout.write('Разница создана (эмуляция)')
\ No newline at end of file
+        product_type = options['product']
+        dates = list(
+            SatelliteImage.objects.filter(product_type=product_type)
+            .values_list('date', flat=True).distinct().order_by('-date')[:2]
+        )
+        if len(dates) < 2:
+            raise CommandError(f'Для {product_type} меньше двух дат в базе')
+
+        date2, date1 = dates
+        result = generate_difference(date1.isoformat(), date2.isoformat(), product_type)
+        if result['status'] != 'success':
+            raise CommandError(result['message'])
+
+        self.stdout.write(f"Разница создана: {result['preview_path']}, {result['product_path']}")
@@ -1,47 +1,112 @@
 import os
-import shutil
 from django.conf import settings
+from django.core.management.base import CommandError
+from core.difference import cached_difference, lookup_difference
+from core.metrics import InstrumentedCommand
 
 
-def generate_difference(date1, date2, product_type):
+def _source_images(date1, date2, product_type, tile=None):
     """
-    Эмуляция создания разницы между двумя снимками.
-    В реальности здесь должен быть вызов вашего алгоритма.
+    Пара снимков одного тайла на обе даты; без тайла берется первый,
+    снятый в обе даты. ValueError, если подходящей пары нет.
     """
-
-    # Находим исходные файлы
     from core.models import SatelliteImage
 
-    try:
-        image1 = SatelliteImage.objects.get(date=date1, product_type=product_type)
-        image2 = SatelliteImage.objects.get(date=date2, product_type=product_type)
+    images1 = SatelliteImage.objects.filter(date=date1, product_type=product_type)
+    images2 = SatelliteImage.objects.filter(date=date2, product_type=product_type)
+    if tile:
+        images1 = images1.filter(tile=tile)
+        images2 = images2.filter(tile=tile)
+
+    by_tile = {image.tile: image for image in images2}
+    pairs = [(image, by_tile[image.tile]) for image in images1.order_by('tile') if image.tile in by_tile]
+    if not pairs:
+        raise ValueError('Нет снимков одного тайла на обе даты')
+
+    image1, image2 = pairs[0]
+    if 'NOT_FOUND' in (image1.product_path, image2.product_path):
+        raise ValueError('Файл продукта не найден')
+
+    return image1, image2
 
-        # Создаем директорию для результатов разницы
-        diff_dir = os.path.join(settings.MEDIA_ROOT, 'diff_results')
-        os.makedirs(diff_dir, exist_ok=True)
 
-        # Имена результирующих файлов
-        diff_preview_name = f"{date1}_{date2}_{product_type}.jpg"
-        diff_product_name = f"{date1}_{date2}_{product_type}.tiff"
+def _source_paths(image1, image2):
+    return (
+        os.path.join(settings.DATA_ROOT, image1.product_path),
+        os.path.join(settings.DATA_ROOT, image2.product_path),
+    )
 
-        diff_preview_path = os.path.join(diff_dir, diff_preview_name)
-        diff_product_path = os.path.join(diff_dir, diff_product_name)
 
-        # Эмуляция: копируем первый файл как результат
-        source_preview = os.path.join(settings.DATA_ROOT, image1.preview_path)
-        source_product = os.path.join(settings.DATA_ROOT, image1.product_path)
+def _result(tile, diff_product_path, diff_preview_path, stats, cached):
+    return {
+        'preview_path': os.path.relpath(diff_preview_path, settings.DATA_ROOT),
+        'product_path': os.path.relpath(diff_product_path, settings.DATA_ROOT),
+        'tile': tile,
+        'stats': stats,
+        'cached': cached,
+        'status': 'success'
+    }
 
-        if os.path.exists(source_preview):
-            shutil.copy(source_preview, diff_preview_path)
 
-        if os.path.exists(source_product):
-            shutil.copy(source_product, diff_product_path)
+def generate_difference(date1, date2, product_type, tile=None):
+    """
+    Разница между двумя снимками одного тайла (date2 минус date1).
 
-        return {
-            'preview_path': os.path.relpath(diff_preview_path, settings.DATA_ROOT),
-            'product_path': os.path.relpath(diff_product_path, settings.DATA_ROOT),
-            'status': 'success'
-        }
+    Если тайл не указан, берется первый тайл, снятый в обе даты.
+    Результат (.tiff и превью .jpg) хранится в кэше settings.DIFF_CACHE_DIR
+    с ключом по исходным файлам, повторный расчет той же пары не выполняется.
+    """
+    try:
+        image1, image2 = _source_images(date1, date2, product_type, tile)
+        found = cached_difference(*_source_paths(image1, image2), product_type)
+        return _result(image1.tile, *found)
 
     except Exception as e:
-        return {'status': 'error', 'message': str(e)}
\ No newline at end of file
+        return {'status': 'error', 'message': str(e)}
+
+
+def cached_difference_result(date1, date2, product_type, tile=None):
+    """
+    Результат generate_difference, если он уже есть в кэше разниц, иначе None.
+    Ничего не рассчитывает: ключ строится по тем же исходным файлам
+    (путь, размер, mtime) и версии алгоритма.
+    """
+    try:
+        image1, image2 = _source_images(date1, date2, product_type, tile)
+        found = lookup_difference(*_source_paths(image1, image2), product_type)
+    except (ValueError, OSError):
+        return None
+
+    if found is None:
+        return None
+    return _result(image1.tile, *found, True)
+
+
+class Command(InstrumentedCommand):
+    help = 'Рассчитывает разницу между снимками продукта на две даты'
+
+    def add_arguments(self, parser):
+        parser.add_argument('date1', type=str, help='Первая дата (YYYY-MM-DD)')
+        parser.add_argument('date2', type=str, help='Вторая дата (YYYY-MM-DD)')
+        parser.add_argument(
+            '--product',
+            type=str,
+            default='TCI',
+            help='Тип продукта (TCI, NDVI, NDWI)'
+        )
+        parser.add_argument(
+            '--tile',
+            type=str,
+            help='Тайл (по умолчанию первый, снятый в обе даты)'
+        )
+
+    def handle(self, *args, **options):
+        result = generate_difference(options['date1'], options['date2'], options['product'], options['tile'])
+        if result['status'] != 'success':
+            raise CommandError(result['message'])
+
+        source = 'взята из кэша' if result['cached'] else 'рассчитана'
+        self.stdout.write(self.style.SUCCESS(f"Разница {source} для тайла {result['tile']}"))
+        self.stdout.write(f"  Превью: {result['preview_path']}")
+        self.stdout.write(f"  Продукт: {result['product_path']}")
+        self.stdout.write(f"  Статистика: {result['stats']}")
@@ -1,17 +1,31 @@
 import os
 import json
+import hashlib
+import shutil
 from datetime import datetime
 from pathlib import Path
-from django.core.management.base import BaseCommand
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from core.metrics import InstrumentedCommand
 from core.models import SatelliteImage
-from core.utils import parse_filename
+from core.utils import get_product_stats, parse_filename, refresh_product_summary
+from core.catalog import (
+    PREVIEW_EXTENSIONS, PRODUCT_EXTENSIONS, bump_catalog_version, pair_scenes, scene_key,
+    tree_paths, walk_tree_changes
+)
+from concurrent.futures import ThreadPoolExecutor
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Версия формата манифеста файлов для --incremental
+MANIFEST_VERSION = 2
 
-class Command(BaseCommand):
+
+class Command(InstrumentedCommand):
     help = 'Сканирует директории с превью и продуктами, создает записи в базе данных и индекс-файлы'
 
     def add_arguments(self, parser):
@@ -30,6 +44,40 @@ class Command(BaseCommand):
             type=str,
             help='Обработать только указанный тип продукта (TCI, NDVI, NDWI)'
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Размер пачки для bulk_create (по умолчанию 500)'
+        )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help='Обработать только файлы, изменившиеся с прошлого запуска (по манифесту)'
+        )
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='С --incremental проверить stat каждого известного файла: находит перезапись '
+                 'файлов на месте, которая не меняет mtime директории (дольше, чем обычный запуск)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Число потоков для обхода директорий (по умолчанию 1)'
+        )
+        parser.add_argument(
+            '--with-stats',
+            action='store_true',
+            help='После индексации посчитать статистику растров новых и изменившихся продуктов'
+        )
+        parser.add_argument(
+            '--stats-workers',
+            type=int,
+            default=None,
+            help='Число процессов для --with-stats (по умолчанию число CPU)'
+        )
         parser.add_argument(
             '--data-dir',
             type=str,
@@ -41,6 +89,11 @@ class Command(BaseCommand):
         force_update = options['force']
         skip_index_files = options['skip_index_files']
         target_product = options['product']
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size должен быть не меньше 1')
+        incremental = options['incremental']
+        workers = max(1, options['workers'])
         data_dir = options['data_dir'] or getattr(settings, 'DATA_ROOT', '/data')
 
         # Определяем структуру директорий
@@ -56,20 +109,20 @@ class Command(BaseCommand):
             'TCI': {
                 'preview_dir': base_path / 'preview' / 'TCI',
                 'product_dir': base_path / 'TCI',
-                'preview_ext': ['.jpg', '.JPG', '.jpeg', '.JPEG'],
-                'product_ext': ['.tiff', '.tif', '.TIFF', '.TIF']  # Все продукты в .tiff
+                'preview_ext': PREVIEW_EXTENSIONS,
+                'product_ext': PRODUCT_EXTENSIONS  # Расширения сравниваются без учета регистра
             },
             'NDVI': {
                 'preview_dir': base_path / 'preview' / 'NDVI',
                 'product_dir': base_path / 'NDVI',
-                'preview_ext': ['.jpg', '.JPG', '.jpeg', '.JPEG'],
-                'product_ext': ['.tiff', '.tif', '.TIFF', '.TIF']  # Все продукты в .tiff
+                'preview_ext': PREVIEW_EXTENSIONS,
+                'product_ext': PRODUCT_EXTENSIONS  # Расширения сравниваются без учета регистра
             },
             'NDWI': {
                 'preview_dir': base_path / 'preview' / 'NDWI',
                 'product_dir': base_path / 'NDWI',
-                'preview_ext': ['.jpg', '.JPG', '.jpeg', '.JPEG'],
-                'product_ext': ['.tiff', '.tif', '.TIFF', '.TIF']  # Все продукты в .tiff
+                'preview_ext': PREVIEW_EXTENSIONS,
+                'product_ext': PRODUCT_EXTENSIONS  # Расширения сравниваются без учета регистра
             }
         }
 
@@ -83,6 +136,17 @@ class Command(BaseCommand):
             products_to_process = product_configs
 
         total_processed = 0
+        total_changed = 0
+
+        # Манифест файлов прошлого запуска: директория -> {имя: (size, mtime_ns, inode)}
+        manifest = self._load_manifest(data_dir)
+        manifest_changed = False
+
+        # Обход деревьев выполняется заранее (параллельно при --workers > 1),
+        # запись в базу остается последовательной в основном потоке
+        scans = self._scan_products(
+            products_to_process, manifest if incremental else {}, data_dir, workers, options['verify']
+        )
 
         for product_type, config in products_to_process.items():
             self.stdout.write(f"\n{'=' * 60}")
@@ -90,181 +154,73 @@ class Command(BaseCommand):
             self.stdout.write(f"📁 Директория превью: {config['preview_dir']}")
             self.stdout.write(f"📁 Директория продуктов: {config['product_dir']}")
 
-            # Сканируем директорию превью
-            preview_dir = config['preview_dir']
-            if not preview_dir.exists():
-                self.stdout.write(f"  ⚠️ Директория превью не найдена: {preview_dir}")
+            scan = scans[product_type]
+            if scan is None:
+                self.stdout.write(f"  ⚠️ Директория превью не найдена: {config['preview_dir']}")
                 continue
 
-            # Собираем все файлы превью (рекурсивно по годам)
-            preview_files = []
-            for ext in config['preview_ext']:
-                # Ищем во всех поддиректориях (включая годовые)
-                preview_files.extend(list(preview_dir.rglob(f"*{ext}")))
-                preview_files.extend(list(preview_dir.rglob(f"*{ext.upper()}")))
-                preview_files.extend(list(preview_dir.rglob(f"*{ext.lower()}")))
-
-            self.stdout.write(f"  📊 Найдено файлов превью: {len(preview_files)}")
-
-            processed_for_product = 0
-
-            for preview_file in preview_files:
-                try:
-                    # Парсим имя файла
-                    filename = preview_file.name
-
-                    # Формат: T45VUC_20250602T052649_TCI.jpg
-                    base_name = preview_file.stem  # Без расширения
-                    parts = base_name.split('_')
-
-                    if len(parts) < 3:
-                        self.stdout.write(f"  ⚠️ Неверный формат имени файла (мало частей): {filename}")
-                        continue
-
-                    tile = parts[0]
-                    date_time_str = parts[1]  # Полная строка с временем: 20250602T052649
-
-                    # Извлекаем дату (первые 8 символов)
-                    if len(date_time_str) < 8:
-                        self.stdout.write(f"  ⚠️ Неверный формат даты: {date_time_str}")
-                        continue
-
-                    date_str = date_time_str[:8]  # YYYYMMDD
-                    file_product_type = parts[2]
-
-                    # Проверяем тип продукта
-                    if file_product_type.upper() != product_type.upper():
-                        self.stdout.write(
-                            f"  ⚠️ Тип продукта не совпадает: {file_product_type} != {product_type} (файл: {filename})")
-                        continue
-
-                    try:
-                        date_obj = datetime.strptime(date_str, '%Y%m%d').date()
-                    except ValueError:
-                        self.stdout.write(f"  ⚠️ Неверный формат даты: {date_str}")
-                        continue
-
-                    # Формируем относительные пути
-                    try:
-                        # Пытаемся получить путь относительно data_dir
-                        preview_rel_path = str(preview_file.relative_to(Path(data_dir)))
-                    except ValueError:
-                        # Если файл не в data_dir, используем абсолютный путь
-                        preview_rel_path = str(preview_file)
-
-                    # Ищем соответствующий файл продукта
-                    year = date_obj.strftime('%Y')
-
-                    # Варианты поиска файла продукта
-                    product_found = False
-                    product_file = None
-                    product_rel_path = None
-
-                    # 1. Ищем в директории по году
-                    product_year_dir = config['product_dir'] / year
-                    if product_year_dir.exists():
-                        # Ищем файлы с похожим именем
-                        search_patterns = [
-                            f"{tile}_{date_time_str}_{product_type}*",
-                            f"{tile}_{date_str}*{product_type}*",
-                            f"{tile}*{date_str}*{product_type}*"
-                        ]
-
-                        for pattern in search_patterns:
-                            for ext in config['product_ext']:
-                                matches = list(product_year_dir.glob(f"{pattern}{ext}"))
-                                matches.extend(list(product_year_dir.glob(f"{pattern}{ext.upper()}")))
-                                matches.extend(list(product_year_dir.glob(f"{pattern}{ext.lower()}")))
-
-                                if matches:
-                                    product_file = matches[0]
-                                    product_found = True
-                                    break
-                            if product_found:
-                                break
-
-                    # 2. Ищем в основной директории продукта
-                    if not product_found:
-                        search_patterns = [
-                            f"{tile}_{date_time_str}_{product_type}*",
-                            f"{tile}_{date_str}*{product_type}*"
-                        ]
-
-                        for pattern in search_patterns:
-                            for ext in config['product_ext']:
-                                matches = list(config['product_dir'].glob(f"{pattern}{ext}"))
-                                matches.extend(list(config['product_dir'].glob(f"{pattern}{ext.upper()}")))
-                                matches.extend(list(config['product_dir'].glob(f"{pattern}{ext.lower()}")))
-
-                                if matches:
-                                    product_file = matches[0]
-                                    product_found = True
-                                    break
-                            if product_found:
-                                break
-
-                    # 3. Ищем рекурсивно
-                    if not product_found:
-                        search_patterns = [
-                            f"*{tile}_{date_time_str}_{product_type}*",
-                            f"*{tile}_{date_str}*{product_type}*",
-                            f"*{date_str}*{product_type}*"
-                        ]
-
-                        for pattern in search_patterns:
-                            for ext in config['product_ext']:
-                                matches = list(config['product_dir'].rglob(f"{pattern}{ext}"))
-                                if matches:
-                                    product_file = matches[0]
-                                    product_found = True
-                                    break
-                            if product_found:
-                                break
-
-                    if product_found and product_file:
-                        try:
-                            product_rel_path = str(product_file.relative_to(Path(data_dir)))
-                        except ValueError:
-                            product_rel_path = str(product_file)
-                    else:
-                        self.stdout.write(f"  ⚠️ Файл продукта не найден для: {filename}")
-                        product_rel_path = "NOT_FOUND"
-
-                    # Создаем или обновляем запись в базе данных
-                    defaults = {
-                        'preview_path': preview_rel_path,
-                        'product_path': product_rel_path
-                    }
+            preview_count = sum(len(names) for names in scan['preview_files'].values())
+            product_count = sum(len(names) for names in scan['product_files'].values())
+            self.stdout.write(f"  📊 Найдено файлов превью: {preview_count}")
+            self.stdout.write(f"  📊 Найдено файлов продуктов: {product_count}")
+
+            keys = scan['keys']
+            if keys is not None:
+                self.stdout.write(f"  📊 Изменившихся сцен: {len(keys)}")
+
+            scenes, skipped = scan['scenes'], scan['skipped']
+
+            verbose = options['verbosity'] > 1
+
+            if skipped:
+                self.stdout.write(f"  ⚠️ Пропущено файлов превью: {len(skipped)}")
+                if verbose:
+                    for preview_file, reason in skipped:
+                        self.stdout.write(f"    ⚠️ {reason} (файл: {os.path.basename(preview_file)})")
+
+            # (tile, date) -> (preview_path, product_path); при нескольких
+            # снимках за день остается последний, как и при update_or_create
+            records = {}
+            missing_products = 0
+
+            for scene in scenes:
+                if scene.product_path:
+                    product_rel_path = scene.product_path
+                else:
+                    missing_products += 1
+                    if verbose:
+                        self.stdout.write(f"    ⚠️ Файл продукта не найден для: {os.path.basename(scene.preview_path)}")
+                    product_rel_path = "NOT_FOUND"
+
+                records[(scene.tile, scene.date)] = (scene.preview_path, product_rel_path)
+
+            if missing_products:
+                self.stdout.write(f"  ⚠️ Файл продукта не найден для {missing_products} превью")
+
+            try:
+                created, updated, unchanged, deleted = self._write_records(
+                    product_type, records, force_update, batch_size, keys
+                )
+            except Exception as db_error:
+                self.stdout.write(f"    ❌ Ошибка БД: {db_error}")
+                continue
+
+            # Манифест обновляется только после успешной записи в базу,
+            # иначе следующий --incremental запуск повторит эти изменения
+            manifest[product_type] = {
+                'preview': {'files': scan['preview_files'], 'dirs': scan['preview_dirs']},
+                'product': {'files': scan['product_files'], 'dirs': scan['product_dirs']},
+            }
+            manifest_changed = True
+
+            self.stdout.write(
+                f"  ✅ Создано: {created}, 🔄 обновлено: {updated}, "
+                f"⏭️  без изменений: {unchanged}, 🗑️  удалено: {deleted}"
+            )
 
-                    try:
-                        obj, created = SatelliteImage.objects.update_or_create(
-                            tile=tile,
-                            date=date_obj,
-                            product_type=product_type,
-                            defaults=defaults
-                        )
-
-                        if created:
-                            self.stdout.write(f"    ✅ Создана запись: {obj}")
-                            processed_for_product += 1
-                        elif force_update:
-                            obj.preview_path = preview_rel_path
-                            obj.product_path = product_rel_path
-                            obj.save()
-                            self.stdout.write(f"    🔄 Обновлена запись: {obj}")
-                            processed_for_product += 1
-                        else:
-                            self.stdout.write(f"    ⏭️  Уже существует: {obj}")
-
-                        total_processed += 1
-
-                    except Exception as db_error:
-                        self.stdout.write(f"    ❌ Ошибка БД: {db_error}")
-                        continue
-
-                except Exception as e:
-                    self.stdout.write(f"    ❌ Ошибка обработки файла {filename}: {str(e)}")
-                    continue
+            processed_for_product = created + updated + deleted
+            total_processed += len(records)
+            total_changed += processed_for_product
 
             self.stdout.write(f"  📈 Обработано для {product_type}: {processed_for_product} файлов")
 
@@ -272,50 +228,369 @@ class Command(BaseCommand):
             if not skip_index_files and processed_for_product > 0:
                 self._create_index_files(product_type, data_dir)
 
+        if manifest_changed:
+            self._save_manifest(data_dir, manifest)
+
+        # Сообщаем процессам веб-сервера, что каталог изменился
+        if total_changed > 0:
+            bump_catalog_version(data_dir)
+
+        # Статистика растров (compute_raster_stats сам пропускает неизменившиеся файлы)
+        if options['with_stats']:
+            self.stdout.write(f"\n📈 Статистика растров")
+            # --workers задает потоки обхода директорий; у чтения растров
+            # свой пул процессов, по умолчанию по числу CPU
+            stats_options = {'data_dir': data_dir}
+            if options['stats_workers']:
+                stats_options['workers'] = options['stats_workers']
+            for product_type in products_to_process:
+                call_command(
+                    'compute_raster_stats', product=product_type, stdout=self.stdout,
+                    verbosity=options['verbosity'], **stats_options
+                )
+
         # Сводная статистика
         self.stdout.write(f"\n{'=' * 60}")
         self.stdout.write(self.style.SUCCESS(f"🎉 Обработка завершена! Всего обработано файлов: {total_processed}"))
 
-        # Выводим статистику по продуктам
-        try:
-            for product_type in product_configs.keys():
-                count = SatelliteImage.objects.filter(product_type=product_type).count()
-                self.stdout.write(f"  📊 {product_type}: {count} записей в базе")
-        except Exception as e:
-            self.stdout.write(f"  ❌ Ошибка получения статистики: {e}")
+        # Выводим статистику по продуктам (из сводки)
+        stats = get_product_stats()
+        for product_type in product_configs.keys():
+            count = stats.get(product_type, {}).get('count', 0)
+            self.stdout.write(f"  📊 {product_type}: {count} записей в базе")
+
+    def _scan_products(self, products, manifest, data_dir, workers, verify=False):
+        """
+        Обходит деревья превью и продуктов всех продуктов.
+
+        При workers > 1 директории (продукты, годы и глубже) читаются пулом
+        потоков, а разбор имен и сопоставление идут параллельно по продуктам.
+        Возвращает product_type -> результат _scan_product (None, если нет превью).
+        """
+        if workers <= 1:
+            return {
+                product_type: self._scan_product(
+                    product_type, config, manifest.get(product_type), data_dir, verify=verify
+                )
+                for product_type, config in products.items()
+            }
+
+        # Отдельный пул для продуктов: его потоки только ждут задачи обхода
+        # в общем пуле и не занимают его, поэтому взаимоблокировки нет
+        with ThreadPoolExecutor(max_workers=workers) as pool, \
+                ThreadPoolExecutor(max_workers=len(products)) as drivers:
+            futures = {
+                product_type: drivers.submit(
+                    self._scan_product, product_type, config, manifest.get(product_type), data_dir, pool, verify
+                )
+                for product_type, config in products.items()
+            }
+            return {product_type: future.result() for product_type, future in futures.items()}
+
+    def _scan_product(self, product_type, config, previous, data_dir, executor=None, verify=False):
+        """
+        Один проход os.scandir по каждому дереву: превью собираются
+        без повторов, а продукты раскладываются в словарь по
+        (tile, datetime, product), так что сопоставление - это поиск по ключу.
+
+        С previous (запись манифеста) директории с прежним mtime не читаются,
+        а сопоставляются только сцены изменившихся файлов: их превью и
+        продукты ищутся в тех же относительных директориях обоих деревьев
+        (preview/<продукт>/<год> и <продукт>/<год>), поэтому работа
+        пропорциональна изменениям, а не размеру архива.
+        """
+        if not config['preview_dir'].exists():
+            return None
+
+        preview_root, product_root = str(config['preview_dir']), str(config['product_dir'])
+        preview_files, preview_dirs, changed_previews = walk_tree_changes(
+            preview_root, config['preview_ext'], previous and previous['preview'], executor, verify
+        )
+        product_files, product_dirs, changed_products = walk_tree_changes(
+            product_root, config['product_ext'], previous and previous['product'], executor, verify
+        )
+
+        if previous is None:
+            keys = None
+            preview_paths, product_paths = tree_paths(preview_files), tree_paths(product_files)
+        else:
+            # Пересобираются только сцены (tile, date), у которых
+            # изменился, появился или пропал хотя бы один файл
+            keys = {scene_key(path) for path in changed_previews | changed_products}
+            keys.discard(None)
+
+            relative_dirs = {
+                os.path.relpath(os.path.dirname(path), tree_root)
+                for paths, tree_root in ((changed_previews, preview_root), (changed_products, product_root))
+                for path in paths
+            }
+            preview_paths = self._scene_files(preview_files, preview_root, relative_dirs, keys)
+            product_paths = self._scene_files(product_files, product_root, relative_dirs, keys)
+
+        scenes, skipped = pair_scenes(
+            product_type, preview_paths, product_paths, relative_to=Path(data_dir)
+        )
 
-    def _create_index_files(self, product_type, data_dir):
-        """Создает текстовые и JSON индекс-файлы"""
+        return {
+            'preview_files': preview_files,
+            'preview_dirs': preview_dirs,
+            'product_files': product_files,
+            'product_dirs': product_dirs,
+            'keys': keys,
+            'scenes': scenes,
+            'skipped': skipped,
+        }
+
+    def _scene_files(self, files, tree_root, relative_dirs, keys):
+        """Файлы сцен keys в директориях relative_dirs (относительно tree_root)"""
+        directories = [os.path.normpath(os.path.join(tree_root, directory)) for directory in relative_dirs]
+        return [path for path in tree_paths(files, directories) if scene_key(path) in keys]
+
+    def _write_records(self, product_type, records, force_update, batch_size, keys=None):
+        """
+        Пакетная запись в базу.
+
+        Существующие ключи читаются одним запросом, новые и изменившиеся
+        строки пишутся через bulk_create(update_conflicts=True) пачками
+        внутри одной транзакции. Строки, для которых больше нет превью,
+        удаляются. keys ограничивает обработку набором (tile, date)
+        при инкрементальном запуске.
+        Возвращает (created, updated, unchanged, deleted).
+        """
+        queryset = SatelliteImage.objects.filter(product_type=product_type)
+        if keys is not None:
+            queryset = queryset.filter(
+                tile__in={tile for tile, _ in keys},
+                date__in={date_obj for _, date_obj in keys}
+            )
+
+        existing = {
+            (tile, date_obj): (preview_path, product_path)
+            for tile, date_obj, preview_path, product_path in queryset
+            .values_list('tile', 'date', 'preview_path', 'product_path')
+            .iterator(chunk_size=batch_size)
+        }
+        if keys is not None:
+            existing = {key: paths for key, paths in existing.items() if key in keys}
+
+        stale = [key for key in existing if key not in records]
+
+        to_write = []
+        created = updated = unchanged = 0
+
+        for (tile, date_obj), paths in records.items():
+            current = existing.get((tile, date_obj))
+            if current is None:
+                created += 1
+            elif current != paths or force_update:
+                updated += 1
+            else:
+                unchanged += 1
+                continue
+
+            to_write.append(SatelliteImage(
+                tile=tile,
+                date=date_obj,
+                product_type=product_type,
+                preview_path=paths[0],
+                product_path=paths[1]
+            ))
+
+        with transaction.atomic():
+            SatelliteImage.objects.bulk_create(
+                to_write,
+                batch_size=batch_size,
+                update_conflicts=True,
+                unique_fields=['tile', 'date', 'product_type'],
+                update_fields=['preview_path', 'product_path']
+            )
+
+            for start in range(0, len(stale), batch_size):
+                condition = Q()
+                for tile, date_obj in stale[start:start + batch_size]:
+                    condition |= Q(tile=tile, date=date_obj)
+                SatelliteImage.objects.filter(condition, product_type=product_type).delete()
+
+            # Сводка для /api/stats/ пересчитывается в той же транзакции, что и
+            # запись снимков: других путей записи в SatelliteImage нет, а данные,
+            # проиндексированные до появления сводки, заполнила миграция 0008
+            if to_write or stale:
+                refresh_product_summary([product_type])
+
+        return created, updated, unchanged, len(stale)
+
+    def _manifest_path(self, data_dir):
+        return Path(data_dir) / 'index_files' / 'file_manifest.json'
+
+    def _load_manifest(self, data_dir):
+        """Манифест прошлого запуска ({} если его нет или он поврежден)"""
+        try:
+            with open(self._manifest_path(data_dir), encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+        if data.get('version') != MANIFEST_VERSION:
+            return {}
+        return data.get('products', {})
+
+    def _save_manifest(self, data_dir, manifest):
+        """Атомарная запись манифеста (через временный файл и rename)"""
+        manifest_path = self._manifest_path(data_dir)
+        manifest_path.parent.mkdir(parents=True, exist_ok=True)
+
+        tmp_path = manifest_path.with_name(f'{manifest_path.name}.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': MANIFEST_VERSION, 'products': manifest}, f, ensure_ascii=False)
+        os.replace(tmp_path, manifest_path)
+
+    def _create_index_files(self, product_type, data_dir, chunk_size=2000):
+        """
+        Создает индекс-файлы потоково, за два прохода по базе.
+
+        - preview_<product>.txt: список путей превью (новые сначала);
+        - preview_<product>.json: JSON-массив записей в том же порядке;
+        - preview_<product>.ndjson: по записи JSON на строку;
+        - shards/<product>/<year>/<tile>.ndjson: срезы по году и тайлу;
+        - shards/manifest.json: список срезов с количеством записей и sha256.
+
+        Память не зависит от размера архива: записи читаются через
+        .iterator(). Первый проход в порядке -date пишет общие файлы,
+        второй в порядке (tile, -date) - срезы, поэтому каждый срез пишется
+        целиком и открыт одновременно только один файл среза.
+        """
         try:
             index_dir = Path(data_dir) / 'index_files'
-            index_dir.mkdir(exist_ok=True)
-
-            # Получаем все файлы для данного типа продукта из базы
-            images = SatelliteImage.objects.filter(product_type=product_type).order_by('-date')
+            shards_root = index_dir / 'shards'
+            shards_root.mkdir(parents=True, exist_ok=True)
+
+            # Новые срезы пишутся во временную директорию и подменяют старые целиком
+            shards_tmp = shards_root / f'{product_type}.tmp'
+            shutil.rmtree(shards_tmp, ignore_errors=True)
+
+            def records(*ordering):
+                images = SatelliteImage.objects.filter(product_type=product_type) \
+                    .order_by(*ordering) \
+                    .values_list('tile', 'date', 'preview_path', 'product_path') \
+                    .iterator(chunk_size=chunk_size)
+                for tile, date_obj, preview_path, product_path in images:
+                    yield tile, date_obj, preview_path, {
+                        'tile': tile,
+                        'date': date_obj.strftime('%Y-%m-%d'),
+                        'preview_path': preview_path,
+                        'product_path': product_path,
+                        'product_type': product_type
+                    }
 
-            # TXT файл (простой список путей)
             txt_file = index_dir / f'preview_{product_type}.txt'
-            with open(txt_file, 'w', encoding='utf-8') as f:
-                for image in images:
-                    f.write(f"{image.preview_path}\n")
-
-            # JSON файл
             json_file = index_dir / f'preview_{product_type}.json'
-            json_data = []
-            for image in images:
-                json_data.append({
-                    'tile': image.tile,
-                    'date': image.date.strftime('%Y-%m-%d'),
-                    'preview_path': image.preview_path,
-                    'product_path': image.product_path,
-                    'product_type': image.product_type
-                })
-
-            with open(json_file, 'w', encoding='utf-8') as f:
-                json.dump(json_data, f, indent=2, ensure_ascii=False)
+            ndjson_file = index_dir / f'preview_{product_type}.ndjson'
+
+            total = _IndexWriter(ndjson_file.with_name(f'{ndjson_file.name}.tmp'))
+            with open(txt_file.with_name(f'{txt_file.name}.tmp'), 'w', encoding='utf-8') as txt, \
+                    open(json_file.with_name(f'{json_file.name}.tmp'), 'w', encoding='utf-8') as json_out:
+                # Массив пишется по элементу в том же виде, что json.dump(..., indent=2)
+                separator = '[\n'
+                for _, _, preview_path, record in records('-date'):
+                    item = json.dumps(record, indent=2, ensure_ascii=False)
+                    json_out.write(separator + '  ' + item.replace('\n', '\n  '))
+                    separator = ',\n'
+                    txt.write(f"{preview_path}\n")
+                    total.write(json.dumps(record, ensure_ascii=False) + '\n')
+                json_out.write('[]' if separator == '[\n' else '\n]')
+            _, summary = total.close()
+
+            shards = []
+            shard = None
+            for tile, date_obj, _, record in records('tile', '-date'):
+                shard_key = (date_obj.year, tile)
+                if shard is None or shard.key != shard_key:
+                    if shard is not None:
+                        shards.append(shard.close())
+                    shard_path = shards_tmp / str(date_obj.year) / f'{tile}.ndjson'
+                    shard = _IndexWriter(shard_path, shard_key)
+                shard.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+            if shard is not None:
+                shards.append(shard.close())
+
+            os.replace(txt_file.with_name(f'{txt_file.name}.tmp'), txt_file)
+            os.replace(json_file.with_name(f'{json_file.name}.tmp'), json_file)
+            os.replace(total.path, ndjson_file)
+
+            shards_dir = shards_root / product_type
+            shards_old = shards_root / f'{product_type}.old'
+            shutil.rmtree(shards_old, ignore_errors=True)
+            if shards_dir.exists():
+                os.replace(shards_dir, shards_old)
+            if shards_tmp.exists():
+                os.replace(shards_tmp, shards_dir)
+            shutil.rmtree(shards_old, ignore_errors=True)
+
+            manifest_file = self._update_shards_manifest(shards_root, product_type, {
+                'file': ndjson_file.name,
+                'count': summary['count'],
+                'bytes': summary['bytes'],
+                'sha256': summary['sha256'],
+                'shards': [
+                    {
+                        'path': f'{product_type}/{year}/{tile}.ndjson',
+                        'year': year,
+                        'tile': tile,
+                        'count': info['count'],
+                        'bytes': info['bytes'],
+                        'sha256': info['sha256'],
+                    }
+                    for (year, tile), info in sorted(shards, key=lambda item: item[0])
+                ]
+            })
 
             self.stdout.write(f"  📁 Созданы индекс-файлы для {product_type}:")
             self.stdout.write(f"    - {txt_file}")
             self.stdout.write(f"    - {json_file}")
+            self.stdout.write(f"    - {ndjson_file}")
+            self.stdout.write(f"    - {manifest_file} ({len(shards)} срезов)")
         except Exception as e:
-            self.stdout.write(f"  ❌ Ошибка создания индекс-файлов: {e}")
\ No newline at end of file
+            self.stdout.write(f"  ❌ Ошибка создания индекс-файлов: {e}")
+
+    def _update_shards_manifest(self, shards_root, product_type, entry):
+        """Заменяет раздел продукта в shards/manifest.json (атомарно)"""
+        manifest_file = shards_root / 'manifest.json'
+        try:
+            with open(manifest_file, encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = {}
+
+        manifest.setdefault('products', {})[product_type] = entry
+        manifest['generated_at'] = datetime.now().isoformat(timespec='seconds')
+
+        tmp_file = manifest_file.with_name(f'{manifest_file.name}.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, manifest_file)
+        return manifest_file
+
+
+class _IndexWriter:
+    """NDJSON-файл, для которого по ходу записи считаются строки, байты и sha256"""
+
+    def __init__(self, path, key=None):
+        self.path = path
+        self.key = key
+        self.count = 0
+        self.size = 0
+        self.digest = hashlib.sha256()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(path, 'wb')
+
+    def write(self, line):
+        data = line.encode('utf-8')
+        self.file.write(data)
+        self.digest.update(data)
+        self.count += 1
+        self.size += len(data)
+
+    def close(self):
+        self.file.close()
+        return self.key, {'count': self.count, 'bytes': self.size, 'sha256': self.digest.hexdigest()}
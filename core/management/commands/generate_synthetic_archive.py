@@ -0,0 +1,167 @@
+import io
+import os
+import random
+import string
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+from core.footprints import write_footprints
+
+PRODUCTS = ('TCI', 'NDVI', 'NDWI')
+
+# Сколько разных вариантов файла рендерится на продукт; дальше они
+# повторяются, иначе генерация 100k сцен упирается в кодирование JPEG/TIFF
+VARIANTS = 8
+
+
+def synthetic_tiles(count, seed=0):
+    """Имена тайлов в формате MGRS (T45VUC), детерминированные по seed"""
+    rng = random.Random(seed)
+    tiles = set()
+    while len(tiles) < count:
+        zone = rng.randint(1, 60)
+        band = rng.choice('CDEFGHJKLMNPQRSTUVWX')
+        square = ''.join(rng.choice(string.ascii_uppercase) for _ in range(2))
+        tiles.add(f'T{zone:02d}{band}{square}')
+    return sorted(tiles)
+
+
+def synthetic_footprint(tile):
+    """
+    Охват тайла 1x1 градус внутри его зоны UTM и широтного пояса
+    (приближение для бенчмарков, а не настоящая сетка MGRS)
+    """
+    zone, band, square = int(tile[1:3]), tile[3], tile[4:6]
+    west = -180 + (zone - 1) * 6 + (ord(square[0]) - ord('A')) % 6
+    south = -80 + 'CDEFGHJKLMNPQRSTUVWX'.index(band) * 8 + (ord(square[1]) - ord('A')) % 8
+    return west, south, west + 1, south + 1
+
+
+def _render_preview(rng, size):
+    width, height = size, max(1, size * 2 // 3)
+    pixels = (rng.random((height, width, 3)) * 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format='JPEG', quality=80)
+    return buffer.getvalue()
+
+
+def _render_product(rng, product_type, size):
+    width, height = size, max(1, size * 2 // 3)
+    if product_type == 'TCI':
+        image = Image.fromarray((rng.random((height, width, 3)) * 255).astype(np.uint8))
+    else:
+        image = Image.fromarray((rng.random((height, width)) * 2 - 1).astype(np.float32), 'F')
+
+    buffer = io.BytesIO()
+    image.save(buffer, format='TIFF', compression='tiff_adobe_deflate')
+    return buffer.getvalue()
+
+
+def generate_archive(root, tiles=10, dates=100, products=PRODUCTS, start_date='2024-01-01',
+                     step_days=5, preview_size=256, product_size=256, missing_products=0.0, seed=0):
+    """
+    Синтетическое дерево Sentinel-2/{preview/<product>,<product>}/<год> в root
+    и реестр охватов тайлов index_files/tile_footprints.json.
+
+    tiles * dates * len(products) сцен; у доли missing_products сцен нет
+    файла продукта (как NOT_FOUND в реальных данных). Возвращает число
+    записанных файлов превью и продуктов.
+    """
+    rng = np.random.default_rng(seed)
+    picker = random.Random(seed)
+    base_path = Path(root) / 'Sentinel-2'
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+
+    previews = {product: [_render_preview(rng, preview_size) for _ in range(VARIANTS)] for product in products}
+    rasters = {product: [_render_product(rng, product, product_size) for _ in range(VARIANTS)] for product in products}
+
+    written_previews = written_products = 0
+    tile_names = synthetic_tiles(tiles, seed)
+    write_footprints(
+        os.path.join(root, 'index_files', 'tile_footprints.json'),
+        {tile: synthetic_footprint(tile) for tile in tile_names}
+    )
+
+    for index in range(dates):
+        moment = start + timedelta(days=index * step_days, seconds=picker.randint(36000, 43200))
+        stamp = moment.strftime('%Y%m%dT%H%M%S')
+        year = str(moment.year)
+
+        for product_type in products:
+            preview_dir = base_path / 'preview' / product_type / year
+            product_dir = base_path / product_type / year
+            preview_dir.mkdir(parents=True, exist_ok=True)
+            product_dir.mkdir(parents=True, exist_ok=True)
+            extension = '.tiff' if product_type == 'TCI' else '.tif'
+
+            for tile in tile_names:
+                name = f'{tile}_{stamp}_{product_type}'
+                variant = picker.randrange(VARIANTS)
+
+                with open(preview_dir / f'{name}.jpg', 'wb') as f:
+                    f.write(previews[product_type][variant])
+                written_previews += 1
+
+                if picker.random() < missing_products:
+                    continue
+                with open(product_dir / f'{name}{extension}', 'wb') as f:
+                    f.write(rasters[product_type][variant])
+                written_products += 1
+
+    return written_previews, written_products
+
+
+class Command(BaseCommand):
+    help = 'Создает синтетический архив Sentinel-2 (маленькие настоящие JPG/TIFF) для тестов и бенчмарков'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', type=str, help='Директория, в которой создается Sentinel-2/')
+        parser.add_argument('--tiles', type=int, default=10, help='Число тайлов (по умолчанию 10)')
+        parser.add_argument('--dates', type=int, default=100, help='Число дат съемки (по умолчанию 100)')
+        parser.add_argument(
+            '--products',
+            type=str,
+            default=','.join(PRODUCTS),
+            help='Продукты через запятую (по умолчанию TCI,NDVI,NDWI)'
+        )
+        parser.add_argument('--start-date', type=str, default='2024-01-01', help='Первая дата (YYYY-MM-DD)')
+        parser.add_argument('--step-days', type=int, default=5, help='Шаг между датами в днях (по умолчанию 5)')
+        parser.add_argument('--preview-size', type=int, default=256, help='Ширина превью в пикселях')
+        parser.add_argument('--product-size', type=int, default=256, help='Ширина растра продукта в пикселях')
+        parser.add_argument(
+            '--missing-products',
+            type=float,
+            default=0.0,
+            help='Доля сцен без файла продукта (0..1)'
+        )
+        parser.add_argument('--seed', type=int, default=0, help='Начальное значение генератора')
+
+    def handle(self, *args, **options):
+        products = [product.strip() for product in options['products'].split(',') if product.strip()]
+        if not products:
+            raise CommandError('Не указано ни одного продукта')
+        unknown = set(products) - set(PRODUCTS)
+        if unknown:
+            raise CommandError(f'Неизвестные продукты: {", ".join(sorted(unknown))}')
+
+        os.makedirs(options['output'], exist_ok=True)
+        previews, rasters = generate_archive(
+            options['output'],
+            tiles=options['tiles'],
+            dates=options['dates'],
+            products=products,
+            start_date=options['start_date'],
+            step_days=options['step_days'],
+            preview_size=options['preview_size'],
+            product_size=options['product_size'],
+            missing_products=options['missing_products'],
+            seed=options['seed'],
+        )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово! Сцен: {previews // len(products)} на продукт, файлов превью: {previews}, "
+            f"файлов продуктов: {rasters}"
+        ))
@@ -0,0 +1,118 @@
+import json
+import os
+import xml.etree.ElementTree as ET
+from django.conf import settings
+from django.core.management.base import CommandError
+from core.catalog import bump_catalog_version
+from core.footprints import load_footprints, write_footprints
+from core.metrics import InstrumentedCommand
+from core.models import SatelliteImage
+
+# Свойства GeoJSON, в которых ищется имя тайла
+NAME_PROPERTIES = ('tile', 'Name', 'name', 'tile_id', 'TILE_ID')
+
+
+def normalize_tile(name):
+    """'45VUC' (сетка ESA) -> 'T45VUC', как в именах файлов снимков"""
+    name = name.strip().upper()
+    return name if name.startswith('T') else f'T{name}'
+
+
+def points_bbox(points):
+    """Охват точек (lon, lat); полигон через антимеридиан дает запад > восток"""
+    lons = [point[0] for point in points]
+    lats = [point[1] for point in points]
+    west, east = min(lons), max(lons)
+
+    if east - west > 180:
+        west = min(lon for lon in lons if lon >= 0)
+        east = max(lon for lon in lons if lon < 0)
+    return west, min(lats), east, max(lats)
+
+
+def _flatten(coordinates):
+    if coordinates and isinstance(coordinates[0], (int, float)):
+        yield coordinates
+        return
+    for item in coordinates:
+        yield from _flatten(item)
+
+
+def read_geojson(path):
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+
+    for feature in data.get('features', []):
+        properties = feature.get('properties') or {}
+        name = next((properties[key] for key in NAME_PROPERTIES if properties.get(key)), None)
+        geometry = feature.get('geometry') or {}
+        points = list(_flatten(geometry.get('coordinates') or []))
+        if name and points:
+            yield normalize_tile(str(name)), points_bbox(points)
+
+
+def read_kml(path):
+    """Placemark сетки тайлов Sentinel-2 (KML ESA); читается потоково"""
+    for _, element in ET.iterparse(path):
+        if not element.tag.endswith('Placemark'):
+            continue
+
+        name = next((child.text for child in element if child.tag.endswith('name')), None)
+        points = [
+            tuple(float(value) for value in point.split(',')[:2])
+            for polygon in element.iter() if polygon.tag.endswith('Polygon')
+            for coordinates in polygon.iter() if coordinates.tag.endswith('coordinates')
+            for point in (coordinates.text or '').split()
+        ]
+        element.clear()
+
+        if name and points:
+            yield normalize_tile(name), points_bbox(points)
+
+
+class Command(InstrumentedCommand):
+    help = 'Загружает охваты тайлов MGRS из KML/GeoJSON сетки Sentinel-2 в реестр для /api/search/'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', type=str, help='Файл сетки тайлов (.kml, .geojson, .json)')
+        parser.add_argument(
+            '--only-indexed',
+            action='store_true',
+            help='Сохранить только тайлы, которые есть в базе'
+        )
+        parser.add_argument(
+            '--merge',
+            action='store_true',
+            help='Дополнить существующий реестр вместо замены'
+        )
+
+    def handle(self, *args, **options):
+        source = options['source']
+        if not os.path.isfile(source):
+            raise CommandError(f'Файл не найден: {source}')
+
+        reader = read_kml if source.lower().endswith('.kml') else read_geojson
+        try:
+            footprints = dict(reader(source))
+        except (ET.ParseError, ValueError) as e:
+            raise CommandError(f'Не удалось прочитать {source}: {e}')
+
+        read_count = len(footprints)
+        if options['only_indexed']:
+            indexed = set(SatelliteImage.objects.values_list('tile', flat=True).distinct())
+            footprints = {tile: bbox for tile, bbox in footprints.items() if tile in indexed}
+
+        path = settings.TILE_FOOTPRINTS_FILE
+        if options['merge'] and os.path.exists(path):
+            footprints = {**load_footprints(path), **footprints}
+
+        write_footprints(path, footprints)
+        # Ответы /api/search/ кэшируются по версии каталога
+        bump_catalog_version()
+
+        indexed_tiles = set(SatelliteImage.objects.values_list('tile', flat=True).distinct())
+        uncovered = len(indexed_tiles - set(footprints))
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово! Прочитано тайлов: {read_count}, в реестре: {len(footprints)}, "
+            f"тайлов из базы без охвата: {uncovered}"
+        ))
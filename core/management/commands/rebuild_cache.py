@@ -1,16 +1,24 @@
-from django.core.management.base import BaseCommand
 from django.core.cache import cache
-from core.utils import get_available_dates
+from core.apicache import cached_catalog_data
+from core.metrics import InstrumentedCommand
+from core.utils import get_product_stats
 
 
-class Command(BaseCommand):
-    help = 'Перестраивает кэш доступных дат'
+class Command(InstrumentedCommand):
+    help = 'Заполняет общий кэш API статистикой по продуктам для текущей версии каталога'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help='Сначала удалить все записи кэша (включая прошлые версии каталога)'
+        )
 
     def handle(self, *args, **options):
-        cache.delete('available_dates_all')
+        if options['clear']:
+            cache.clear()
 
-        for product_type in ['TC', 'NDVI', 'NDWI']:
-            cache_key = f'available_dates_{product_type}'
-            dates = get_available_dates(product_type)
-            cache.set(cache_key, dates, 3600)  
-            self.stdout.write(f"Кэш обновлен для {product_type}: {len(dates)} дат")
\ No newline at end of file
+        # Списки дат общий кэш не хранит: их отдает каталог в памяти каждого процесса
+        stats = cached_catalog_data('stats', [], get_product_stats)
+        for product_type, product in stats.items():
+            self.stdout.write(f"Кэш обновлен для {product_type}: {product['count']} снимков")
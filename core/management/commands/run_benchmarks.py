@@ -0,0 +1,378 @@
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+import django
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from core import difference, metrics, renditions, tiles
+from core.management.commands.generate_synthetic_archive import PRODUCTS, generate_archive, synthetic_footprint
+from core.models import SatelliteImage
+
+# Запросов в проходе измерения памяти (под tracemalloc задержки не замеряются)
+MEMORY_ITERATIONS = 20
+
+
+def percentile(values, p):
+    """Перцентиль по методу ближайшего ранга (values отсортированы)"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, math.ceil(p / 100 * len(values)) - 1))]
+
+
+def scale_shape(scenes, products=len(PRODUCTS)):
+    """(тайлов, дат) для архива примерно из scenes сцен"""
+    per_product = max(1, scenes // products)
+    tile_count = max(1, round(math.sqrt(per_product / 10)))
+    return tile_count, math.ceil(per_product / tile_count)
+
+
+class Command(BaseCommand):
+    help = (
+        'Бенчмарк API и команд на синтетических архивах: p50/p95/p99, пропускная '
+        'способность и пиковая память (tracemalloc); результаты в JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scales',
+            type=str,
+            default='1000,10000,100000',
+            help='Размеры архивов в сценах через запятую (по умолчанию 1000,10000,100000)'
+        )
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=200,
+            help='Запросов на эндпоинт (по умолчанию 200)'
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            default='benchmark_results.json',
+            help='Файл для результатов (JSON)'
+        )
+        parser.add_argument(
+            '--compare',
+            type=str,
+            help='JSON прошлого запуска: вывести изменение p95 и времени команд'
+        )
+        parser.add_argument(
+            '--workdir',
+            type=str,
+            help='Рабочая директория для архивов и кэшей (по умолчанию временная)'
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Не удалять сгенерированные архивы'
+        )
+        parser.add_argument(
+            '--with-stats',
+            action='store_true',
+            help='Включить compute_raster_stats (долго на больших архивах)'
+        )
+        parser.add_argument('--seed', type=int, default=0, help='Начальное значение генератора')
+
+    def handle(self, *args, **options):
+        try:
+            scales = [int(scale) for scale in options['scales'].split(',') if scale.strip()]
+        except ValueError:
+            raise CommandError('--scales: ожидаются целые числа через запятую')
+
+        workdir = Path(options['workdir'] or tempfile.mkdtemp(prefix='space-bench-'))
+        workdir.mkdir(parents=True, exist_ok=True)
+
+        results = {
+            'created_at': datetime.now().isoformat(),
+            'environment': {
+                'python': sys.version.split()[0],
+                'django': django.get_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+            },
+            'iterations': options['iterations'],
+            'scales': {},
+        }
+
+        # Отдельная тестовая база: рабочая база не затрагивается
+        setup_test_environment(debug=False)
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+
+        try:
+            for scale in scales:
+                self.stdout.write(self.style.SUCCESS(f"\n=== {scale} сцен ==="))
+                results['scales'][str(scale)] = self._run_scale(scale, workdir / str(scale), options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            if not options['keep']:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+        with open(options['output'], 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"\nРезультаты сохранены в {options['output']}"))
+
+        if options['compare']:
+            self._compare(options['compare'], results)
+
+    def _run_scale(self, scale, root, options):
+        tile_count, date_count = scale_shape(scale)
+        data_root = root / 'data'
+        cache_root = root / 'cache'
+
+        started = time.perf_counter()
+        generate_archive(data_root, tiles=tile_count, dates=date_count, seed=options['seed'])
+        generate_seconds = time.perf_counter() - started
+        self.stdout.write(f"  Архив: {tile_count} тайлов x {date_count} дат за {generate_seconds:.1f} с")
+
+        overrides = override_settings(
+            DATA_ROOT=str(data_root),
+            MEDIA_ROOT=str(data_root),
+            DIFF_CACHE_DIR=str(data_root / 'diff_results'),
+            TILE_CACHE_DIR=str(cache_root / 'tiles'),
+            RENDITION_CACHE_DIR=str(cache_root / 'renditions'),
+            TILE_FOOTPRINTS_FILE=str(data_root / 'index_files' / 'tile_footprints.json'),
+            CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': str(cache_root / 'django'),
+            }},
+        )
+
+        with overrides:
+            # Дисковые кэши создаются один раз на процесс по текущим настройкам
+            tiles._tile_cache = None
+            renditions._rendition_cache = None
+            difference._difference_cache = None
+
+            call_command('flush', interactive=False, verbosity=0)
+            commands = self._run_commands(data_root, options)
+            endpoints = self._run_endpoints(options)
+
+        return {
+            'scenes': SatelliteImage.objects.count(),
+            'tiles': tile_count,
+            'dates': date_count,
+            'generate_seconds': generate_seconds,
+            'commands': commands,
+            'endpoints': endpoints,
+        }
+
+    def _run_commands(self, data_root, options):
+        """
+        Время, пиковая память и счетчики операций команд (каждая выполняется
+        один раз под tracemalloc)
+        """
+        steps = [
+            ('generate_index', ['generate_index', '--data-dir', str(data_root)]),
+            ('generate_index_incremental', ['generate_index', '--incremental', '--data-dir', str(data_root)]),
+            ('check_data', ['check_data']),
+        ]
+        if options['with_stats']:
+            steps.append(('compute_raster_stats', ['compute_raster_stats']))
+
+        results = {}
+        for name, argv in steps:
+            with open(os.devnull, 'w') as devnull:
+                before = metrics.current().snapshot()
+                tracemalloc.start()
+                started = time.perf_counter()
+                call_command(*argv, stdout=devnull, stderr=devnull)
+                seconds = time.perf_counter() - started
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                operations = metrics.current().since(before).timings
+
+            results[name] = {
+                'seconds': seconds,
+                'peak_memory_bytes': peak,
+                'operations': {
+                    kind: {'count': count, 'seconds': kind_seconds}
+                    for kind, (count, kind_seconds) in sorted(operations.items())
+                },
+            }
+            self.stdout.write(f"  {name}: {seconds:.2f} с, пик памяти {peak / 1024 / 1024:.1f} МБ")
+
+        return results
+
+    def _request_factories(self, rng):
+        """Имя эндпоинта -> функция, возвращающая (url, заголовки) очередного запроса"""
+        images = list(
+            SatelliteImage.objects.exclude(product_path='NOT_FOUND')
+            .values_list('id', 'tile', 'date', 'product_type', 'product_path')[:1000]
+        )
+        if not images:
+            raise CommandError('Синтетический архив не проиндексирован')
+
+        def pick():
+            return rng.choice(images)
+
+        def image_for_date():
+            _, _, date, product, _ = pick()
+            return f'/api/image-for-date/?date={date.isoformat()}&product={product}', {}
+
+        def timeline():
+            _, _, date, product, _ = pick()
+            return f'/api/timeline/?product={product}&from={date.year}-01-01&to={date.year}-12-31', {}
+
+        def timeseries():
+            _, tile, _, _, _ = pick()
+            return f'/api/timeseries/?product=NDVI&tile={tile}', {}
+
+        def search():
+            _, tile, date, product, _ = pick()
+            west, south, east, north = synthetic_footprint(tile)
+            bbox = f'{west - 0.5},{south - 0.5},{east + 0.5},{north + 0.5}'
+            return f'/api/search/?bbox={bbox}&product={product}&from={date.year}-01-01&to={date.year}-12-31', {}
+
+        def download_range():
+            path = pick()[4]
+            return f'/download-product/?path={path}', {'HTTP_RANGE': 'bytes=0-65535'}
+
+        def download_full():
+            return f'/download-product/?path={pick()[4]}', {}
+
+        def map_tile():
+            _, tile, date, product, _ = pick()
+            return f'/tiles/{product}/{date.isoformat()}/0/0/0.png?tile={tile}', {}
+
+        def preview():
+            return f'/preview/{pick()[0]}/?w=256&fmt=jpeg', {}
+
+        return {
+            'available_dates': lambda: (f'/api/available-dates/?product={rng.choice(PRODUCTS)}', {}),
+            'image_for_date': image_for_date,
+            'timeline': timeline,
+            'stats': lambda: ('/api/stats/', {}),
+            'timeseries': timeseries,
+            'search': search,
+            'download_range': download_range,
+            'download_full': download_full,
+            'map_tile': map_tile,
+            'preview_rendition': preview,
+        }
+
+    def _clear_caches(self):
+        """Сбрасывает кэш ответов API и дисковые кэши тайлов и копий превью"""
+        cache.clear()
+        for disk_cache in (tiles.tile_cache(), renditions.rendition_cache()):
+            shutil.rmtree(disk_cache.root, ignore_errors=True)
+        tiles._tile_cache = None
+        renditions._rendition_cache = None
+
+    def _request(self, client, url, headers):
+        response = client.get(url, **headers)
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        response.close()
+        return response.status_code
+
+    def _run_series(self, client, requests, cold):
+        """
+        Задержки серии запросов. В холодной серии кэши сбрасываются перед
+        каждым запросом (сброс в замер не входит).
+        """
+        latencies = []
+        statuses = Counter()
+        elapsed = 0.0
+
+        for url, headers in requests:
+            if cold:
+                self._clear_caches()
+            request_started = time.perf_counter()
+            statuses[self._request(client, url, headers)] += 1
+            latency = time.perf_counter() - request_started
+            latencies.append(latency)
+            elapsed += latency
+
+        latencies.sort()
+        return {
+            'requests': len(requests),
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'mean_ms': sum(latencies) / len(latencies) * 1000,
+            'throughput_rps': len(requests) / elapsed if elapsed else None,
+            'statuses': {str(code): count for code, count in sorted(statuses.items())},
+        }
+
+    def _run_endpoints(self, options):
+        """
+        Две серии на эндпоинт: cold - каждый запрос с пустыми кэшами,
+        warm - те же запросы повторно после прогревочного прохода
+        """
+        client = Client()
+        rng = random.Random(options['seed'])
+        iterations = max(1, options['iterations'])
+        results = {}
+
+        for name, factory in self._request_factories(rng).items():
+            requests = [factory() for _ in range(iterations)]
+
+            cold = self._run_series(client, requests, cold=True)
+            for url, headers in requests:
+                self._request(client, url, headers)
+            warm = self._run_series(client, requests, cold=False)
+
+            tracemalloc.start()
+            for url, headers in requests[:MEMORY_ITERATIONS]:
+                self._request(client, url, headers)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            results[name] = {'cold': cold, 'warm': warm, 'peak_memory_bytes': peak}
+            self.stdout.write(
+                f"  {name}: холодный p50 {cold['p50_ms']:.2f} мс, p95 {cold['p95_ms']:.2f} мс; "
+                f"теплый p50 {warm['p50_ms']:.2f} мс, p95 {warm['p95_ms']:.2f} мс, "
+                f"{warm['throughput_rps']:.0f} запр/с"
+            )
+
+        return results
+
+    def _compare(self, path, results):
+        """Изменение p95 эндпоинтов и времени команд относительно прошлого запуска"""
+        try:
+            with open(path, encoding='utf-8') as f:
+                previous = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Не удалось прочитать {path}: {e}')
+
+        self.stdout.write(self.style.SUCCESS(f"\nСравнение с {path}"))
+        for scale, current in results['scales'].items():
+            before = previous.get('scales', {}).get(scale)
+            if before is None:
+                continue
+
+            self.stdout.write(f"  {scale} сцен:")
+            pairs = [
+                (f'{name} p95 {series}', metrics[series]['p95_ms'],
+                 before['endpoints'].get(name, {}).get(series, {}).get('p95_ms'))
+                for name, metrics in current['endpoints'].items()
+                for series in ('cold', 'warm')
+            ] + [
+                (name, metrics['seconds'], before['commands'].get(name, {}).get('seconds'))
+                for name, metrics in current['commands'].items()
+            ]
+
+            for label, now, was in pairs:
+                if not was:
+                    continue
+                change = (now - was) / was * 100
+                style = self.style.WARNING if change > 10 else (lambda text: text)
+                self.stdout.write(style(f"    {label}: {was:.2f} -> {now:.2f} ({change:+.1f}%)"))
@@ -0,0 +1,114 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from core.jobs import claim_next_job, finish_job, requeue_orphaned_jobs, worker_name
+from core.metrics import InstrumentedCommand
+from core.models import DifferenceJob
+from core.workers import init_worker, run_difference
+
+
+class Command(InstrumentedCommand):
+    help = 'Выполняет задания на расчет разницы из очереди в пуле процессов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Число процессов-воркеров (по умолчанию число CPU)'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=1.0,
+            help='Период опроса очереди в секундах (по умолчанию 1)'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Выполнить задания, которые есть в очереди, и завершиться'
+        )
+
+    def _pool(self, concurrency):
+        # spawn вместо fork: дочерние процессы не наследуют открытые
+        # соединения SQLite главного процесса
+        return ProcessPoolExecutor(
+            max_workers=concurrency,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_worker,
+        )
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+        poll_interval = options['poll_interval']
+        worker = worker_name()
+
+        requeued = requeue_orphaned_jobs()
+        if requeued:
+            self.stdout.write(f"Возвращено в очередь прерванных заданий: {requeued}")
+
+        self.stdout.write(f"Воркер {worker}: процессов {concurrency}")
+
+        pool = self._pool(concurrency)
+        running = {}
+        processed = 0
+
+        try:
+            while True:
+                while len(running) < concurrency:
+                    job = claim_next_job(worker)
+                    if job is None:
+                        break
+
+                    future = pool.submit(
+                        run_difference, job.date1.isoformat(), job.date2.isoformat(), job.product_type, job.tile
+                    )
+                    running[future] = job
+                    self.stdout.write(f"  ▶ Задание {job.id}: {job}")
+
+                if not running:
+                    if options['once']:
+                        break
+                    time.sleep(poll_interval)
+                    continue
+
+                done, _ = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                broken = False
+
+                for future in done:
+                    job = running.pop(future)
+                    try:
+                        result = future.result()
+                    except BrokenProcessPool as e:
+                        broken = True
+                        result = {'status': 'error', 'message': f'Процесс воркера аварийно завершился: {e}'}
+                    except Exception as e:
+                        result = {'status': 'error', 'message': str(e)}
+
+                    finish_job(job.id, result)
+                    processed += 1
+
+                    if result.get('status') == 'success':
+                        self.stdout.write(self.style.SUCCESS(f"  ✅ Задание {job.id} выполнено"))
+                    else:
+                        self.stdout.write(self.style.WARNING(f"  ❌ Задание {job.id}: {result.get('message')}"))
+
+                if broken:
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    pool = self._pool(concurrency)
+
+        except KeyboardInterrupt:
+            self.stdout.write("Остановка воркера...")
+
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+            # Незавершенные задания вернутся в очередь для следующего запуска
+            for job in running.values():
+                DifferenceJob.objects.filter(id=job.id, status=DifferenceJob.RUNNING).update(
+                    status=DifferenceJob.QUEUED, worker='', started_at=None
+                )
+
+        self.stdout.write(self.style.SUCCESS(f"Готово! Выполнено заданий: {processed}"))
@@ -0,0 +1,91 @@
+from PIL import Image, UnidentifiedImageError
+from core.downloads import resolve_data_path
+from core.metrics import InstrumentedCommand
+from core.models import SatelliteImage
+from core.tiles import get_tile, max_zoom, tile_cache
+
+
+class Command(InstrumentedCommand):
+    help = 'Заранее генерирует тайлы карты мелких зумов для последних дат'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--product',
+            type=str,
+            help='Тип продукта (TCI, NDVI, NDWI); по умолчанию все'
+        )
+        parser.add_argument(
+            '--dates',
+            type=int,
+            default=5,
+            help='Сколько последних дат обработать для каждого продукта (по умолчанию 5)'
+        )
+        parser.add_argument(
+            '--max-zoom',
+            type=int,
+            default=2,
+            help='Максимальный зум для генерации (по умолчанию 2)'
+        )
+        parser.add_argument(
+            '--source',
+            choices=['preview', 'product'],
+            default='preview',
+            help='Из чего резать тайлы: превью или файл продукта'
+        )
+
+    def handle(self, *args, **options):
+        images = SatelliteImage.objects.all()
+        if options['product']:
+            images = images.filter(product_type=options['product'])
+
+        product_types = images.values_list('product_type', flat=True).distinct()
+        generated = 0
+        failed = 0
+
+        for product_type in product_types:
+            product_images = images.filter(product_type=product_type)
+            dates = list(
+                product_images.values_list('date', flat=True).distinct().order_by('-date')[:options['dates']]
+            )
+
+            for image in product_images.filter(date__in=dates).order_by('-date', 'tile'):
+                if options['source'] == 'product':
+                    relative_path = image.product_path
+                else:
+                    relative_path = image.preview_path
+
+                full_path = resolve_data_path(relative_path)
+                if relative_path == 'NOT_FOUND' or full_path is None or not full_path.is_file():
+                    self.stdout.write(f"  ⚠️ Файл не найден: {image}")
+                    continue
+
+                count = 0
+                try:
+                    with Image.open(full_path) as raster:
+                        zoom_limit = min(options['max_zoom'], max_zoom(*raster.size))
+
+                    for z in range(zoom_limit + 1):
+                        for x in range(2 ** z):
+                            for y in range(2 ** z):
+                                tile = get_tile(str(full_path), z, x, y)
+                                if tile is not None:
+                                    tile.close()
+                                    count += 1
+                except (ValueError, OSError, UnidentifiedImageError, Image.DecompressionBombError) as e:
+                    # Битый или слишком большой файл не прерывает прогрев остальных
+                    failed += 1
+                    self.stdout.write(f"  ⚠️ {image}: {e}")
+                    continue
+
+                generated += count
+                self.stdout.write(f"  ✅ {image}: {count} тайлов (зум 0-{zoom_limit})")
+
+        stats = tile_cache().stats()
+        self.stdout.write(self.style.SUCCESS(f"Готово! Тайлов: {generated}"))
+        if failed:
+            self.stdout.write(self.style.WARNING(f"Не удалось обработать файлов: {failed}"))
+        self.stdout.write(
+            f"Кэш тайлов: {stats['entries']} файлов, {stats['size_bytes'] / 1024 / 1024:.1f} МБ "
+            f"из {stats['max_bytes'] / 1024 / 1024:.0f} МБ; попаданий {stats['hits']}, "
+            f"промахов {stats['misses']}, вытеснено {stats['evictions']}"
+        )
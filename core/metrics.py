@@ -0,0 +1,211 @@
+"""
+Счетчики времени запроса: запросы к базе, операции с файлами, рендеринг.
+
+Счетчики запроса хранятся в contextvar (их ставит InstrumentationMiddleware);
+вне запроса, в том числе в management-командах и потоках их пулов,
+используются счетчики процесса. Завершенные запросы попадают в гистограммы
+процесса, которые отдает /metrics.
+"""
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.core.management.base import BaseCommand
+
+# Границы гистограммы длительности запросов, секунды
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metrics:
+    """Счетчики одного запроса или команды: {вид: [число операций, секунды]}"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.timings = {}
+        self._lock = threading.Lock()
+
+    def add(self, kind, seconds, count=1):
+        with self._lock:
+            entry = self.timings.setdefault(kind, [0, 0.0])
+            entry[0] += count
+            entry[1] += seconds
+
+    def snapshot(self):
+        """Копия счетчиков; время начала копии - момент снимка"""
+        copy = Metrics()
+        with self._lock:
+            copy.timings = {kind: list(entry) for kind, entry in self.timings.items()}
+        return copy
+
+    def since(self, snapshot):
+        """Прирост счетчиков после snapshot"""
+        delta = Metrics()
+        delta.started = snapshot.started
+        with self._lock:
+            for kind, (count, seconds) in self.timings.items():
+                before = snapshot.timings.get(kind, (0, 0.0))
+                if count > before[0]:
+                    delta.timings[kind] = [count - before[0], seconds - before[1]]
+        return delta
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        """Значение заголовка Server-Timing (длительности в миллисекундах)"""
+        parts = [f'total;dur={self.elapsed() * 1000:.1f}']
+        for kind, (count, seconds) in sorted(self.timings.items()):
+            parts.append(f'{kind};dur={seconds * 1000:.1f};desc="{count}"')
+        return ', '.join(parts)
+
+    def summary(self):
+        parts = [f'{self.elapsed():.2f} с']
+        for kind, (count, seconds) in sorted(self.timings.items()):
+            parts.append(f'{kind}: {count} за {seconds:.3f} с')
+        return '; '.join(parts)
+
+
+_current = ContextVar('core_metrics', default=None)
+_process_metrics = Metrics()
+
+
+def current():
+    return _current.get() or _process_metrics
+
+
+def start():
+    """Новые счетчики для текущего контекста: (token, metrics)"""
+    metrics = Metrics()
+    return _current.set(metrics), metrics
+
+
+def finish(token):
+    _current.reset(token)
+
+
+# Виды операций, замеряемые сейчас в потоке: вложенный блок того же вида
+# (put -> put_file, build -> read_catalog_version) не учитывается повторно
+_active = threading.local()
+
+
+@contextmanager
+def timed(kind):
+    """Учитывает время блока как одну операцию вида kind"""
+    active = _active.__dict__.setdefault('kinds', set())
+    if kind in active:
+        yield
+        return
+
+    active.add(kind)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        active.discard(kind)
+        current().add(kind, time.perf_counter() - started)
+
+
+def track(kind):
+    """Декоратор: каждый вызов функции - одна операция вида kind"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(kind):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def db_wrapper(execute, sql, params, many, context):
+    """execute_wrapper для всех соединений (подключается в CoreConfig.ready)"""
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        current().add('db', time.perf_counter() - started)
+
+
+class Registry:
+    """Гистограммы и счетчики запросов процесса по имени маршрута"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}
+        self.histograms = {}
+        self.timings = {}
+
+    def observe(self, view, status, metrics):
+        elapsed = metrics.elapsed()
+        with self._lock:
+            key = (view, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+            buckets, total = self.histograms.get(view, ([0] * len(LATENCY_BUCKETS), [0, 0.0]))
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if elapsed <= bound:
+                    buckets[index] += 1
+            total[0] += 1
+            total[1] += elapsed
+            self.histograms[view] = (buckets, total)
+
+            for kind, (count, seconds) in metrics.timings.items():
+                entry = self.timings.setdefault((view, kind), [0, 0.0])
+                entry[0] += count
+                entry[1] += seconds
+
+    def render(self):
+        """Текстовый формат Prometheus (счетчики только этого процесса)"""
+        with self._lock:
+            lines = [
+                '# HELP space_requests_total HTTP requests by route and status.',
+                '# TYPE space_requests_total counter',
+            ]
+            for (view, status), count in sorted(self.requests.items()):
+                lines.append(f'space_requests_total{{view="{view}",status="{status}"}} {count}')
+
+            lines += [
+                '# HELP space_request_duration_seconds Request wall time by route.',
+                '# TYPE space_request_duration_seconds histogram',
+            ]
+            for view, (buckets, (count, total)) in sorted(self.histograms.items()):
+                for bound, value in zip(LATENCY_BUCKETS, buckets):
+                    lines.append(f'space_request_duration_seconds_bucket{{view="{view}",le="{bound}"}} {value}')
+                lines.append(f'space_request_duration_seconds_bucket{{view="{view}",le="+Inf"}} {count}')
+                lines.append(f'space_request_duration_seconds_sum{{view="{view}"}} {total:.6f}')
+                lines.append(f'space_request_duration_seconds_count{{view="{view}"}} {count}')
+
+            lines += [
+                '# HELP space_operations_total Database and filesystem operations by route and kind.',
+                '# TYPE space_operations_total counter',
+            ]
+            for (view, kind), (count, _) in sorted(self.timings.items()):
+                lines.append(f'space_operations_total{{view="{view}",kind="{kind}"}} {count}')
+
+            lines += [
+                '# HELP space_operation_seconds_total Time spent in operations by route and kind.',
+                '# TYPE space_operation_seconds_total counter',
+            ]
+            for (view, kind), (_, seconds) in sorted(self.timings.items()):
+                lines.append(f'space_operation_seconds_total{{view="{view}",kind="{kind}"}} {seconds:.6f}')
+
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class InstrumentedCommand(BaseCommand):
+    """
+    Management-команда, которая по завершении пишет в stderr свои счетчики
+    (время, запросы к базе, операции с файлами). Вложенные через
+    call_command команды входят в счетчики вызвавшей.
+    """
+
+    def execute(self, *args, **options):
+        before = current().snapshot()
+        output = super().execute(*args, **options)
+        if options.get('verbosity', 1) >= 1:
+            self.stderr.write(f"Счетчики: {current().since(before).summary()}", style_func=lambda text: text)
+        return output
@@ -0,0 +1,47 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from . import metrics
+
+
+class InstrumentationMiddleware:
+    """
+    Счетчики запроса: общее время, запросы к базе, операции с файлами.
+
+    Добавляет заголовок Server-Timing и учитывает запрос в гистограммах
+    /metrics по имени маршрута. Для потоковых ответов учитывается время
+    до начала отдачи тела.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        token, request_metrics = metrics.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.finish(token)
+        return self._finish(request, response, request_metrics)
+
+    async def __acall__(self, request):
+        token, request_metrics = metrics.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.finish(token)
+        return self._finish(request, response, request_metrics)
+
+    def _finish(self, request, response, request_metrics):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match is not None else 'unmatched'
+
+        response['Server-Timing'] = request_metrics.server_timing()
+        metrics.registry.observe(view, response.status_code, request_metrics)
+        return response
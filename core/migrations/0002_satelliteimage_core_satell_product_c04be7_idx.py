@@ -0,0 +1,17 @@
+# Generated by Django 5.2.9 on 2026-10-18 05:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='satelliteimage',
+            index=models.Index(fields=['product_type', 'date'], name='core_satell_product_c04be7_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.9 on 2026-10-18 05:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_satelliteimage_core_satell_product_c04be7_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DifferenceJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date1', models.DateField()),
+                ('date2', models.DateField()),
+                ('product_type', models.CharField(max_length=10)),
+                ('tile', models.CharField(blank=True, default='', max_length=10)),
+                ('status', models.CharField(choices=[('queued', 'В очереди'), ('running', 'Выполняется'), ('done', 'Готово'), ('failed', 'Ошибка')], default='queued', max_length=10)),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, default='')),
+                ('worker', models.CharField(blank=True, default='', max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created_at'], name='core_differ_status_500b17_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status__in', ['queued', 'running'])), fields=('date1', 'date2', 'product_type', 'tile'), name='unique_active_difference_job')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-18 05:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_filechecksum'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='satelliteimage',
+            name='product_type',
+            field=models.CharField(choices=[('TCI', 'Естественные цвета (True Color)'), ('NDVI', 'NDVI'), ('NDWI', 'NDWI')], max_length=10),
+        ),
+    ]
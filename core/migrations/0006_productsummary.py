@@ -0,0 +1,29 @@
+# Generated by Django 5.2.9 on 2026-10-18 05:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_satelliteimage_tci_choice'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_type', models.CharField(max_length=10)),
+                ('year', models.IntegerField()),
+                ('tile', models.CharField(max_length=10)),
+                ('count', models.IntegerField()),
+                ('with_product', models.IntegerField()),
+                ('first_date', models.DateField()),
+                ('last_date', models.DateField()),
+            ],
+            options={
+                'unique_together': {('product_type', 'year', 'tile')},
+            },
+        ),
+    ]
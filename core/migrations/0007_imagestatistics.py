@@ -0,0 +1,33 @@
+# Generated by Django 5.2.9 on 2026-10-18 05:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_productsummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageStatistics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('min', models.FloatField(null=True)),
+                ('max', models.FloatField(null=True)),
+                ('mean', models.FloatField(null=True)),
+                ('std', models.FloatField(null=True)),
+                ('histogram', models.JSONField()),
+                ('histogram_min', models.FloatField()),
+                ('histogram_max', models.FloatField()),
+                ('valid_pixels', models.BigIntegerField()),
+                ('valid_fraction', models.FloatField()),
+                ('source_size', models.BigIntegerField()),
+                ('source_mtime_ns', models.BigIntegerField()),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('image', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='statistics', to='core.satelliteimage')),
+            ],
+        ),
+    ]
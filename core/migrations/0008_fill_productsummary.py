@@ -0,0 +1,38 @@
+from django.db import migrations
+from django.db.models import Count, Max, Min, Q
+from django.db.models.functions import ExtractYear
+
+
+def fill_product_summary(apps, schema_editor):
+    """
+    Сводка для снимков, проиндексированных до появления ProductSummary:
+    дальше ее поддерживает generate_index при каждой записи в SatelliteImage.
+    """
+    SatelliteImage = apps.get_model('core', 'SatelliteImage')
+    ProductSummary = apps.get_model('core', 'ProductSummary')
+
+    rows = (
+        SatelliteImage.objects.annotate(year=ExtractYear('date'))
+        .values('product_type', 'year', 'tile')
+        .annotate(
+            count=Count('id'),
+            with_product=Count('id', filter=~Q(product_path='NOT_FOUND')),
+            first_date=Min('date'),
+            last_date=Max('date'),
+        )
+        .order_by()
+    )
+
+    ProductSummary.objects.all().delete()
+    ProductSummary.objects.bulk_create([ProductSummary(**row) for row in rows])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_imagestatistics'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_product_summary, migrations.RunPython.noop),
+    ]
@@ -2,7 +2,7 @@ from django.db import models
 
 class SatelliteImage(models.Model):
     PRODUCT_TYPES = [
-        ('TC', 'Естественные цвета (True Color)'),
+        ('TCI', 'Естественные цвета (True Color)'),
         ('NDVI', 'NDVI'),
         ('NDWI', 'NDWI'),
     ]
@@ -15,6 +15,117 @@ class SatelliteImage(models.Model):
 
     class Meta:
         unique_together = ['tile', 'date', 'product_type']
+        indexes = [
+            # Поиск ближайшей даты для продукта в api_image_for_date
+            models.Index(fields=['product_type', 'date']),
+        ]
 
     def __str__(self):
-        return f"{self.tile}_{self.date}_{self.product_type}"
\ No newline at end of file
+        return f"{self.tile}_{self.date}_{self.product_type}"
+
+
+class ImageStatistics(models.Model):
+    """
+    Статистика растра продукта SatelliteImage (см. core.rasterstats).
+
+    source_size/source_mtime_ns - состояние файла при расчете:
+    compute_raster_stats пересчитывает только изменившиеся файлы.
+    """
+
+    image = models.OneToOneField(SatelliteImage, on_delete=models.CASCADE, related_name='statistics')
+    min = models.FloatField(null=True)
+    max = models.FloatField(null=True)
+    mean = models.FloatField(null=True)
+    std = models.FloatField(null=True)
+    histogram = models.JSONField()
+    histogram_min = models.FloatField()
+    histogram_max = models.FloatField()
+    valid_pixels = models.BigIntegerField()
+    valid_fraction = models.FloatField()
+    source_size = models.BigIntegerField()
+    source_mtime_ns = models.BigIntegerField()
+    computed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.image} (mean={self.mean})"
+
+
+class ProductSummary(models.Model):
+    """
+    Сводка по SatelliteImage в разрезе продукт/год/тайл.
+
+    Пересчитывается generate_index одним сгруппированным запросом,
+    /api/stats/ читает только эти строки.
+    """
+
+    product_type = models.CharField(max_length=10)
+    year = models.IntegerField()
+    tile = models.CharField(max_length=10)
+    count = models.IntegerField()
+    with_product = models.IntegerField()
+    first_date = models.DateField()
+    last_date = models.DateField()
+
+    class Meta:
+        unique_together = ['product_type', 'year', 'tile']
+
+    def __str__(self):
+        return f"{self.product_type}_{self.year}_{self.tile}: {self.count}"
+
+
+class DifferenceJob(models.Model):
+    """Задание на расчет разницы между снимками (очередь в SQLite)"""
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    STATUSES = [
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    ]
+
+    date1 = models.DateField()
+    date2 = models.DateField()
+    product_type = models.CharField(max_length=10)
+    tile = models.CharField(max_length=10, blank=True, default='')
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    worker = models.CharField(max_length=100, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Выбор следующего задания воркером
+            models.Index(fields=['status', 'created_at']),
+        ]
+        constraints = [
+            # Одинаковые задания не выполняются параллельно
+            models.UniqueConstraint(
+                fields=['date1', 'date2', 'product_type', 'tile'],
+                condition=models.Q(status__in=['queued', 'running']),
+                name='unique_active_difference_job',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.date1}_{self.date2}_{self.product_type}_{self.status}"
+
+
+class FileChecksum(models.Model):
+    """Контрольная сумма файла данных (путь относительно DATA_ROOT)"""
+
+    path = models.CharField(max_length=500, unique=True)
+    size = models.BigIntegerField()
+    mtime_ns = models.BigIntegerField()
+    sha256 = models.CharField(max_length=64)
+    checked_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.path} ({self.sha256[:12]})"
\ No newline at end of file
@@ -0,0 +1,81 @@
+import math
+
+import numpy as np
+
+from .difference import BLOCK_PIXELS, valid_mask
+from .tiff import TiffReader
+
+
+# Число интервалов гистограммы; границы зависят от типа данных (histogram_range)
+HISTOGRAM_BINS = 64
+
+
+def histogram_range(dtype):
+    """
+    Границы гистограммы: [-1, 1] для индексов в float, весь диапазон
+    типа для целых. Значения за границами попадают в крайние интервалы.
+    """
+    if dtype.kind == 'f':
+        return -1.0, 1.0
+    info = np.iinfo(dtype)
+    return float(info.min), float(info.max)
+
+
+def band_values(block, product_type):
+    """
+    Значения, по которым считается статистика: яркость (среднее каналов RGB)
+    для TCI, первый канал для индексов.
+    """
+    if product_type == 'TCI' and block.shape[2] >= 3:
+        return block[:, :, :3].astype(np.float64).mean(axis=2)
+    return block[:, :, 0].astype(np.float64)
+
+
+def compute_raster_stats(path, product_type, block_pixels=BLOCK_PIXELS):
+    """
+    Статистика продукта, прочитанного блоками строк: min, max, mean, std,
+    гистограмма из HISTOGRAM_BINS интервалов и доля валидных пикселей.
+
+    Среднее и дисперсия объединяются по блокам (формула Чана), поэтому
+    память не зависит от размера сцены и точность не теряется на больших n.
+    """
+    with TiffReader(path) as reader:
+        low, high = histogram_range(reader.dtype)
+        histogram = np.zeros(HISTOGRAM_BINS, dtype=np.int64)
+        count, mean, m2 = 0, 0.0, 0.0
+        minimum, maximum = math.inf, -math.inf
+
+        for _, block in reader.iter_row_blocks(reader.block_rows(block_pixels)):
+            values = band_values(block, product_type)[valid_mask(block, reader.nodata)]
+            if not values.size:
+                continue
+
+            block_count = values.size
+            block_mean = float(values.mean())
+            block_m2 = float(((values - block_mean) ** 2).sum())
+
+            delta = block_mean - mean
+            total = count + block_count
+            mean += delta * block_count / total
+            m2 += block_m2 + delta * delta * count * block_count / total
+            count = total
+
+            minimum = min(minimum, float(values.min()))
+            maximum = max(maximum, float(values.max()))
+
+            bins = ((values - low) * (HISTOGRAM_BINS / (high - low))).astype(np.int64)
+            histogram += np.bincount(np.clip(bins, 0, HISTOGRAM_BINS - 1), minlength=HISTOGRAM_BINS)
+
+        pixels = reader.width * reader.height
+
+    return {
+        'min': minimum if count else None,
+        'max': maximum if count else None,
+        'mean': mean if count else None,
+        'std': math.sqrt(m2 / count) if count else None,
+        'histogram': histogram.tolist(),
+        'histogram_min': low,
+        'histogram_max': high,
+        'valid_pixels': count,
+        'valid_fraction': count / pixels if pixels else 0.0,
+    }
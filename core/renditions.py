@@ -0,0 +1,116 @@
+import io
+import os
+import threading
+
+from django.conf import settings
+from PIL import Image, features
+
+from .diskcache import BoundedDiskCache
+from .metrics import track
+
+
+# Ширины округляются вверх до ближайшей из списка, чтобы кэш не разрастался
+# от произвольных ?w=
+RENDITION_WIDTHS = (64, 128, 256, 512, 1024, 2048)
+
+FORMATS = {
+    'webp': ('WEBP', 'image/webp', '.webp'),
+    'jpeg': ('JPEG', 'image/jpeg', '.jpg'),
+    'png': ('PNG', 'image/png', '.png'),
+}
+
+
+class RenditionBusy(Exception):
+    """Все слоты декодирования заняты дольше PREVIEW_DECODE_TIMEOUT"""
+
+
+_rendition_cache = None
+_decode_slots = None
+_init_lock = threading.Lock()
+
+
+def rendition_cache():
+    global _rendition_cache
+    if _rendition_cache is None:
+        _rendition_cache = BoundedDiskCache(
+            settings.RENDITION_CACHE_DIR, settings.RENDITION_CACHE_MAX_BYTES
+        )
+    return _rendition_cache
+
+
+def _slots():
+    """Семафор, ограничивающий число одновременных декодирований Pillow"""
+    global _decode_slots
+    with _init_lock:
+        if _decode_slots is None:
+            _decode_slots = threading.BoundedSemaphore(settings.PREVIEW_MAX_DECODES)
+    return _decode_slots
+
+
+def snap_width(width):
+    for allowed in RENDITION_WIDTHS:
+        if width <= allowed:
+            return allowed
+    return RENDITION_WIDTHS[-1]
+
+
+def available_formats():
+    return [name for name in FORMATS if name != 'webp' or features.check('webp')]
+
+
+@track('render')
+def render(source_path, width, fmt):
+    """Уменьшенная копия снимка в формате fmt (без увеличения маленьких)"""
+    pil_format = FORMATS[fmt][0]
+
+    with Image.open(source_path) as image:
+        if width < image.width:
+            height = max(1, round(image.height * width / image.width))
+            # Для JPEG декодирование сразу идет в уменьшенном масштабе
+            image.draft('RGB', (width, height))
+            image = image.resize((width, height), Image.LANCZOS, reducing_gap=2.0)
+
+        if image.mode not in ('RGB', 'RGBA', 'L'):
+            image = image.convert('RGB')
+        if pil_format == 'JPEG' and image.mode == 'RGBA':
+            image = image.convert('RGB')
+
+        buffer = io.BytesIO()
+        image.save(buffer, format=pil_format, quality=80)
+        return buffer.getvalue()
+
+
+def get_rendition(source_path, width, fmt):
+    """
+    Открытая на чтение копия снимка и ее Content-Type.
+
+    Ключ кэша включает mtime исходника. При промахе копия строится
+    не более чем в PREVIEW_MAX_DECODES потоках процесса одновременно.
+    Возвращается файл, а не путь, чтобы вытеснение записи другим
+    процессом сразу после обращения не ломало ответ.
+    """
+    width = snap_width(width)
+    _, content_type, suffix = FORMATS[fmt]
+    key = f'{source_path}:{os.stat(source_path).st_mtime_ns}:{width}:{fmt}'
+
+    cache = rendition_cache()
+    cached = cache.open_entry(key, suffix)
+    if cached is not None:
+        return cached, content_type
+
+    slots = _slots()
+    if not slots.acquire(timeout=getattr(settings, 'PREVIEW_DECODE_TIMEOUT', 10)):
+        raise RenditionBusy()
+
+    try:
+        # Пока ждали слот, ту же копию мог построить другой запрос
+        try:
+            return open(cache.path_for(key, suffix), 'rb'), content_type
+        except FileNotFoundError:
+            pass
+
+        data = render(source_path, width, fmt)
+        cache.put(key, data, suffix)
+        return io.BytesIO(data), content_type
+    finally:
+        slots.release()
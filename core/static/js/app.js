@@ -32,7 +32,7 @@ document.addEventListener('DOMContentLoaded', function() {
     });
 
     // Загрузка начальных данных
-    loadAvailableDates('TC');
+    loadAvailableDates('TCI');
 });
 
 async function loadAvailableDates(productType) {
@@ -66,4 +66,49 @@ async function loadImageForDate(dateStr, productType) {
     } catch (error) {
         console.error('Error loading image:', error);
     }
-}
\ No newline at end of file
+}
+
+function getCookie(name) {
+    const match = document.cookie.match(new RegExp('(?:^|; )' + name + '=([^;]*)'));
+    return match ? decodeURIComponent(match[1]) : null;
+}
+
+// Расчет разницы: задание ставится в очередь, затем опрашивается его статус
+async function calculateDifference(date1, date2, productType, tile = '') {
+    const status = document.getElementById('difference-status');
+    const setStatus = text => { if (status) status.textContent = text; };
+
+    try {
+        const body = new URLSearchParams({date1: date1, date2: date2, product: productType, tile: tile});
+        const response = await fetch('/api/difference/', {
+            method: 'POST',
+            headers: {'X-CSRFToken': getCookie('csrftoken')},
+            body: body
+        });
+        let job = await response.json();
+
+        if (job.error) {
+            setStatus(job.error);
+            return;
+        }
+
+        let delay = 1000;
+        while (job.status === 'queued' || job.status === 'running') {
+            setStatus(job.status === 'queued' ? 'В очереди...' : 'Выполняется...');
+            await new Promise(resolve => setTimeout(resolve, delay));
+            delay = Math.min(delay * 1.5, 5000);
+
+            job = await (await fetch(job.status_url || `/api/difference/${job.job_id}/`)).json();
+        }
+
+        if (job.status === 'done') {
+            setStatus('');
+            document.getElementById('difference-image').src = job.result.preview_url;
+            document.getElementById('difference-download-btn').href = job.result.download_url;
+        } else {
+            setStatus(job.error || 'Ошибка расчета');
+        }
+    } catch (error) {
+        console.error('Error calculating difference:', error);
+    }
+}
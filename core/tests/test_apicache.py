@@ -0,0 +1,81 @@
+import glob
+import os
+import shutil
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from core.catalog import bump_catalog_version
+
+from .utils import SyntheticArchiveMixin
+
+
+class CatalogApiCacheTests(SyntheticArchiveMixin, TestCase):
+    """Общий кэш ответов API по версии каталога и даты из каталога в памяти"""
+
+    def setUp(self):
+        super().setUp()
+        cache_override = override_settings(
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+            CATALOG_CHECK_INTERVAL=0,
+        )
+        cache_override.enable()
+        self.addCleanup(cache_override.disable)
+        self.addCleanup(cache.clear)
+        self.index()
+
+    def dates(self):
+        response = self.client.get('/api/available-dates/', {'product': 'NDVI'})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['dates']
+
+    def test_available_dates_from_catalog(self):
+        with self.assertNumQueries(0):
+            dates = self.dates()
+        self.assertEqual(len(dates), 4)
+
+        # Новый файл виден без переиндексации, общий кэш не используется
+        preview = sorted(glob.glob(os.path.join(self.data_root, 'Sentinel-2', 'preview', 'NDVI', '*', '*.jpg')))[0]
+        name = os.path.basename(preview).split('_')
+        name[1] = '20991231T000000'
+        shutil.copy(preview, os.path.join(os.path.dirname(preview), '_'.join(name)))
+
+        self.assertEqual(self.dates()[0], '2099-12-31')
+        self.assertFalse(any('available_dates' in key for key in cache._cache))
+
+    def test_image_for_date_cached_until_reindex(self):
+        date = self.dates()[0]
+        params = {'product': 'NDVI', 'date': date}
+
+        first = self.client.get('/api/image-for-date/', params)
+        self.assertEqual(first.status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/image-for-date/', params).json(), first.json())
+
+        bump_catalog_version(self.data_root)
+        with self.assertNumQueries(1):
+            self.client.get('/api/image-for-date/', params)
+
+    def test_stats_cached_until_reindex(self):
+        total = self.client.get('/api/stats/').json()['total']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/stats/').json()['total'], total)
+
+        bump_catalog_version(self.data_root)
+        with self.assertNumQueries(1):
+            self.client.get('/api/stats/')
+
+    def test_conditional_get(self):
+        response = self.client.get('/api/stats/')
+        etag = response['ETag']
+        self.assertIn('max-age=300', response['Cache-Control'])
+
+        self.assertEqual(self.client.get('/api/stats/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        bump_catalog_version(self.data_root)
+        self.assertEqual(self.client.get('/api/stats/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_errors_are_not_cached(self):
+        response = self.client.get('/api/image-for-date/', {'product': 'NDVI'})
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn('ETag', response)
+        self.assertIn('no-cache', response['Cache-Control'])
@@ -0,0 +1,78 @@
+import asyncio
+import shutil
+import tempfile
+import threading
+import time
+
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from core.async_views import offload, storage_breaker
+
+
+class OffloadTests(SimpleTestCase):
+    """Представления в пуле потоков: таймаут, предохранитель архива, потоковые ответы"""
+
+    def setUp(self):
+        # Предохранитель свой у каждого DATA_ROOT, поэтому у теста он новый
+        self.data_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_root)
+        settings_override = override_settings(
+            DATA_ROOT=self.data_root, ASYNC_VIEW_TIMEOUT=0.2, ASYNC_STORAGE_STUCK_LIMIT=1
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+    def call(self, view):
+        return asyncio.run(view(RequestFactory().get('/')))
+
+    def hanging_view(self, request):
+        self.release.wait(5)
+        return HttpResponse('late')
+
+    def test_response(self):
+        response = self.call(offload(lambda request: HttpResponse('ok')))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'ok')
+
+    def test_stuck_storage_opens_breaker(self):
+        finished = threading.Event()
+
+        def hanging(request):
+            try:
+                return self.hanging_view(request)
+            finally:
+                finished.set()
+
+        self.assertEqual(self.call(offload(hanging)).status_code, 504)
+        self.assertTrue(storage_breaker().is_open())
+
+        # Запросы к архиву сразу получают 503, остальные обслуживаются
+        self.assertEqual(self.call(offload(lambda request: HttpResponse('ok'))).status_code, 503)
+        self.assertEqual(self.call(offload(lambda request: HttpResponse('ok'), storage=False)).status_code, 200)
+
+        # Когда зависший вызов вернулся, предохранитель закрывается
+        self.release.set()
+        self.assertTrue(finished.wait(5))
+        for _ in range(100):
+            if not storage_breaker().is_open():
+                break
+            time.sleep(0.01)
+        self.assertFalse(storage_breaker().is_open())
+
+    def test_timeout_without_storage(self):
+        self.assertEqual(self.call(offload(self.hanging_view, storage=False)).status_code, 504)
+        self.assertFalse(storage_breaker().is_open())
+
+    def test_streaming_response(self):
+        def streaming(request):
+            return StreamingHttpResponse(iter([b'a', b'b', b'c']))
+
+        async def consume():
+            response = await offload(streaming)(RequestFactory().get('/'))
+            return [chunk async for chunk in response.streaming_content]
+
+        self.assertEqual(asyncio.run(consume()), [b'a', b'b', b'c'])
@@ -0,0 +1,74 @@
+import glob
+import os
+import shutil
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from core.catalog import bump_catalog_version, get_catalog
+
+from .utils import SyntheticArchiveMixin
+
+
+class CatalogTests(SyntheticArchiveMixin, SimpleTestCase):
+    """Каталог снимков в памяти процесса для /api/available-dates/"""
+
+    ARCHIVE = {**SyntheticArchiveMixin.ARCHIVE, 'missing_products': 0.3, 'seed': 2}
+
+    def previews(self, product_type='TCI'):
+        return sorted(glob.glob(os.path.join(self.data_root, 'Sentinel-2', 'preview', product_type, '*', '*.jpg')))
+
+    def add_preview(self, stamp):
+        source = self.previews()[0]
+        name = os.path.basename(source).split('_')
+        name[1] = stamp
+        shutil.copy(source, os.path.join(os.path.dirname(source), '_'.join(name)))
+
+    @override_settings(CATALOG_CHECK_INTERVAL=0)
+    def test_contents(self):
+        catalog = get_catalog()
+
+        for product_type in ('TCI', 'NDVI', 'NDWI'):
+            dates = catalog.available_dates(product_type)
+            self.assertEqual(len(dates), 4)
+            self.assertEqual(dates, sorted(dates, reverse=True))
+            scenes = [scene for date in dates for scene in catalog.scenes_for_date(product_type, date)]
+            self.assertEqual(len(scenes), len(self.previews(product_type)))
+
+        # Сцены без файла продукта остаются в каталоге с product_path=None
+        scenes = catalog.scenes['TCI']
+        products = glob.glob(os.path.join(self.data_root, 'Sentinel-2', 'TCI', '*', '*'))
+        self.assertEqual(sum(scene.product_path is not None for scene in scenes), len(products))
+        self.assertTrue(all(
+            os.path.isfile(os.path.join(self.data_root, scene.product_path))
+            for scene in scenes if scene.product_path
+        ))
+
+    @override_settings(CATALOG_CHECK_INTERVAL=0)
+    def test_rebuilt_when_files_change(self):
+        catalog = get_catalog()
+        self.assertIs(get_catalog(), catalog)
+
+        self.add_preview('20991231T000000')
+        rebuilt = get_catalog()
+        self.assertIsNot(rebuilt, catalog)
+        self.assertNotEqual(rebuilt.generation, catalog.generation)
+        self.assertEqual(rebuilt.available_dates('TCI')[0], '2099-12-31')
+
+        bump_catalog_version(self.data_root)
+        self.assertIsNot(get_catalog(), rebuilt)
+
+    @override_settings(CATALOG_CHECK_INTERVAL=3600)
+    def test_no_disk_access_between_checks(self):
+        catalog = get_catalog()
+        self.add_preview('20991231T000000')
+
+        with mock.patch('os.stat') as stat, mock.patch('os.scandir') as scandir:
+            self.assertIs(get_catalog(), catalog)
+        stat.assert_not_called()
+        scandir.assert_not_called()
+
+    def test_missing_archive(self):
+        empty = os.path.join(self.data_root, 'empty')
+        os.makedirs(empty)
+        self.assertEqual(get_catalog(empty).available_dates('TCI'), [])
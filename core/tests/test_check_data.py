@@ -0,0 +1,113 @@
+import io
+import json
+import os
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from core.management.commands import check_data
+from core.management.commands.check_data import Command
+from core.models import FileChecksum, SatelliteImage
+
+from .utils import SyntheticArchiveMixin
+
+
+class CheckDataTests(SyntheticArchiveMixin, TestCase):
+    """check_data: отсутствующие файлы, контрольные суммы и --resume"""
+
+    ARCHIVE = {**SyntheticArchiveMixin.ARCHIVE, 'missing_products': 0.3, 'seed': 1}
+
+    def setUp(self):
+        super().setUp()
+        self.index()
+        self.images = list(SatelliteImage.objects.order_by('pk'))
+        self.report_path = self.data_path('report.json')
+
+    def check(self, **options):
+        out = io.StringIO()
+        call_command('check_data', stdout=out, stderr=io.StringIO(), **options)
+        return out.getvalue()
+
+    def report(self, **options):
+        self.check(report=self.report_path, **options)
+        with open(self.report_path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def test_missing_files(self):
+        removed = self.images[1]
+        os.remove(self.data_path(removed.preview_path))
+
+        report = self.report()
+
+        self.assertEqual(report['total'], len(self.images))
+        self.assertEqual(report['counts']['preview'].get('missing'), 1)
+        not_indexed = sum(image.product_path == 'NOT_FOUND' for image in self.images)
+        self.assertEqual(report['counts']['product'].get('not_indexed', 0), not_indexed)
+        missing = [issue for issue in report['issues'] if issue['status'] == 'missing']
+        self.assertEqual([(issue['id'], issue['file']) for issue in missing], [(removed.id, 'preview')])
+        # После завершения состояние для --resume не остается
+        self.assertFalse(os.path.exists(self.data_path('index_files/check_data.state.json')))
+
+    def test_checksums_are_reused(self):
+        files = sum(1 + (image.product_path != 'NOT_FOUND') for image in self.images)
+
+        self.assertIn(f'посчитано {files}, без изменений 0, повреждено 0', self.check(checksums=True))
+        self.assertEqual(FileChecksum.objects.count(), files)
+        self.assertIn(f'посчитано 0, без изменений {files}, повреждено 0', self.check(checksums=True))
+
+    def test_verify_finds_corruption(self):
+        self.check(checksums=True)
+        path = self.data_path(self.images[0].preview_path)
+        st = os.stat(path)
+        with open(path, 'r+b') as f:
+            f.write(b'\xff' * 4)
+        # Размер и mtime прежние: изменение видно только по содержимому
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+        self.assertIn('повреждено 0', self.check(checksums=True))
+        report = self.report(verify=True)
+        corrupt = [issue for issue in report['issues'] if issue['status'] == 'corrupt']
+        self.assertEqual([(issue['id'], issue['file']) for issue in corrupt], [(self.images[0].id, 'preview')])
+
+    def interrupt(self, **options):
+        """Прерывает проверку после двух пачек, возвращает id последней проверенной записи"""
+        real_check_chunk = Command._check_chunk
+        checked = []
+
+        def interrupted(command, images, *args):
+            if len(checked) == 2:
+                raise KeyboardInterrupt
+            checked.append(images[-1].pk)
+            return real_check_chunk(command, images, *args)
+
+        with mock.patch.object(Command, '_check_chunk', interrupted), self.assertRaises(KeyboardInterrupt):
+            self.check(chunk_size=5, **options)
+        return checked[-1]
+
+    def test_resume(self):
+        for image in self.images[::5]:
+            os.remove(self.data_path(image.preview_path))
+        expected = self.report(checksums=True)
+        FileChecksum.objects.all().delete()
+
+        last_id = self.interrupt(checksums=True)
+        hashed = FileChecksum.objects.count()
+
+        with mock.patch.object(check_data, 'file_sha256', wraps=check_data.file_sha256) as file_sha256:
+            output = self.check(checksums=True, chunk_size=5, resume=True, report=self.report_path)
+
+        self.assertIn(f'после записи id={last_id}', output)
+        with open(self.report_path, encoding='utf-8') as f:
+            resumed = json.load(f)
+        for key in ('total', 'counts', 'checksums', 'issues'):
+            self.assertEqual(resumed[key], expected[key])
+        # Суммы, посчитанные до прерывания, не пересчитываются
+        self.assertEqual(file_sha256.call_count, expected['checksums']['hashed'] - hashed)
+
+    def test_resume_with_other_options_starts_over(self):
+        self.interrupt()
+
+        output = self.check(resume=True, product='TCI')
+        self.assertIn('начинаем заново', output)
+        self.assertIn(f"Всего записей: {SatelliteImage.objects.filter(product_type='TCI').count()}", output)
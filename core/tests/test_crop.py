@@ -0,0 +1,78 @@
+import numpy as np
+from django.test import TestCase, override_settings
+
+from core.tiff import MODEL_PIXEL_SCALE, MODEL_TIEPOINT, TiffReader
+
+from .utils import TempDataRootMixin, write_test_tiff
+
+# Пиксель 10 м, левый верхний угол растра (500000, 4000000) в метрах UTM
+GEO_TAGS = [
+    (MODEL_PIXEL_SCALE, 12, [10.0, 10.0, 0.0]),
+    (MODEL_TIEPOINT, 12, [0.0, 0.0, 0.0, 500000.0, 4000000.0, 0.0]),
+]
+
+
+class ProductCropTests(TempDataRootMixin, TestCase):
+    """/download-product/crop/: окно в пикселях или bbox, геопривязка окна"""
+
+    def setUp(self):
+        super().setUp()
+        rng = np.random.default_rng(0)
+        self.array = rng.uniform(-1, 1, (120, 90, 1)).astype(np.float32)
+        self.path = 'Sentinel-2/NDVI/2024/NDVI.tif'
+        self.write_product(self.path, self.array, rows_per_strip=16, extra_tags=GEO_TAGS, nodata=-9999)
+
+    def crop(self, headers=None, **params):
+        return self.client.get('/download-product/crop/', {'path': self.path, **params}, headers=headers)
+
+    def read(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/tiff')
+        path = self.data_path('crop.tif')
+        with open(path, 'wb') as f:
+            f.write(b''.join(response.streaming_content))
+        reader = TiffReader(path)
+        self.addCleanup(reader.close)
+        return reader
+
+    def test_window(self):
+        reader = self.read(self.crop(window='5,20,30,41'))
+
+        np.testing.assert_array_equal(reader.read_window(0, 0, 30, 41), self.array[20:61, 5:35])
+        self.assertEqual(reader.geo_transform(), (500050.0, 10.0, 3999800.0, 10.0))
+        self.assertEqual(reader.nodata, -9999)
+
+    def test_bbox(self):
+        # Пиксели 10..19 по x и 30..44 по y, границы - не по краям пикселей
+        reader = self.read(self.crop(bbox='500105,3999555,500195,3999695'))
+
+        self.assertEqual((reader.width, reader.height), (10, 15))
+        np.testing.assert_array_equal(reader.read_window(0, 0, 10, 15), self.array[30:45, 10:20])
+        self.assertEqual(reader.geo_transform()[::2], (500100.0, 3999700.0))
+
+    def test_tiled_source(self):
+        array = np.arange(40 * 50 * 3, dtype=np.uint16).reshape(40, 50, 3)
+        write_test_tiff(self.data_path('tiled.tif'), array, tiled=True, compression=8, predictor=2)
+
+        response = self.client.get('/download-product/crop/', {'path': 'tiled.tif', 'window': '17,3,20,30'})
+
+        np.testing.assert_array_equal(self.read(response).read_window(0, 0, 20, 30), array[3:33, 17:37])
+
+    def test_not_modified(self):
+        response = self.crop(window='0,0,10,10')
+        etag = response['ETag']
+        self.assertIn('NDVI_0_0_10x10.tif', response['Content-Disposition'])
+
+        self.assertEqual(self.crop(window='0,0,10,10', headers={'If-None-Match': etag}).status_code, 304)
+        self.assertEqual(self.crop(window='0,0,10,11', headers={'If-None-Match': etag}).status_code, 200)
+
+    @override_settings(CROP_MAX_PIXELS=100)
+    def test_errors(self):
+        self.assertEqual(self.crop().status_code, 400)
+        self.assertEqual(self.crop(window='0,0,10,10', bbox='0,0,1,1').status_code, 400)
+        self.assertEqual(self.crop(window='0,0,-1,10').status_code, 400)
+        self.assertEqual(self.crop(window='85,0,10,10').status_code, 400)
+        self.assertEqual(self.crop(bbox='0,0,10,10').status_code, 400)
+        self.assertEqual(self.crop(window='0,0,11,10').status_code, 413)
+        self.assertEqual(self.client.get('/download-product/crop/', {'path': 'missing.tif', 'window': '0,0,1,1'})
+                         .status_code, 404)
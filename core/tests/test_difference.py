@@ -0,0 +1,109 @@
+import os
+import shutil
+from datetime import date
+
+import numpy as np
+from django.test import TestCase
+
+from core.jobs import claim_next_job, finish_job
+from core.management.commands.generate_difference import generate_difference
+from core.models import DifferenceJob, SatelliteImage
+
+from .utils import TempDataRootMixin
+
+
+class DifferenceJobTests(TempDataRootMixin, TestCase):
+    """Очередь расчетов разницы и повторное использование результатов из кэша"""
+
+    def setUp(self):
+        super().setUp()
+        rng = np.random.default_rng(0)
+        for day in (1, 2):
+            product_path = f'Sentinel-2/TCI/2025/T45VUC_202506{day:02d}T000000_TCI.tif'
+            self.write_product(product_path, rng.integers(0, 256, (16, 16, 3), dtype=np.uint8))
+            SatelliteImage.objects.create(
+                tile='T45VUC', date=date(2025, 6, day), product_type='TCI',
+                preview_path=f'Sentinel-2/preview/TCI/2025/T45VUC_202506{day:02d}T000000_TCI.jpg',
+                product_path=product_path,
+            )
+
+    def submit(self):
+        return self.client.post('/api/difference/', {'date1': '2025-06-01', 'date2': '2025-06-02'})
+
+    def run_queue(self):
+        """Выполняет все задания очереди так же, как run_workers"""
+        while (job := claim_next_job('test:1')) is not None:
+            finish_job(job.id, generate_difference(
+                job.date1.isoformat(), job.date2.isoformat(), job.product_type, job.tile or None
+            ))
+
+    def test_duplicate_submit_returns_active_job(self):
+        first = self.submit()
+        second = self.submit()
+
+        self.assertEqual(first.status_code, 202)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(first.json()['job_id'], second.json()['job_id'])
+        self.assertEqual(second.json()['status'], 'queued')
+        self.assertEqual(DifferenceJob.objects.count(), 1)
+
+    def test_claim_is_exclusive(self):
+        self.submit()
+        self.assertIsNotNone(claim_next_job('test:1'))
+        self.assertIsNone(claim_next_job('test:2'))
+
+    def test_done_job_is_reused(self):
+        job_id = self.submit().json()['job_id']
+        self.run_queue()
+
+        response = self.submit()
+        self.assertEqual(response.status_code, 200)
+        payload = response.json()
+        self.assertEqual(payload['job_id'], job_id)
+        self.assertEqual(payload['status'], 'done')
+        self.assertTrue(payload['result']['preview_url'].startswith('/media/diff_results/'))
+        self.assertEqual(DifferenceJob.objects.count(), 1)
+
+    def test_cache_hit_without_job(self):
+        # Результат уже рассчитан командой generate_difference, заданий нет
+        self.assertEqual(generate_difference('2025-06-01', '2025-06-02', 'TCI')['status'], 'success')
+
+        response = self.submit()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'done')
+        self.assertIn('download_url', response.json()['result'])
+        self.assertFalse(DifferenceJob.objects.exclude(status=DifferenceJob.DONE).exists())
+
+    def test_evicted_result(self):
+        job_id = self.submit().json()['job_id']
+        self.run_queue()
+        shutil.rmtree(self.data_path('diff_results'))
+
+        # Статус только сообщает о вытеснении и ничего не меняет
+        for _ in range(2):
+            response = self.client.get(f'/api/difference/{job_id}/')
+            self.assertEqual(response.json()['status'], 'expired')
+            self.assertNotIn('result', response.json())
+        self.assertEqual(DifferenceJob.objects.get().status, DifferenceJob.DONE)
+
+        # Повторная отправка ставит расчет в очередь заново
+        response = self.submit()
+        self.assertEqual(response.status_code, 202)
+        self.assertNotEqual(response.json()['job_id'], job_id)
+        self.run_queue()
+        self.assertEqual(self.client.get(response.json()['status_url']).json()['status'], 'done')
+
+    def test_rewritten_source_is_recomputed(self):
+        self.submit()
+        self.run_queue()
+
+        path = self.data_path('Sentinel-2/TCI/2025/T45VUC_20250602T000000_TCI.tif')
+        self.write_product('Sentinel-2/TCI/2025/T45VUC_20250602T000000_TCI.tif',
+                           np.zeros((16, 16, 3), dtype=np.uint8))
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+
+        self.assertEqual(self.submit().status_code, 202)
+
+    def test_unknown_job(self):
+        self.assertEqual(self.client.get('/api/difference/999/').status_code, 404)
@@ -0,0 +1,92 @@
+import io
+import os
+import shutil
+import tempfile
+import zipfile
+
+from django.test import RequestFactory, SimpleTestCase
+
+from core.downloads import _parse_range, iter_zip
+
+
+class ParseRangeTests(SimpleTestCase):
+    """Разбор заголовка Range для /download-product/"""
+
+    ETAG = '"a-b"'
+    MTIME = 1700000000
+
+    def parse(self, header, size=1000, **headers):
+        request = RequestFactory().get('/', HTTP_RANGE=header, **headers)
+        return _parse_range(request, size, self.ETAG, self.MTIME)
+
+    def test_ranges(self):
+        self.assertEqual(self.parse('bytes=0-99'), (0, 99))
+        self.assertEqual(self.parse('bytes=100-'), (100, 999))
+        self.assertEqual(self.parse('bytes=-100'), (900, 999))
+        self.assertEqual(self.parse('bytes=900-5000'), (900, 999))
+        self.assertEqual(self.parse('bytes=-5000'), (0, 999))
+
+    def test_unsatisfiable(self):
+        self.assertEqual(self.parse('bytes=1000-'), 'invalid')
+        self.assertEqual(self.parse('bytes=50-10'), 'invalid')
+        self.assertEqual(self.parse('bytes=-0'), 'invalid')
+
+    def test_empty_file(self):
+        self.assertEqual(self.parse('bytes=0-', size=0), 'invalid')
+        self.assertEqual(self.parse('bytes=-10', size=0), 'invalid')
+
+    def test_whole_file(self):
+        self.assertIsNone(self.parse(''))
+        self.assertIsNone(self.parse('bytes=0-1,5-6'))
+        self.assertIsNone(self.parse('items=0-1'))
+
+    def test_if_range(self):
+        self.assertEqual(self.parse('bytes=0-9', HTTP_IF_RANGE=self.ETAG), (0, 9))
+        self.assertIsNone(self.parse('bytes=0-9', HTTP_IF_RANGE='"other"'))
+        self.assertEqual(self.parse('bytes=0-9', HTTP_IF_RANGE='Tue, 14 Nov 2023 22:13:20 GMT'), (0, 9))
+        self.assertIsNone(self.parse('bytes=0-9', HTTP_IF_RANGE='Mon, 13 Nov 2023 22:13:20 GMT'))
+
+
+class IterZipTests(SimpleTestCase):
+    """Потоковая сборка ZIP для /download-product/bulk/"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def make_file(self, name, data):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_archive_contents(self):
+        big = os.urandom(200 * 1024)
+        files = [
+            ('TCI/a.tiff', self.make_file('a.tiff', big)),
+            ('TCI/empty.jpg', self.make_file('empty.jpg', b'')),
+            ('NDVI/b.tiff', self.make_file('b.tiff', b'ndvi')),
+        ]
+
+        chunks = list(iter_zip(files))
+        # Файл больше блока чтения отдается несколькими кусками
+        self.assertGreater(len(chunks), 3)
+
+        with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(archive.namelist(), ['TCI/a.tiff', 'TCI/empty.jpg', 'NDVI/b.tiff'])
+            self.assertEqual(archive.read('TCI/a.tiff'), big)
+            self.assertEqual(archive.read('TCI/empty.jpg'), b'')
+            self.assertEqual(archive.read('NDVI/b.tiff'), b'ndvi')
+            self.assertTrue(all(info.compress_type == zipfile.ZIP_STORED for info in archive.infolist()))
+
+    def test_empty_archive(self):
+        with zipfile.ZipFile(io.BytesIO(b''.join(iter_zip([])))) as archive:
+            self.assertEqual(archive.namelist(), [])
+
+    def test_close_stops_reading(self):
+        files = [('a.tiff', self.make_file('a.tiff', os.urandom(300 * 1024)))]
+        stream = iter_zip(files)
+        next(stream)
+        with self.assertLogs('core.downloads', 'INFO'):
+            stream.close()
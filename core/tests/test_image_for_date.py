@@ -0,0 +1,63 @@
+from django.test import TestCase, override_settings
+
+from core.catalog import get_catalog
+from core.models import SatelliteImage
+
+from .utils import SyntheticArchiveMixin
+
+
+@override_settings(CATALOG_CHECK_INTERVAL=0)
+class ImageForDateTests(SyntheticArchiveMixin, TestCase):
+    """/api/image-for-date/: поиск ближайшей даты в базе и в каталоге в памяти"""
+
+    ARCHIVE = {**SyntheticArchiveMixin.ARCHIVE, 'start_date': '2025-06-01', 'step_days': 4}
+
+    def setUp(self):
+        super().setUp()
+        self.dates = get_catalog().ascending_dates['TCI']
+        self.tile = get_catalog().scenes_for_date('TCI', self.dates[0])[0].tile
+
+    def get(self, date, **params):
+        return self.client.get('/api/image-for-date/', {'product': 'TCI', 'date': date, **params})
+
+    def responses(self):
+        """Ответы на набор запросов вокруг дат архива"""
+        results = {}
+        for date in ('2025-05-01', '2025-06-01', '2025-06-03', '2025-06-07', '2025-06-14', '2025-07-01'):
+            for nearest in ('before', 'after', 'closest'):
+                for extra in ({}, {'tile': self.tile}, {'all_tiles': '1'}):
+                    response = self.get(date, nearest=nearest, **extra)
+                    # id и ссылки на копии превью есть только у снимков из базы
+                    images = response.json().get('images', [response.json()])
+                    results[date, nearest, tuple(extra)] = (
+                        response.status_code,
+                        [(image.get('date'), image.get('tile'), image.get('preview_url')) for image in images]
+                    )
+        return results
+
+    def test_directions(self):
+        self.index()
+        self.assertEqual(self.dates, ['2025-06-01', '2025-06-05', '2025-06-09', '2025-06-13'])
+
+        self.assertEqual(self.get('2025-06-07').json()['date'], '2025-06-05')
+        self.assertEqual(self.get('2025-06-07', nearest='after').json()['date'], '2025-06-09')
+        # При равном удалении - более ранняя дата
+        self.assertEqual(self.get('2025-06-07', nearest='closest').json()['date'], '2025-06-05')
+        self.assertEqual(self.get('2025-06-08', nearest='closest').json()['date'], '2025-06-09')
+        self.assertEqual(self.get('2025-05-01').status_code, 404)
+        self.assertEqual(self.get('2025-07-01', nearest='after').status_code, 404)
+        self.assertEqual(len(self.get('2025-06-05', all_tiles='1').json()['images']), 3)
+        self.assertEqual(self.get('2025-06-05', tile=self.tile).json()['tile'], self.tile)
+
+    def test_catalog_fallback_matches_database(self):
+        # До индексации ответы строятся по каталогу в памяти
+        self.assertFalse(SatelliteImage.objects.exists())
+        from_catalog = self.responses()
+
+        self.index()
+        self.assertEqual(self.responses(), from_catalog)
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.get('').status_code, 400)
+        self.assertEqual(self.get('06/01/2025').status_code, 400)
+        self.assertEqual(self.get('2025-06-01', nearest='sideways').status_code, 400)
@@ -0,0 +1,138 @@
+import glob
+import os
+import shutil
+from unittest import mock
+
+from django.test import TestCase
+
+from core.catalog import PREVIEW_EXTENSIONS, tree_paths, walk_tree_changes
+from core.models import SatelliteImage
+
+from .utils import SyntheticArchiveMixin
+
+
+def image_rows():
+    return sorted(SatelliteImage.objects.values_list('product_type', 'tile', 'date', 'preview_path', 'product_path'))
+
+
+class IncrementalIndexTests(SyntheticArchiveMixin, TestCase):
+    """generate_index --incremental по манифесту файлов"""
+
+    def setUp(self):
+        super().setUp()
+        self.index()
+        self.preview_root = os.path.join(self.data_root, 'Sentinel-2', 'preview', 'TCI')
+
+    def previews(self):
+        return sorted(glob.glob(os.path.join(self.preview_root, '*', '*.jpg')))
+
+    def assert_matches_full_scan(self):
+        incremental = image_rows()
+        self.index()
+        self.assertEqual(incremental, image_rows())
+
+    def test_unchanged_archive(self):
+        before = image_rows()
+        archive = os.path.join(self.data_root, 'Sentinel-2')
+        calls = {'stat': [], 'scandir': []}
+        real = {'stat': os.stat, 'scandir': os.scandir}
+
+        def recording(name):
+            def call(path, *args, **kwargs):
+                calls[name].append(os.fspath(path))
+                return real[name](path, *args, **kwargs)
+            return call
+
+        with mock.patch('os.stat', recording('stat')), mock.patch('os.scandir', recording('scandir')):
+            output = self.index(incremental=True)
+
+        # Директории с прежним mtime не читаются, файлы в них не проверяются stat
+        self.assertEqual([path for path in calls['scandir'] if path.startswith(archive)], [])
+        self.assertEqual([path for path in calls['stat'] if path.startswith(archive) and os.path.isfile(path)], [])
+        self.assertIn('Изменившихся сцен: 0', output)
+        self.assertEqual(image_rows(), before)
+
+    def test_added_and_removed_files(self):
+        first, second = self.previews()[:2]
+        name = os.path.basename(first).split('_')
+        name[1] = '20991231T000000'
+        added = os.path.join(os.path.dirname(first), '_'.join(name))
+        shutil.copy(first, added)
+        os.remove(second)
+
+        output = self.index(incremental=True)
+
+        self.assertIn('Изменившихся сцен: 2', output)
+        self.assertTrue(SatelliteImage.objects.filter(tile=name[0], date='2099-12-31', product_type='TCI').exists())
+        self.assert_matches_full_scan()
+
+    def test_new_product_for_existing_preview(self):
+        image = SatelliteImage.objects.filter(product_type='TCI').first()
+        product = os.path.join(self.data_root, image.product_path)
+        os.remove(product)
+        self.index(incremental=True)
+        self.assertEqual(SatelliteImage.objects.get(id=image.id).product_path, 'NOT_FOUND')
+
+        shutil.copy(os.path.join(self.data_root, image.preview_path), product)
+        output = self.index(incremental=True)
+
+        self.assertIn('Изменившихся сцен: 1', output)
+        self.assertEqual(SatelliteImage.objects.get(id=image.id).product_path, image.product_path)
+        self.assert_matches_full_scan()
+
+    def test_verify_finds_in_place_rewrite(self):
+        with open(self.previews()[0], 'ab') as f:
+            f.write(b'\0' * 16)
+
+        self.assertIn('Изменившихся сцен: 0', self.index(incremental=True))
+        self.assertIn('Изменившихся сцен: 1', self.index(incremental=True, verify=True))
+        # Манифест обновлен, следующий запуск снова ничего не находит
+        self.assertIn('Изменившихся сцен: 0', self.index(incremental=True, verify=True))
+
+    def test_removed_directory(self):
+        year_dir = sorted(glob.glob(os.path.join(self.preview_root, '*')))[0]
+        removed = len(os.listdir(year_dir))
+        before = SatelliteImage.objects.filter(product_type='TCI').count()
+        shutil.rmtree(year_dir)
+
+        self.index(incremental=True)
+
+        self.assertEqual(SatelliteImage.objects.filter(product_type='TCI').count(), before - removed)
+        self.assert_matches_full_scan()
+
+
+class WalkTreeChangesTests(SyntheticArchiveMixin, TestCase):
+    """Что находит инкрементальный обход и что только с verify"""
+
+    def setUp(self):
+        super().setUp()
+        self.root = os.path.join(self.data_root, 'Sentinel-2', 'preview', 'NDVI')
+        self.files, self.dirs, changed = walk_tree_changes(self.root, PREVIEW_EXTENSIONS)
+        self.assertIsNone(changed)
+        self.previous = {'files': self.files, 'dirs': self.dirs}
+
+    def test_in_place_rewrite_needs_verify(self):
+        path = sorted(tree_paths(self.files))[0]
+        with open(path, 'ab') as f:
+            f.write(b'\0' * 16)
+
+        self.assertEqual(walk_tree_changes(self.root, PREVIEW_EXTENSIONS, self.previous)[2], set())
+        self.assertEqual(walk_tree_changes(self.root, PREVIEW_EXTENSIONS, self.previous, verify=True)[2], {path})
+
+    def test_replace_by_rename(self):
+        path = sorted(tree_paths(self.files))[0]
+        shutil.copy(path, path + '.tmp')
+        with open(path + '.tmp', 'ab') as f:
+            f.write(b'\0' * 16)
+        os.replace(path + '.tmp', path)
+
+        self.assertEqual(walk_tree_changes(self.root, PREVIEW_EXTENSIONS, self.previous)[2], {path})
+
+    def test_other_extensions_are_ignored(self):
+        directory = sorted(self.dirs)[-1]
+        with open(os.path.join(directory, 'notes.txt'), 'w') as f:
+            f.write('x')
+
+        files, _, changed = walk_tree_changes(self.root, PREVIEW_EXTENSIONS, self.previous)
+        self.assertEqual(changed, set())
+        self.assertEqual(sorted(tree_paths(files)), sorted(tree_paths(self.files)))
@@ -0,0 +1,98 @@
+import asyncio
+import io
+import re
+
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase
+
+from core import metrics
+from core.middleware import InstrumentationMiddleware
+
+from .utils import TempDataRootMixin
+
+
+def request_count(view, status):
+    """Значение space_requests_total из /metrics процесса"""
+    pattern = rf'^space_requests_total{{view="{view}",status="{status}"}} (\d+)$'
+    match = re.search(pattern, metrics.registry.render(), re.MULTILINE)
+    return int(match.group(1)) if match else 0
+
+
+class MetricsTests(SimpleTestCase):
+    """Счетчики операций: вложенные замеры, прирост со снимка"""
+
+    def test_nested_operations_counted_once(self):
+        token, request_metrics = metrics.start()
+        try:
+            with metrics.timed('fs'):
+                with metrics.timed('fs'):
+                    pass
+                with metrics.timed('render'):
+                    pass
+            metrics.track('fs')(lambda: None)()
+        finally:
+            metrics.finish(token)
+
+        self.assertEqual({kind: count for kind, (count, _) in request_metrics.timings.items()},
+                         {'fs': 2, 'render': 1})
+        self.assertIsNot(metrics.current(), request_metrics)
+
+    def test_since_snapshot(self):
+        counters = metrics.Metrics()
+        counters.add('db', 0.5, count=2)
+        snapshot = counters.snapshot()
+        counters.add('db', 0.25)
+        counters.add('fs', 0.1)
+
+        self.assertEqual(counters.since(snapshot).timings, {'db': [1, 0.25], 'fs': [1, 0.1]})
+
+    def test_server_timing(self):
+        counters = metrics.Metrics()
+        counters.add('db', 0.0125, count=3)
+        header = counters.server_timing()
+        self.assertTrue(header.startswith('total;dur='))
+        self.assertIn('db;dur=12.5;desc="3"', header)
+
+
+class InstrumentationMiddlewareTests(TempDataRootMixin, TestCase):
+    """Server-Timing в ответах и гистограммы /metrics по имени маршрута"""
+
+    def test_server_timing_and_registry(self):
+        before = request_count('stats', 200)
+
+        response = self.client.get('/api/stats/')
+
+        self.assertEqual(response.status_code, 200)
+        # Сводка читается из ProductSummary одним запросом
+        self.assertTrue(response['Server-Timing'].startswith('total;dur='))
+        self.assertRegex(response['Server-Timing'], r'(^|, )db;dur=[\d.]+;desc="1"(,|$)')
+        self.assertEqual(request_count('stats', 200), before + 1)
+
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('space_request_duration_seconds_count{view="stats"}', body)
+        self.assertIn('space_operations_total{view="stats",kind="db"}', body)
+
+    def test_unmatched_route(self):
+        before = request_count('unmatched', 404)
+        self.assertEqual(self.client.get('/no-such-page/').status_code, 404)
+        self.assertEqual(request_count('unmatched', 404), before + 1)
+
+    def test_async_chain(self):
+        async def view(request):
+            metrics.current().add('fs', 0.01)
+            return HttpResponse('ok')
+
+        middleware = InstrumentationMiddleware(view)
+        response = asyncio.run(middleware(RequestFactory().get('/')))
+
+        self.assertIn('fs;dur=10.0;desc="1"', response['Server-Timing'])
+
+    def test_command_counters(self):
+        err = io.StringIO()
+        call_command('cache_stats', stdout=io.StringIO(), stderr=err)
+        self.assertIn('Счетчики:', err.getvalue())
+
+        err = io.StringIO()
+        call_command('cache_stats', stdout=io.StringIO(), stderr=err, verbosity=0)
+        self.assertEqual(err.getvalue(), '')
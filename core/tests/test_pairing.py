@@ -0,0 +1,63 @@
+from datetime import date
+
+from django.test import SimpleTestCase
+
+from core.catalog import pair_scenes
+
+
+class PairScenesTests(SimpleTestCase):
+    """Сопоставление превью с файлами продуктов по имени"""
+
+    def pair(self, previews, products, product_type='TCI'):
+        scenes, skipped = pair_scenes(product_type, previews, products)
+        return {scene.preview_path: scene.product_path for scene in scenes}, skipped
+
+    def test_exact_and_same_day_match(self):
+        paired, skipped = self.pair(
+            ['p/T45VUC_20250601T053649_TCI.jpg', 'p/T45VUC_20250602T053649_TCI.jpg'],
+            ['d/T45VUC_20250601T053649_TCI.tiff', 'd/T45VUC_20250602T060000_TCI.tiff'],
+        )
+        self.assertEqual(paired, {
+            'p/T45VUC_20250601T053649_TCI.jpg': 'd/T45VUC_20250601T053649_TCI.tiff',
+            # Снимок того же дня с другим временем
+            'p/T45VUC_20250602T053649_TCI.jpg': 'd/T45VUC_20250602T060000_TCI.tiff',
+        })
+        self.assertEqual(skipped, [])
+
+    def test_product_preference(self):
+        # Сначала имя без суффикса разрешения, затем .tiff перед .tif
+        paired, _ = self.pair(
+            ['p/T45VUC_20250601T053649_TCI.jpg'],
+            ['d/T45VUC_20250601T053649_TCI_10m.tiff', 'd/T45VUC_20250601T053649_TCI.tif',
+             'd/T45VUC_20250601T053649_TCI.tiff'],
+        )
+        self.assertEqual(paired['p/T45VUC_20250601T053649_TCI.jpg'], 'd/T45VUC_20250601T053649_TCI.tiff')
+
+    def test_missing_and_foreign_products(self):
+        paired, _ = self.pair(
+            ['p/T45VUC_20250601T053649_TCI.jpg'],
+            ['d/T45VUD_20250601T053649_TCI.tiff', 'd/T45VUC_20250601T053649_NDVI.tif'],
+        )
+        self.assertEqual(paired, {'p/T45VUC_20250601T053649_TCI.jpg': None})
+
+    def test_skipped_previews(self):
+        scenes, skipped = pair_scenes('NDVI', [
+            'p/readme.jpg',
+            'p/T45VUC_20250601T053649_TCI.jpg',
+            'p/T45VUC_20251399T053649_NDVI.jpg',
+            'p/T45VUC_20250601T053649_NDVI.jpg',
+            'p/T45VUC_20250601T053649_NDVI.jpg',
+        ], [])
+
+        self.assertEqual([scene.date for scene in scenes], [date(2025, 6, 1)])
+        self.assertEqual([path for path, _ in skipped], [
+            'p/T45VUC_20250601T053649_TCI.jpg', 'p/T45VUC_20251399T053649_NDVI.jpg', 'p/readme.jpg',
+        ])
+
+    def test_relative_paths(self):
+        scenes, _ = pair_scenes(
+            'TCI', ['/data/Sentinel-2/preview/TCI/2025/T45VUC_20250601T053649_TCI.jpg'],
+            ['/data/Sentinel-2/TCI/2025/T45VUC_20250601T053649_TCI.tiff'], relative_to='/data'
+        )
+        self.assertEqual(scenes[0].preview_path, 'Sentinel-2/preview/TCI/2025/T45VUC_20250601T053649_TCI.jpg')
+        self.assertEqual(scenes[0].product_path, 'Sentinel-2/TCI/2025/T45VUC_20250601T053649_TCI.tiff')
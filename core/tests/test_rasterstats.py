@@ -0,0 +1,101 @@
+import io
+import os
+
+import numpy as np
+from django.core.management import call_command
+from django.test import TestCase
+
+from core.models import ImageStatistics, SatelliteImage
+from core.rasterstats import HISTOGRAM_BINS, compute_raster_stats
+
+from .utils import SyntheticArchiveMixin, TempDataRootMixin
+
+
+class ComputeRasterStatsTests(TempDataRootMixin, TestCase):
+    """Статистика растра по блокам совпадает с расчетом по всему массиву"""
+
+    def test_float_index_with_nodata(self):
+        rng = np.random.default_rng(0)
+        array = rng.uniform(-1, 1, (97, 61, 1)).astype(np.float32)
+        array[::7, ::5] = -9999
+        array[3, :10] = np.nan
+        path = self.write_product('NDVI.tif', array, nodata=-9999, rows_per_strip=8)
+
+        # Блоки по 256 пикселей: несколько блоков строк на файл
+        stats = compute_raster_stats(path, 'NDVI', block_pixels=256)
+
+        values = array[:, :, 0].astype(np.float64)
+        values = values[(values != -9999) & ~np.isnan(values)]
+        self.assertEqual(stats['valid_pixels'], values.size)
+        self.assertAlmostEqual(stats['valid_fraction'], values.size / (97 * 61))
+        self.assertAlmostEqual(stats['mean'], values.mean(), places=10)
+        self.assertAlmostEqual(stats['std'], values.std(), places=10)
+        self.assertEqual((stats['min'], stats['max']), (values.min(), values.max()))
+
+        expected, _ = np.histogram(values, bins=HISTOGRAM_BINS, range=(-1, 1))
+        self.assertEqual(sum(stats['histogram']), values.size)
+        # Границы интервалов считаются иначе, чем в numpy, расхождение - единичные пиксели
+        self.assertLessEqual(np.abs(np.array(stats['histogram']) - expected).sum(), 4)
+
+    def test_tci_brightness(self):
+        array = np.zeros((10, 10, 3), dtype=np.uint8)
+        array[:, :, 0] = 30
+        array[:, :, 1] = 60
+        array[:5, :, 2] = 90
+        path = self.write_product('TCI.tif', array)
+
+        stats = compute_raster_stats(path, 'TCI')
+
+        self.assertEqual((stats['min'], stats['max'], stats['mean']), (30.0, 60.0, 45.0))
+        self.assertEqual((stats['histogram_min'], stats['histogram_max']), (0.0, 255.0))
+
+    def test_all_nodata(self):
+        path = self.write_product('empty.tif', np.full((4, 4, 1), -9999, np.float32), nodata=-9999)
+        stats = compute_raster_stats(path, 'NDVI')
+        self.assertEqual((stats['mean'], stats['valid_pixels'], stats['valid_fraction']), (None, 0, 0.0))
+
+
+class RasterStatsCommandTests(SyntheticArchiveMixin, TestCase):
+    """compute_raster_stats считает только изменившиеся файлы, /api/timeseries/ читает результат"""
+
+    ARCHIVE = {**SyntheticArchiveMixin.ARCHIVE, 'missing_products': 0.3, 'seed': 1}
+
+    def setUp(self):
+        super().setUp()
+        self.index()
+        self.products = SatelliteImage.objects.exclude(product_path='NOT_FOUND')
+
+    def compute(self, **options):
+        out = io.StringIO()
+        call_command('compute_raster_stats', workers=1, stdout=out, stderr=io.StringIO(), **options)
+        return out.getvalue()
+
+    def test_only_changed_files(self):
+        total = self.products.count()
+        self.assertIn(f'Посчитано: {total}, без изменений: 0', self.compute())
+        self.assertEqual(ImageStatistics.objects.count(), total)
+        self.assertIn(f'Посчитано: 0, без изменений: {total}', self.compute())
+
+        image = self.products.filter(product_type='NDVI').first()
+        os.utime(self.data_path(image.product_path), ns=(0, 10 ** 18))
+        self.assertIn(f'Посчитано: 1, без изменений: {total - 1}', self.compute())
+        self.assertIn(f'Посчитано: {total}, без изменений: 0', self.compute(force=True))
+
+    def test_timeseries(self):
+        self.compute(product='NDVI')
+        tile = self.products.filter(product_type='NDVI').first().tile
+
+        response = self.client.get('/api/timeseries/', {'product': 'NDVI', 'tile': tile, 'histogram': 1})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+
+        stats = ImageStatistics.objects.filter(image__product_type='NDVI', image__tile=tile)
+        self.assertEqual(len(data['points']), stats.count())
+        self.assertEqual([point['date'] for point in data['points']],
+                         sorted(point['date'] for point in data['points']))
+        self.assertEqual(len(data['points'][0]['histogram']), HISTOGRAM_BINS)
+        self.assertEqual(data['summary']['images'], stats.count())
+        self.assertEqual(data['summary']['min'], min(stat.min for stat in stats))
+
+        self.assertEqual(self.client.get('/api/timeseries/', {'product': 'TCI'}).json()['points'], [])
+        self.assertEqual(self.client.get('/api/timeseries/', {'from': '2024-02-30'}).status_code, 400)
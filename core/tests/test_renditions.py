@@ -0,0 +1,71 @@
+import io
+import os
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from core import renditions
+from core.models import SatelliteImage
+from core.renditions import RenditionBusy, available_formats, get_rendition, rendition_cache, snap_width
+
+from .utils import SyntheticArchiveMixin
+
+
+class PreviewRenditionTests(SyntheticArchiveMixin, TestCase):
+    """Уменьшенные копии превью /preview/<id>/ и их кэш"""
+
+    ARCHIVE = {**SyntheticArchiveMixin.ARCHIVE, 'preview_size': 300}
+
+    def setUp(self):
+        super().setUp()
+        self.index()
+        self.image = SatelliteImage.objects.filter(product_type='TCI').first()
+        self.url = f'/preview/{self.image.id}/'
+
+    def rendition(self, response):
+        self.assertEqual(response.status_code, 200)
+        return Image.open(io.BytesIO(b''.join(response.streaming_content)))
+
+    def test_resized_and_cached(self):
+        fmt = 'webp' if 'webp' in available_formats() else 'png'
+        response = self.client.get(self.url, {'w': 100, 'fmt': fmt})
+        self.assertEqual(response['Content-Type'], f'image/{fmt}')
+        self.assertEqual(self.rendition(response).size, (128, 85))
+
+        # Ширина 100 округляется до той же 128, копия берется из кэша
+        self.rendition(self.client.get(self.url, {'w': 128, 'fmt': fmt}))
+        stats = rendition_cache().stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (1, 1, 1))
+
+    def test_small_source_is_not_enlarged(self):
+        image = self.rendition(self.client.get(self.url, {'w': 2000, 'fmt': 'jpeg'}))
+        self.assertEqual((image.format, image.size), ('JPEG', (300, 200)))
+
+    def test_changed_source_is_rerendered(self):
+        self.client.get(self.url, {'w': 64, 'fmt': 'png'})
+        path = self.data_path(self.image.preview_path)
+        Image.new('RGB', (200, 100)).save(path, format='JPEG')
+        os.utime(path, ns=(0, 10 ** 18))
+
+        self.assertEqual(self.rendition(self.client.get(self.url, {'w': 64, 'fmt': 'png'})).size, (64, 32))
+
+    def test_bad_requests(self):
+        self.assertEqual(self.client.get(self.url, {'fmt': 'gif'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'w': 'wide'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'w': 0}).status_code, 400)
+        self.assertEqual(self.client.get('/preview/999999/').status_code, 404)
+
+    @override_settings(PREVIEW_DECODE_TIMEOUT=0)
+    def test_busy(self):
+        # Все слоты декодирования заняты, в кэше копии нет
+        with mock.patch.object(renditions, '_decode_slots', mock.Mock(**{'acquire.return_value': False})):
+            response = self.client.get(self.url, {'w': 64, 'fmt': 'png'})
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response['Retry-After'], '1')
+
+            with self.assertRaises(RenditionBusy):
+                get_rendition(self.data_path(self.image.preview_path), 64, 'png')
+
+    def test_snap_width(self):
+        self.assertEqual([snap_width(width) for width in (1, 64, 65, 5000)], [64, 64, 128, 2048])
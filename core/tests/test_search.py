@@ -0,0 +1,60 @@
+import json
+import os
+import shutil
+import tempfile
+from datetime import date
+
+from django.test import TestCase, override_settings
+
+from core.models import SatelliteImage
+
+from .utils import PagesMixin
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class SearchPaginationTests(PagesMixin, TestCase):
+    """Страницы /api/search/ по курсору и фильтр по охвату тайлов"""
+
+    TILES = ('T45VUC', 'T45VUD', 'T45VVC')
+
+    @classmethod
+    def setUpTestData(cls):
+        for day in (1, 2, 3, 5):
+            for tile in cls.TILES:
+                SatelliteImage.objects.create(
+                    tile=tile, date=date(2025, 6, day), product_type='TCI',
+                    preview_path=f'Sentinel-2/preview/TCI/2025/{tile}_202506{day:02d}T000000_TCI.jpg',
+                    product_path='NOT_FOUND',
+                )
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        footprints = os.path.join(self.tmp, 'index_files', 'tile_footprints.json')
+        os.makedirs(os.path.dirname(footprints))
+        with open(footprints, 'w', encoding='utf-8') as f:
+            json.dump({
+                'T45VUC': [86.9, 57.6, 88.8, 58.6],
+                'T45VVC': [88.6, 57.6, 90.5, 58.6],
+                'T01KAB': [179.5, -20, -179.5, -19],
+            }, f)
+
+        settings_override = override_settings(DATA_ROOT=self.tmp, TILE_FOOTPRINTS_FILE=footprints)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_search_pages(self):
+        pages = self.collect('/api/search/', {'product': 'TCI', 'bbox': '86,57,91,59'}, 3)
+        self.assertEqual(self.keys(pages), [
+            (f'2025-06-{day:02d}', tile) for day in (1, 2, 3, 5) for tile in ('T45VUC', 'T45VVC')
+        ])
+        # Список тайлов - только на первой странице и только тайлы со снимками
+        self.assertEqual(pages[0]['tiles'], ['T45VUC', 'T45VVC'])
+        self.assertTrue(all('tiles' not in page for page in pages[1:]))
+        self.assertEqual(pages[0]['images'][0]['bbox'], [86.9, 57.6, 88.8, 58.6])
+
+    def test_search_across_antimeridian(self):
+        response = self.client.get('/api/search/?product=TCI&bbox=170,-25,-170,-10')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['images'], [])
+        self.assertEqual(response.json()['tiles'], [])
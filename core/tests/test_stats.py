@@ -0,0 +1,69 @@
+import glob
+import importlib
+import os
+
+from django.apps import apps
+from django.test import TestCase
+
+from core.models import ProductSummary, SatelliteImage
+from core.utils import SUMMARY_FIELDS, get_product_stats, summarize_images
+
+from .utils import SyntheticArchiveMixin
+
+
+def summary_rows():
+    return sorted(
+        tuple(row[field] for field in SUMMARY_FIELDS)
+        for row in ProductSummary.objects.values(*SUMMARY_FIELDS)
+    )
+
+
+def expected_rows():
+    return sorted(tuple(row[field] for field in SUMMARY_FIELDS) for row in summarize_images())
+
+
+class ProductSummaryTests(SyntheticArchiveMixin, TestCase):
+    """Сводка ProductSummary для /api/stats/ и ее обновление generate_index"""
+
+    ARCHIVE = {**SyntheticArchiveMixin.ARCHIVE, 'missing_products': 0.3, 'seed': 1}
+
+    def setUp(self):
+        super().setUp()
+        self.index()
+
+    def test_summary_matches_images(self):
+        self.assertEqual(summary_rows(), expected_rows())
+
+        stats = get_product_stats()
+        self.assertEqual(set(stats), {'TCI', 'NDVI', 'NDWI'})
+        for product_type, product in stats.items():
+            images = SatelliteImage.objects.filter(product_type=product_type)
+            self.assertEqual(product['count'], images.count())
+            self.assertEqual(product['with_product'], images.exclude(product_path='NOT_FOUND').count())
+            self.assertEqual(sum(tile['count'] for tile in product['tiles'].values()), images.count())
+
+    def test_stats_read_only_summary(self):
+        with self.assertNumQueries(1):
+            get_product_stats()
+
+    def test_api_total(self):
+        response = self.client.get('/api/stats/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total'], SatelliteImage.objects.count())
+
+    def test_reindex_of_one_product(self):
+        ndvi_before = ProductSummary.objects.filter(product_type='NDVI').count()
+        os.remove(sorted(glob.glob(os.path.join(self.data_root, 'Sentinel-2', 'preview', 'TCI', '*', '*.jpg')))[0])
+
+        self.index(product='TCI')
+
+        self.assertEqual(summary_rows(), expected_rows())
+        self.assertEqual(ProductSummary.objects.filter(product_type='NDVI').count(), ndvi_before)
+        self.assertEqual(get_product_stats()['TCI']['count'], SatelliteImage.objects.filter(product_type='TCI').count())
+
+    def test_migration_fills_summary(self):
+        # Снимки, проиндексированные до появления сводки
+        ProductSummary.objects.all().delete()
+        migration = importlib.import_module('core.migrations.0008_fill_productsummary')
+        migration.fill_product_summary(apps, None)
+        self.assertEqual(summary_rows(), expected_rows())
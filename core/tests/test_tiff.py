@@ -0,0 +1,98 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+import numpy as np
+from django.test import SimpleTestCase
+from PIL import Image, features
+
+from core import tiff
+from core.tiff import TiffReader, TiffWriter
+
+from .utils import write_test_tiff
+
+
+class TiffReaderTests(SimpleTestCase):
+    """Чтение окон из файлов со всеми поддерживаемыми раскладками и сжатиями"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        rng = np.random.default_rng(0)
+        # Размеры не кратны полосам и плиткам, чтобы проверить краевые блоки
+        self.rgb = rng.integers(0, 256, (29, 37, 3), dtype=np.uint8)
+        self.gradient = (np.arange(29 * 37, dtype=np.uint16).reshape(29, 37, 1) * 7)
+        self.floats = rng.normal(size=(29, 37, 1)).astype(np.float32)
+
+    def check(self, array, **options):
+        path = os.path.join(self.tmp, 'test.tif')
+        write_test_tiff(path, array, **options)
+
+        with TiffReader(path) as reader:
+            self.assertEqual((reader.height, reader.width, reader.samples), array.shape)
+            self.assertEqual(reader.tiled, options.get('tiled', False))
+            np.testing.assert_array_equal(reader.read_window(0, 0, 37, 29), array)
+            # Окно, пересекающее границы полос/плиток
+            np.testing.assert_array_equal(reader.read_window(5, 13, 20, 11), array[13:24, 5:25])
+            np.testing.assert_array_equal(reader.read_window(36, 28, 1, 1), array[28:29, 36:37])
+
+    def test_layouts_and_compressions(self):
+        for tiled in (False, True):
+            for compression in (1, 5, 8):
+                for array, predictor in ((self.rgb, 1), (self.rgb, 2), (self.gradient, 2), (self.floats, 3)):
+                    with self.subTest(tiled=tiled, compression=compression,
+                                      dtype=str(array.dtype), predictor=predictor):
+                        self.check(array, tiled=tiled, compression=compression, predictor=predictor)
+
+    def test_lzw_encoder_matches_pillow(self):
+        # Кодер тестовых файлов сверяется с независимым декодером Pillow
+        path = os.path.join(self.tmp, 'lzw.tif')
+        write_test_tiff(path, self.rgb, compression=5)
+        with Image.open(path) as image:
+            np.testing.assert_array_equal(np.asarray(image), self.rgb)
+
+    def test_long_lzw_strip(self):
+        # Таблица кодов переполняется и сбрасывается кодом Clear
+        array = np.random.default_rng(1).integers(0, 256, (64, 256, 1), dtype=np.uint8)
+        path = os.path.join(self.tmp, 'long.tif')
+        write_test_tiff(path, array, compression=5, chunk=64)
+
+        with TiffReader(path) as reader:
+            np.testing.assert_array_equal(reader.read_window(0, 0, 256, 64), array)
+        with Image.open(path) as image:
+            np.testing.assert_array_equal(np.asarray(image), array[:, :, 0])
+
+    def test_lzw_without_libtiff(self):
+        # Запасной декодер на Python дает те же данные, что и libtiff
+        array = np.random.default_rng(1).integers(0, 256, (64, 256, 1), dtype=np.uint8)
+        path = os.path.join(self.tmp, 'long.tif')
+        write_test_tiff(path, array, compression=5, chunk=64)
+
+        for libtiff in (features.check('libtiff'), False):
+            with self.subTest(libtiff=libtiff), mock.patch.object(tiff, '_libtiff', libtiff), \
+                    mock.patch.object(tiff, '_lzw_decode', wraps=tiff._lzw_decode) as fallback:
+                with TiffReader(path) as reader:
+                    np.testing.assert_array_equal(reader.read_window(0, 0, 256, 64), array)
+                self.assertEqual(fallback.called, not libtiff)
+
+    def test_writer_round_trip(self):
+        for compression in ('none', 'deflate'):
+            with self.subTest(compression=compression):
+                path = os.path.join(self.tmp, f'{compression}.tif')
+                with TiffWriter(path, 37, 29, np.uint8, samples=3, compression=compression,
+                                rows_per_strip=8, nodata=0) as writer:
+                    writer.write_rows(self.rgb[:10])
+                    writer.write_rows(self.rgb[10:])
+
+                with TiffReader(path) as reader:
+                    self.assertEqual(reader.nodata, 0)
+                    np.testing.assert_array_equal(reader.read_window(0, 0, 37, 29), self.rgb)
+                    np.testing.assert_array_equal(reader.read_window(3, 7, 9, 9), self.rgb[7:16, 3:12])
+
+    def test_window_outside_raster(self):
+        path = os.path.join(self.tmp, 'test.tif')
+        write_test_tiff(path, self.rgb)
+        with TiffReader(path) as reader:
+            with self.assertRaises(ValueError):
+                reader.read_window(30, 0, 8, 1)
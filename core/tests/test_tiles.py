@@ -0,0 +1,104 @@
+import io
+import os
+
+import numpy as np
+from django.core.management import call_command
+from django.test import TestCase
+from PIL import Image
+
+from core.diskcache import BoundedDiskCache
+from core.models import SatelliteImage
+from core.tiles import TILE_SIZE, render_tile, tile_cache
+
+from .utils import SyntheticArchiveMixin, TempDataRootMixin
+
+
+class MapTileTests(SyntheticArchiveMixin, TestCase):
+    """Эндпоинт /tiles/ и кэш тайлов на диске"""
+
+    ARCHIVE = {**SyntheticArchiveMixin.ARCHIVE, 'preview_size': 300}
+
+    def setUp(self):
+        super().setUp()
+        self.index()
+        self.image = SatelliteImage.objects.filter(product_type='NDVI').order_by('-date', 'tile').first()
+        self.url = f'/tiles/NDVI/{self.image.date.isoformat()}'
+
+    def tile(self, z, x, y, **params):
+        return self.client.get(f'{self.url}/{z}/{x}/{y}.png', {'tile': self.image.tile, **params})
+
+    def test_tile_is_cached(self):
+        response = self.tile(0, 0, 0)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        first = b''.join(response.streaming_content)
+        self.assertEqual(Image.open(io.BytesIO(first)).size, (TILE_SIZE, TILE_SIZE))
+
+        self.assertEqual(b''.join(self.tile(0, 0, 0).streaming_content), first)
+        stats = tile_cache().stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (1, 1, 1))
+
+    def test_tile_out_of_range(self):
+        self.assertEqual(self.tile(1, 1, 1).status_code, 200)
+        self.assertEqual(self.tile(1, 2, 0).status_code, 404)
+        self.assertEqual(self.tile(2, 0, 0).status_code, 404)
+
+    def test_bad_requests(self):
+        self.assertEqual(self.client.get('/tiles/NDVI/2024-13-01/0/0/0.png').status_code, 400)
+        self.assertEqual(self.client.get('/tiles/NDVI/1999-01-01/0/0/0.png').status_code, 404)
+
+    def test_seed_tiles_counts_unreadable_files(self):
+        with open(self.data_path(self.image.preview_path), 'wb') as f:
+            f.write(b'not an image')
+
+        out = io.StringIO()
+        call_command('seed_tiles', product='NDVI', dates=1, stdout=out, stderr=io.StringIO())
+
+        self.assertIn('Не удалось обработать файлов: 1', out.getvalue())
+        images = SatelliteImage.objects.filter(product_type='NDVI', date=self.image.date).count()
+        # Остальные снимки даты прогреты: зумы 0 и 1 дают 1 + 4 тайла у 300x200
+        self.assertEqual(tile_cache().stats()['entries'], (images - 1) * 5)
+
+
+class TiffTileTests(TempDataRootMixin, TestCase):
+    """Тайлы из TIFF читаются окнами и совпадают с тайлами Pillow"""
+
+    def test_matches_pillow(self):
+        rng = np.random.default_rng(0)
+        array = rng.integers(0, 256, (300, 200, 3), dtype=np.uint8)
+        tiff_path = self.write_product('product.tif', array, compression='deflate')
+        png_path = self.data_path('product.png')
+        Image.fromarray(array).save(png_path)
+
+        for z, x, y in ((0, 0, 0), (1, 0, 1), (1, 1, 1)):
+            self.assertEqual(render_tile(tiff_path, z, x, y), render_tile(png_path, z, x, y))
+        self.assertIsNone(render_tile(tiff_path, 1, 1, 2))
+
+
+class BoundedDiskCacheTests(TempDataRootMixin, TestCase):
+    """Размер кэша и вытеснение самых давно использованных записей"""
+
+    def setUp(self):
+        super().setUp()
+        self.cache = BoundedDiskCache(self.data_path('cache'), max_bytes=1300)
+
+    def test_overwrite_keeps_size(self):
+        self.cache.put('a', b'x' * 100)
+        self.cache.put('b', b'x' * 100)
+        self.cache.put('a', b'x' * 300)
+
+        self.assertEqual(self.cache._size, 400)
+        self.assertEqual(self.cache.stats()['size_bytes'], 400)
+
+    def test_lru_eviction(self):
+        for key in 'abcd':
+            self.cache.put(key, b'x' * 300)
+            # Время обращения хранится в mtime, ключи различаются по нему
+            os.utime(self.cache.path_for(key), ns=(0, 'abcd'.index(key) * 10 ** 9))
+        os.utime(self.cache.path_for('a'), ns=(0, 10 ** 10))
+
+        self.cache.put('e', b'x' * 300)
+
+        kept = [key for key in 'abcde' if self.cache.path_for(key).exists()]
+        self.assertEqual(kept, ['a', 'd', 'e'])
+        self.assertEqual(self.cache.stats()['evictions'], 2)
@@ -0,0 +1,48 @@
+from datetime import date
+
+from django.test import TestCase, override_settings
+
+from core.models import SatelliteImage
+
+from .utils import PagesMixin
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class TimelinePaginationTests(PagesMixin, TestCase):
+    """Страницы /api/timeline/ по курсору (дата, тайл)"""
+
+    TILES = ('T45VUC', 'T45VUD', 'T45VVC')
+
+    @classmethod
+    def setUpTestData(cls):
+        for day in (1, 2, 3, 5):
+            for tile in cls.TILES:
+                SatelliteImage.objects.create(
+                    tile=tile, date=date(2025, 6, day), product_type='TCI',
+                    preview_path=f'Sentinel-2/preview/TCI/2025/{tile}_202506{day:02d}T000000_TCI.jpg',
+                    product_path='NOT_FOUND',
+                )
+
+    def test_timeline_pages(self):
+        expected = [
+            (image_date.isoformat(), tile)
+            for image_date, tile in SatelliteImage.objects.order_by('date', 'tile').values_list('date', 'tile')
+        ]
+        for limit in (1, 2, 4, 5, 12, 100):
+            with self.subTest(limit=limit):
+                pages = self.collect('/api/timeline/', {'product': 'TCI'}, limit)
+                self.assertEqual(self.keys(pages), expected)
+                self.assertEqual(len(pages), max(1, -(-len(expected) // limit)))
+
+    def test_timeline_cursor_inside_date(self):
+        # Курсор посреди даты продолжает со следующего тайла той же даты
+        pages = self.collect('/api/timeline/', {'product': 'TCI', 'from': '2025-06-02', 'to': '2025-06-03'}, 2)
+        self.assertEqual(self.keys(pages), [
+            ('2025-06-02', 'T45VUC'), ('2025-06-02', 'T45VUD'), ('2025-06-02', 'T45VVC'),
+            ('2025-06-03', 'T45VUC'), ('2025-06-03', 'T45VUD'), ('2025-06-03', 'T45VVC'),
+        ])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/timeline/', {'product': 'TCI', 'cursor': '!!!'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Invalid cursor'})
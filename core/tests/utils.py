@@ -0,0 +1,230 @@
+import io
+import os
+import shutil
+import struct
+import tempfile
+import zlib
+from unittest import mock
+
+import numpy as np
+from django.core.management import call_command
+from django.test import override_settings
+
+from core import difference, renditions, tiles
+from core.management.commands.generate_synthetic_archive import generate_archive
+from core.tiff import TiffWriter
+
+
+def lzw_encode(data):
+    """Кодер TIFF LZW (MSB-first, ранняя смена ширины) для тестовых файлов"""
+    out = bytearray()
+    bitbuf = 0
+    bitcount = 0
+    width = 9
+
+    def emit(code):
+        nonlocal bitbuf, bitcount
+        bitbuf = (bitbuf << width) | code
+        bitcount += width
+        while bitcount >= 8:
+            bitcount -= 8
+            out.append((bitbuf >> bitcount) & 0xFF)
+        bitbuf &= (1 << bitcount) - 1
+
+    table = {bytes((i,)): i for i in range(256)}
+    emit(256)
+    prefix = b''
+    for value in data:
+        candidate = prefix + bytes((value,))
+        if candidate in table:
+            prefix = candidate
+            continue
+
+        emit(table[prefix])
+        # Следующий свободный код - len(table) + 2 (256 и 257 - Clear и EOI);
+        # декодер добавляет запись на один код позже и тогда же расширяет код
+        table[candidate] = len(table) + 2
+        if len(table) + 2 >= 4094:
+            emit(256)
+            table = {bytes((i,)): i for i in range(256)}
+            width = 9
+        elif len(table) + 2 >= (1 << width):
+            width += 1
+        prefix = bytes((value,))
+
+    if prefix:
+        emit(table[prefix])
+        if len(table) + 3 >= (1 << width) and width < 12:
+            width += 1
+    emit(257)
+    if bitcount:
+        out.append((bitbuf << (8 - bitcount)) & 0xFF)
+    return bytes(out)
+
+
+def encode_chunk(array, compression, predictor):
+    """Полоса или плитка (rows, cols, samples) в байты файла"""
+    rows, cols, samples = array.shape
+    if predictor == 2:
+        diff = array.copy()
+        diff[:, 1:] = array[:, 1:] - array[:, :-1]
+        data = diff.astype(array.dtype.newbyteorder('<')).tobytes()
+    elif predictor == 3:
+        itemsize = array.dtype.itemsize
+        planes = array.astype(array.dtype.newbyteorder('>')).view(np.uint8) \
+            .reshape(rows, cols * samples, itemsize).transpose(0, 2, 1) \
+            .reshape(rows, cols * itemsize, samples)
+        diff = planes.copy()
+        diff[:, 1:] = planes[:, 1:] - planes[:, :-1]
+        data = diff.tobytes()
+    else:
+        data = array.astype(array.dtype.newbyteorder('<')).tobytes()
+
+    if compression == 5:
+        return lzw_encode(data)
+    if compression == 8:
+        return zlib.compress(data)
+    return data
+
+
+def write_test_tiff(path, array, tiled=False, compression=1, predictor=1, chunk=16):
+    """
+    Простейший TIFF (little-endian, одно изображение) с полосами или
+    плитками chunk x chunk, независимый от TiffWriter
+    """
+    height, width, samples = array.shape
+    kind = {'u': 1, 'i': 2, 'f': 3}[array.dtype.kind]
+
+    chunks = []
+    if tiled:
+        padded = np.zeros((-(-height // chunk) * chunk, -(-width // chunk) * chunk, samples), array.dtype)
+        padded[:height, :width] = array
+        for top in range(0, height, chunk):
+            for left in range(0, width, chunk):
+                chunks.append(padded[top:top + chunk, left:left + chunk])
+    else:
+        chunks = [array[top:top + chunk] for top in range(0, height, chunk)]
+
+    body = bytearray(b'II' + struct.pack('<HI', 42, 0))
+    offsets, counts = [], []
+    for block in chunks:
+        data = encode_chunk(block, compression, predictor)
+        offsets.append(len(body))
+        counts.append(len(data))
+        body += data
+
+    tags = [
+        (256, 4, [width]), (257, 4, [height]),
+        (258, 3, [array.dtype.itemsize * 8] * samples),
+        (259, 3, [compression]), (262, 3, [2 if samples >= 3 else 1]),
+        (277, 3, [samples]), (284, 3, [1]), (317, 3, [predictor]),
+        (339, 3, [kind] * samples),
+    ]
+    if tiled:
+        tags += [(322, 3, [chunk]), (323, 3, [chunk]), (324, 4, offsets), (325, 4, counts)]
+    else:
+        tags += [(273, 4, offsets), (278, 4, [chunk]), (279, 4, counts)]
+    tags.sort()
+
+    entries = []
+    for code, type_, values in tags:
+        fmt = 'H' if type_ == 3 else 'I'
+        payload = struct.pack(f'<{len(values)}{fmt}', *values)
+        if len(payload) > 4:
+            if len(body) % 2:
+                body += b'\x00'
+            value = struct.pack('<I', len(body))
+            body += payload
+        else:
+            value = payload.ljust(4, b'\x00')
+        entries.append(struct.pack('<HHI', code, type_, len(values)) + value)
+
+    if len(body) % 2:
+        body += b'\x00'
+    struct.pack_into('<I', body, 4, len(body))
+    body += struct.pack('<H', len(entries)) + b''.join(entries) + struct.pack('<I', 0)
+
+    with open(path, 'wb') as f:
+        f.write(body)
+
+
+class PagesMixin:
+    """Обход всех страниц API с курсором next_cursor"""
+
+    def collect(self, url, params, limit):
+        pages = []
+        cursor = None
+        while True:
+            query = {**params, 'limit': limit}
+            if cursor:
+                query['cursor'] = cursor
+            response = self.client.get(url, query)
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            pages.append(page)
+            cursor = page['next_cursor']
+            if cursor is None:
+                return pages
+
+    def keys(self, pages):
+        return [(image['date'], image['tile']) for page in pages for image in page['images']]
+
+
+class TempDataRootMixin:
+    """
+    Временный DATA_ROOT на время теста: кэши тайлов, превью и разниц лежат
+    внутри него, а кэш ответов API отключен.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.data_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_root)
+
+        settings_override = override_settings(
+            DATA_ROOT=self.data_root,
+            MEDIA_ROOT=self.data_root,
+            DIFF_CACHE_DIR=os.path.join(self.data_root, 'diff_results'),
+            TILE_CACHE_DIR=os.path.join(self.data_root, 'cache', 'tiles'),
+            RENDITION_CACHE_DIR=os.path.join(self.data_root, 'cache', 'renditions'),
+            TILE_FOOTPRINTS_FILE=os.path.join(self.data_root, 'index_files', 'tile_footprints.json'),
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        # Кэши на диске создаются заново под временный DATA_ROOT
+        for module, name in ((difference, '_difference_cache'), (tiles, '_tile_cache'),
+                             (renditions, '_rendition_cache')):
+            patcher = mock.patch.object(module, name, None)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def data_path(self, relative_path):
+        return os.path.join(self.data_root, relative_path)
+
+    def write_product(self, relative_path, array, **options):
+        """GeoTIFF продукта (rows, cols, samples) по пути относительно DATA_ROOT"""
+        path = self.data_path(relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        height, width, samples = array.shape
+        with TiffWriter(path, width, height, array.dtype, samples=samples, **options) as writer:
+            writer.write_rows(array)
+        return path
+
+
+class SyntheticArchiveMixin(TempDataRootMixin):
+    """Маленький синтетический архив Sentinel-2 во временном DATA_ROOT"""
+
+    ARCHIVE = {'tiles': 3, 'dates': 4, 'preview_size': 8, 'product_size': 8}
+
+    def setUp(self):
+        super().setUp()
+        generate_archive(self.data_root, **self.ARCHIVE)
+
+    def index(self, **options):
+        """generate_index по временному архиву, возвращает его вывод"""
+        out = io.StringIO()
+        options.setdefault('skip_index_files', True)
+        call_command('generate_index', data_dir=self.data_root, stdout=out, stderr=io.StringIO(), **options)
+        return out.getvalue()
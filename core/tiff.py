@@ -0,0 +1,576 @@
+"""
+Минимальное чтение и запись GeoTIFF по окнам.
+
+Файл читается по полосам (strips) или плиткам (tiles): read_window
+распаковывает только те из них, что пересекают окно, поэтому память
+и ввод-вывод пропорциональны окну, а не всей сцене. Несжатые файлы
+читаются через mmap. Поддерживаются сжатия none / LZW / Deflate / PackBits,
+предикторы 2 и 3 и порядок пикселей PlanarConfiguration=1. LZW
+распаковывается через libtiff из Pillow, а без него - декодером на Python
+(в десятки раз медленнее, но тоже только нужные полосы).
+"""
+import io
+import mmap
+import struct
+import zlib
+
+import numpy as np
+from PIL import Image, features
+
+
+# Теги TIFF, которые нужны при чтении и записи
+IMAGE_WIDTH = 256
+IMAGE_LENGTH = 257
+BITS_PER_SAMPLE = 258
+COMPRESSION = 259
+PHOTOMETRIC = 262
+STRIP_OFFSETS = 273
+SAMPLES_PER_PIXEL = 277
+ROWS_PER_STRIP = 278
+STRIP_BYTE_COUNTS = 279
+PLANAR_CONFIG = 284
+PREDICTOR = 317
+TILE_WIDTH = 322
+TILE_LENGTH = 323
+TILE_OFFSETS = 324
+TILE_BYTE_COUNTS = 325
+EXTRA_SAMPLES = 338
+SAMPLE_FORMAT = 339
+MODEL_PIXEL_SCALE = 33550
+MODEL_TIEPOINT = 33922
+MODEL_TRANSFORMATION = 34264
+GEO_KEY_DIRECTORY = 34735
+GEO_DOUBLE_PARAMS = 34736
+GEO_ASCII_PARAMS = 34737
+GDAL_METADATA = 42112
+GDAL_NODATA = 42113
+
+# Геопривязка копируется из исходника в результат без изменений
+GEO_TAGS = (
+    MODEL_PIXEL_SCALE, MODEL_TIEPOINT, MODEL_TRANSFORMATION,
+    GEO_KEY_DIRECTORY, GEO_DOUBLE_PARAMS, GEO_ASCII_PARAMS,
+)
+
+COMPRESSION_NONE = 1
+COMPRESSION_LZW = 5
+COMPRESSION_DEFLATE = 8
+COMPRESSION_ADOBE_DEFLATE = 32946
+COMPRESSION_PACKBITS = 32773
+
+# Тип тега -> (формат struct, размер)
+TAG_TYPES = {
+    1: ('B', 1), 2: ('s', 1), 3: ('H', 2), 4: ('I', 4), 5: ('II', 8),
+    6: ('b', 1), 7: ('B', 1), 8: ('h', 2), 9: ('i', 4), 10: ('ii', 8),
+    11: ('f', 4), 12: ('d', 8), 16: ('Q', 8), 17: ('q', 8), 18: ('Q', 8),
+}
+
+SAMPLE_KINDS = {1: 'u', 2: 'i', 3: 'f'}
+
+
+class TiffError(ValueError):
+    """Файл не является TIFF или использует неподдерживаемые возможности"""
+
+
+def _lzw_decode(data):
+    """Декодер TIFF LZW (MSB-first, с ранней сменой ширины кода)"""
+    out = bytearray()
+    table = [bytes((i,)) for i in range(256)] + [b'', b'']
+    width = 9
+    bitbuf = 0
+    bitcount = 0
+    prev = None
+
+    for byte in data:
+        bitbuf = (bitbuf << 8) | byte
+        bitcount += 8
+
+        while bitcount >= width:
+            bitcount -= width
+            code = (bitbuf >> bitcount) & ((1 << width) - 1)
+            bitbuf &= (1 << bitcount) - 1
+
+            if code == 257:
+                return bytes(out)
+            if code == 256:
+                del table[258:]
+                width = 9
+                prev = None
+                continue
+
+            if prev is None:
+                entry = table[code]
+            elif code < len(table):
+                entry = table[code]
+                table.append(prev + entry[:1])
+            else:
+                entry = prev + prev[:1]
+                table.append(entry)
+
+            out += entry
+            prev = entry
+            if len(table) + 1 >= (1 << width) and width < 12:
+                width += 1
+
+    return bytes(out)
+
+
+_libtiff = None
+
+
+def _libtiff_available():
+    global _libtiff
+    if _libtiff is None:
+        _libtiff = features.check('libtiff')
+    return _libtiff
+
+
+def _pillow_lzw_decode(data, row_bytes, rows):
+    """
+    LZW через libtiff из Pillow.
+
+    Сжатая полоса оборачивается в минимальный TIFF из одной полосы
+    8-битного серого row_bytes x rows: LZW работает с байтами, поэтому тип
+    и число каналов снимка не важны, а предиктор применяется после распаковки.
+    """
+    entries = [
+        struct.pack('<HHII', IMAGE_WIDTH, 4, 1, row_bytes),
+        struct.pack('<HHII', IMAGE_LENGTH, 4, 1, rows),
+        struct.pack('<HHIH2x', BITS_PER_SAMPLE, 3, 1, 8),
+        struct.pack('<HHIH2x', COMPRESSION, 3, 1, COMPRESSION_LZW),
+        struct.pack('<HHIH2x', PHOTOMETRIC, 3, 1, 1),
+        None,
+        struct.pack('<HHIH2x', SAMPLES_PER_PIXEL, 3, 1, 1),
+        struct.pack('<HHII', ROWS_PER_STRIP, 4, 1, rows),
+        struct.pack('<HHII', STRIP_BYTE_COUNTS, 4, 1, len(data)),
+    ]
+    offset = 8 + 2 + 12 * len(entries) + 4
+    entries[5] = struct.pack('<HHII', STRIP_OFFSETS, 4, 1, offset)
+
+    header = b'II' + struct.pack('<HI', 42, 8) + struct.pack('<H', len(entries)) + b''.join(entries)
+    with Image.open(io.BytesIO(header + struct.pack('<I', 0) + bytes(data))) as image:
+        return image.tobytes()
+
+
+def _lzw_decode_chunk(data, row_bytes, rows):
+    """Распаковка LZW: libtiff, если он есть в Pillow, иначе декодер на Python"""
+    if _libtiff_available():
+        try:
+            return _pillow_lzw_decode(data, row_bytes, rows)
+        except (OSError, ValueError):
+            pass
+    return _lzw_decode(data)
+
+
+def _packbits_decode(data):
+    out = bytearray()
+    pos = 0
+    while pos < len(data):
+        n = data[pos]
+        pos += 1
+        if n < 128:
+            out += data[pos:pos + n + 1]
+            pos += n + 1
+        elif n > 128:
+            out += data[pos:pos + 1] * (257 - n)
+            pos += 1
+    return bytes(out)
+
+
+class TiffReader:
+    """Чтение первого изображения (IFD) TIFF/BigTIFF окнами"""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.file = open(self.path, 'rb')
+        self._mmap = None
+        try:
+            self._parse()
+        except Exception:
+            self.file.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self.file.close()
+
+    def _read(self, offset, size):
+        self.file.seek(offset)
+        return self.file.read(size)
+
+    def _parse(self):
+        header = self._read(0, 16)
+        if header[:2] == b'II':
+            self.byteorder = '<'
+        elif header[:2] == b'MM':
+            self.byteorder = '>'
+        else:
+            raise TiffError('Не TIFF-файл')
+
+        magic = struct.unpack(self.byteorder + 'H', header[2:4])[0]
+        if magic == 42:
+            self.bigtiff = False
+            ifd_offset = struct.unpack(self.byteorder + 'I', header[4:8])[0]
+        elif magic == 43:
+            self.bigtiff = True
+            ifd_offset = struct.unpack(self.byteorder + 'Q', header[8:16])[0]
+        else:
+            raise TiffError('Не TIFF-файл')
+
+        self.tags = self._read_ifd(ifd_offset)
+
+        def tag(code, default=None):
+            values = self.tags.get(code, (None, default))[1]
+            return values
+
+        self.width = tag(IMAGE_WIDTH)[0]
+        self.height = tag(IMAGE_LENGTH)[0]
+        self.samples = tag(SAMPLES_PER_PIXEL, [1])[0]
+        bits = tag(BITS_PER_SAMPLE, [1])[0]
+        sample_format = tag(SAMPLE_FORMAT, [1])[0]
+        self.compression = tag(COMPRESSION, [COMPRESSION_NONE])[0]
+        self.predictor = tag(PREDICTOR, [1])[0]
+        self.photometric = tag(PHOTOMETRIC, [1])[0]
+
+        if tag(PLANAR_CONFIG, [1])[0] != 1 and self.samples > 1:
+            raise TiffError('PlanarConfiguration=2 не поддерживается')
+        if bits not in (8, 16, 32, 64) or sample_format not in SAMPLE_KINDS:
+            raise TiffError(f'Неподдерживаемый тип пикселя: {bits} бит, SampleFormat={sample_format}')
+        if self.compression not in (COMPRESSION_NONE, COMPRESSION_LZW, COMPRESSION_DEFLATE,
+                                    COMPRESSION_ADOBE_DEFLATE, COMPRESSION_PACKBITS):
+            raise TiffError(f'Сжатие {self.compression} не поддерживается')
+
+        self.dtype = np.dtype(f'{self.byteorder}{SAMPLE_KINDS[sample_format]}{bits // 8}')
+
+        if TILE_WIDTH in self.tags:
+            self.tiled = True
+            self.chunk_width = tag(TILE_WIDTH)[0]
+            self.chunk_height = tag(TILE_LENGTH)[0]
+            self.offsets = tag(TILE_OFFSETS)
+            self.byte_counts = tag(TILE_BYTE_COUNTS)
+        else:
+            self.tiled = False
+            self.chunk_width = self.width
+            self.chunk_height = min(tag(ROWS_PER_STRIP, [self.height])[0], self.height)
+            self.offsets = tag(STRIP_OFFSETS)
+            self.byte_counts = tag(STRIP_BYTE_COUNTS)
+
+        self.chunks_across = -(-self.width // self.chunk_width)
+
+        nodata = tag(GDAL_NODATA)
+        self.nodata = float(nodata.rstrip(b'\x00').decode('ascii')) if nodata else None
+
+    def _read_ifd(self, offset):
+        order = self.byteorder
+        if self.bigtiff:
+            count_fmt, entry_size, inline = 'Q', 20, 8
+        else:
+            count_fmt, entry_size, inline = 'H', 12, 4
+
+        count_size = struct.calcsize(count_fmt)
+        count = struct.unpack(order + count_fmt, self._read(offset, count_size))[0]
+        raw = self._read(offset + count_size, count * entry_size)
+
+        tags = {}
+        for i in range(count):
+            entry = raw[i * entry_size:(i + 1) * entry_size]
+            if self.bigtiff:
+                code, type_, n = struct.unpack(order + 'HHQ', entry[:12])
+                value = entry[12:20]
+            else:
+                code, type_, n = struct.unpack(order + 'HHI', entry[:8])
+                value = entry[8:12]
+
+            if type_ not in TAG_TYPES:
+                continue
+
+            fmt, size = TAG_TYPES[type_]
+            total = size * n
+            if total > inline:
+                pointer = struct.unpack(order + ('Q' if self.bigtiff else 'I'), value)[0]
+                value = self._read(pointer, total)
+
+            if type_ == 2:
+                tags[code] = (type_, value[:n])
+            else:
+                tags[code] = (type_, list(struct.unpack(f'{order}{n * len(fmt)}{fmt[0]}', value[:total])))
+
+        return tags
+
+    def geo_tags(self):
+        """Теги геопривязки для передачи в TiffWriter(extra_tags=...)"""
+        return [(code, *self.tags[code]) for code in GEO_TAGS if code in self.tags]
+
+    def window_geo_tags(self, x, y):
+        """
+        geo_tags() для окна с левым верхним пикселем (x, y): точки привязки
+        и матрица преобразования сдвигаются на начало окна.
+        """
+        tags = []
+        for code, type_, values in self.geo_tags():
+            values = list(values)
+            if code == MODEL_TIEPOINT and len(values) == 6 and MODEL_PIXEL_SCALE in self.tags:
+                # Одна точка и масштаб: точка переносится в угол окна
+                i, j, _, tie_x, tie_y, _ = values
+                scale_x, scale_y = self.tags[MODEL_PIXEL_SCALE][1][:2]
+                values[:5] = [0.0, 0.0, 0.0, tie_x + (x - i) * scale_x, tie_y - (y - j) * scale_y]
+            elif code == MODEL_TIEPOINT:
+                # Шестерки (i, j, k, X, Y, Z): пиксель (i, j) файла - это (i - x, j - y) окна
+                for start in range(0, len(values) - 5, 6):
+                    values[start] -= x
+                    values[start + 1] -= y
+            elif code == MODEL_TRANSFORMATION:
+                values[3] += values[0] * x + values[1] * y
+                values[7] += values[4] * x + values[5] * y
+            tags.append((code, type_, values))
+        return tags
+
+    def geo_transform(self):
+        """
+        (x0, pixel_width, y0, pixel_height) по ModelTiepoint и ModelPixelScale
+        или None, если геопривязки нет.
+        """
+        if MODEL_TIEPOINT not in self.tags or MODEL_PIXEL_SCALE not in self.tags:
+            return None
+
+        i, j, _, x, y, _ = self.tags[MODEL_TIEPOINT][1][:6]
+        scale_x, scale_y = self.tags[MODEL_PIXEL_SCALE][1][:2]
+        return x - i * scale_x, scale_x, y + j * scale_y, scale_y
+
+    def _decode_chunk(self, index, rows, cols):
+        """Распакованная полоса или плитка как массив (rows, cols, samples)"""
+        offset = self.offsets[index]
+        size = self.byte_counts[index]
+        itemsize = self.dtype.itemsize
+        expected = rows * cols * self.samples * itemsize
+
+        if self.compression == COMPRESSION_NONE:
+            if self._mmap is None:
+                self._mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            data = np.frombuffer(self._mmap, dtype=np.uint8, count=expected, offset=offset)
+        else:
+            raw = self._read(offset, size)
+            if self.compression == COMPRESSION_LZW:
+                raw = _lzw_decode_chunk(raw, cols * self.samples * itemsize, rows)
+            elif self.compression == COMPRESSION_PACKBITS:
+                raw = _packbits_decode(raw)
+            else:
+                raw = zlib.decompress(raw)
+            data = np.frombuffer(raw, dtype=np.uint8, count=expected)
+
+        if self.predictor == 3:
+            # Плавающий предиктор: байты строки разложены по значимости
+            # (старшие первыми) и продифференцированы с шагом samples
+            data = data.reshape(rows, cols * itemsize, self.samples)
+            data = np.cumsum(data, axis=1, dtype=np.uint8).reshape(rows, itemsize, cols * self.samples)
+            data = data.transpose(0, 2, 1).copy()
+            return data.view(self.dtype.newbyteorder('>')).reshape(rows, cols, self.samples)
+
+        array = data.view(self.dtype).reshape(rows, cols, self.samples)
+        if self.predictor == 2:
+            array = np.cumsum(array, axis=1, dtype=self.dtype)
+        return array
+
+    def read_window(self, x, y, width, height):
+        """
+        Окно растра (height, width, samples) в типе файла.
+
+        Читаются только полосы/плитки, пересекающие окно.
+        """
+        if x < 0 or y < 0 or width <= 0 or height <= 0 \
+                or x + width > self.width or y + height > self.height:
+            raise TiffError('Окно выходит за пределы растра')
+
+        out = np.empty((height, width, self.samples), dtype=self.dtype.newbyteorder('='))
+
+        row_first = y // self.chunk_height
+        row_last = (y + height - 1) // self.chunk_height
+        col_first = x // self.chunk_width
+        col_last = (x + width - 1) // self.chunk_width
+
+        for chunk_row in range(row_first, row_last + 1):
+            top = chunk_row * self.chunk_height
+            if self.tiled:
+                rows = self.chunk_height
+            else:
+                rows = min(self.chunk_height, self.height - top)
+
+            for chunk_col in range(col_first, col_last + 1):
+                left = chunk_col * self.chunk_width
+                chunk = self._decode_chunk(
+                    chunk_row * self.chunks_across + chunk_col, rows, self.chunk_width
+                )
+
+                y0, y1 = max(y, top), min(y + height, top + rows)
+                x0, x1 = max(x, left), min(x + width, left + self.chunk_width)
+                out[y0 - y:y1 - y, x0 - x:x1 - x] = chunk[y0 - top:y1 - top, x0 - left:x1 - left]
+
+        return out
+
+    def block_rows(self, max_pixels):
+        """Высота блока строк, кратная высоте полосы/плитки, не больше ~max_pixels пикселей"""
+        rows = max(1, max_pixels // max(1, self.width))
+        return max(self.chunk_height, rows // self.chunk_height * self.chunk_height)
+
+    def iter_row_blocks(self, rows):
+        """Растр блоками по rows строк во всю ширину: (y, массив)"""
+        for y in range(0, self.height, rows):
+            height = min(rows, self.height - y)
+            yield y, self.read_window(0, y, self.width, height)
+
+
+class TiffWriter:
+    """
+    Последовательная запись TIFF полосами.
+
+    Строки подаются сверху вниз через write_rows, полосы сжимаются
+    и сразу пишутся в файл; IFD записывается в конце при close().
+    Файл может быть путем или объектом с методами write/seek/tell.
+    """
+
+    def __init__(self, target, width, height, dtype, samples=1, compression='deflate',
+                 rows_per_strip=None, extra_tags=(), nodata=None, bigtiff=None):
+        self.width = width
+        self.height = height
+        self.dtype = np.dtype(dtype).newbyteorder('<')
+        self.samples = samples
+        self.compression = compression
+        self.extra_tags = list(extra_tags)
+        self.nodata = nodata
+
+        row_bytes = width * samples * self.dtype.itemsize
+        self.rows_per_strip = rows_per_strip or max(1, min(height, (256 * 1024) // max(1, row_bytes)))
+        if bigtiff is None:
+            bigtiff = row_bytes * height > 0xF0000000
+        self.bigtiff = bigtiff
+
+        self._own_file = isinstance(target, (str, bytes)) or hasattr(target, '__fspath__')
+        self.file = open(target, 'wb') if self._own_file else target
+        self._start = self.file.tell()
+        self._pending = []
+        self._pending_rows = 0
+        self._rows_written = 0
+        self.offsets = []
+        self.byte_counts = []
+
+        # Заголовок с нулевым смещением IFD, оно дописывается в close()
+        if self.bigtiff:
+            self.file.write(b'II' + struct.pack('<HHHQ', 43, 8, 0, 0))
+        else:
+            self.file.write(b'II' + struct.pack('<HI', 42, 0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        elif self._own_file:
+            self.file.close()
+
+    def write_rows(self, array):
+        array = np.asarray(array)
+        if array.ndim == 2:
+            array = array[:, :, np.newaxis]
+        if array.shape[1:] != (self.width, self.samples):
+            raise TiffError('Размер блока не совпадает с размером изображения')
+
+        self._pending.append(array.astype(self.dtype, copy=False))
+        self._pending_rows += array.shape[0]
+
+        while self._pending_rows >= self.rows_per_strip:
+            self._flush_strip(self.rows_per_strip)
+
+    def _flush_strip(self, rows):
+        block = np.concatenate(self._pending) if len(self._pending) > 1 else self._pending[0]
+        strip, rest = block[:rows], block[rows:]
+        self._pending = [rest] if len(rest) else []
+        self._pending_rows = len(rest)
+
+        data = np.ascontiguousarray(strip).tobytes()
+        if self.compression == 'deflate':
+            data = zlib.compress(data, 6)
+
+        self.offsets.append(self.file.tell() - self._start)
+        self.byte_counts.append(len(data))
+        self.file.write(data)
+        self._rows_written += rows
+
+    def close(self):
+        if self._pending_rows:
+            self._flush_strip(self._pending_rows)
+        if self._rows_written != self.height:
+            raise TiffError(f'Записано {self._rows_written} строк из {self.height}')
+
+        offset_type = 16 if self.bigtiff else 4
+        kind = {'u': 1, 'i': 2, 'f': 3}[self.dtype.kind]
+        tags = [
+            (IMAGE_WIDTH, 4, [self.width]),
+            (IMAGE_LENGTH, 4, [self.height]),
+            (BITS_PER_SAMPLE, 3, [self.dtype.itemsize * 8] * self.samples),
+            (COMPRESSION, 3, [COMPRESSION_ADOBE_DEFLATE if self.compression == 'deflate' else COMPRESSION_NONE]),
+            (PHOTOMETRIC, 3, [2 if self.samples >= 3 else 1]),
+            (STRIP_OFFSETS, offset_type, self.offsets),
+            (SAMPLES_PER_PIXEL, 3, [self.samples]),
+            (ROWS_PER_STRIP, 4, [self.rows_per_strip]),
+            (STRIP_BYTE_COUNTS, offset_type, self.byte_counts),
+            (PLANAR_CONFIG, 3, [1]),
+            (SAMPLE_FORMAT, 3, [kind] * self.samples),
+        ]
+        if self.samples in (2, 4):
+            tags.append((EXTRA_SAMPLES, 3, [0]))
+        if self.nodata is not None:
+            tags.append((GDAL_NODATA, 2, f'{self.nodata}'.encode('ascii') + b'\x00'))
+
+        known = {code for code, _, _ in tags}
+        tags.extend(tag for tag in self.extra_tags if tag[0] not in known)
+        tags.sort(key=lambda tag: tag[0])
+
+        self._write_ifd(tags)
+        if self._own_file:
+            self.file.close()
+
+    def _write_ifd(self, tags):
+        if self.bigtiff:
+            count_fmt, entry_fmt, inline, pointer_fmt = '<Q', '<HHQ', 8, '<Q'
+        else:
+            count_fmt, entry_fmt, inline, pointer_fmt = '<H', '<HHI', 4, '<I'
+
+        # Значения, не помещающиеся в запись IFD, пишутся перед ним
+        entries = []
+        for code, type_, values in tags:
+            fmt, size = TAG_TYPES[type_]
+            if type_ == 2:
+                payload = bytes(values)
+                count = len(payload)
+            else:
+                count = len(values) // (2 if len(fmt) == 2 else 1)
+                payload = struct.pack(f'<{len(values)}{fmt[0]}', *values)
+
+            if len(payload) > inline:
+                if (self.file.tell() - self._start) % 2:
+                    self.file.write(b'\x00')
+                pointer = self.file.tell() - self._start
+                self.file.write(payload)
+                value = struct.pack(pointer_fmt, pointer)
+            else:
+                value = payload.ljust(inline, b'\x00')
+            entries.append(struct.pack(entry_fmt, code, type_, count) + value)
+
+        if (self.file.tell() - self._start) % 2:
+            self.file.write(b'\x00')
+        ifd_offset = self.file.tell() - self._start
+        self.file.write(struct.pack(count_fmt, len(entries)) + b''.join(entries))
+        self.file.write(struct.pack(pointer_fmt, 0))
+        end = self.file.tell()
+
+        self.file.seek(self._start + (8 if self.bigtiff else 4))
+        self.file.write(struct.pack(pointer_fmt, ifd_offset))
+        self.file.seek(end)
@@ -0,0 +1,172 @@
+import io
+import math
+import os
+
+import numpy as np
+from django.conf import settings
+from PIL import Image
+
+from .diskcache import BoundedDiskCache
+from .metrics import track
+from .tiff import TiffError, TiffReader
+
+
+TILE_SIZE = 256
+
+TIFF_EXTENSIONS = ('.tif', '.tiff')
+
+# Сколько пикселей окна TIFF читается за один шаг при построении тайла
+TILE_BLOCK_PIXELS = 4 * 1024 * 1024
+
+# Режим Pillow по числу каналов uint8 TIFF
+TIFF_MODES = {1: 'L', 3: 'RGB', 4: 'RGBA'}
+
+_tile_cache = None
+
+
+def tile_cache():
+    """Общий кэш тайлов (размер ограничен settings.TILE_CACHE_MAX_BYTES)"""
+    global _tile_cache
+    if _tile_cache is None:
+        _tile_cache = BoundedDiskCache(settings.TILE_CACHE_DIR, settings.TILE_CACHE_MAX_BYTES)
+    return _tile_cache
+
+
+def max_zoom(width, height):
+    """Зум, на котором растр отображается в исходном разрешении"""
+    return max(0, math.ceil(math.log2(max(width, height) / TILE_SIZE)))
+
+
+def tile_box(width, height, z, x, y):
+    """
+    Область растра (в пикселях исходника) для тайла z/x/y или None.
+
+    Пирамида строится в координатах изображения: на зуме z большая сторона
+    растра вписывается в TILE_SIZE * 2**z пикселей, начало - левый верхний угол.
+    """
+    if z < 0 or z > max_zoom(width, height):
+        return None
+
+    tiles = 2 ** z
+    if not (0 <= x < tiles and 0 <= y < tiles):
+        return None
+
+    scale = max(width, height) / (TILE_SIZE * tiles)
+    left, top = x * TILE_SIZE * scale, y * TILE_SIZE * scale
+    if left >= width or top >= height:
+        return None
+
+    return left, top, left + TILE_SIZE * scale, top + TILE_SIZE * scale
+
+
+def _tile_png(region, size):
+    """PNG-тайл: область растра, уменьшенная до size, в левом верхнем углу"""
+    # Крайние тайлы обрезаются по границе растра, остаток прозрачный
+    tile = Image.new('RGBA', (TILE_SIZE, TILE_SIZE), (0, 0, 0, 0))
+    tile.paste(region.convert('RGBA').resize(size, Image.LANCZOS), (0, 0))
+
+    buffer = io.BytesIO()
+    tile.save(buffer, format='PNG', optimize=False)
+    return buffer.getvalue()
+
+
+def _clip(box, width, height):
+    """Область тайла, обрезанная по растру, и размер ее изображения в тайле"""
+    clipped = (box[0], box[1], min(box[2], width), min(box[3], height))
+    scale = TILE_SIZE / (box[2] - box[0])
+    size = (
+        max(1, round((clipped[2] - clipped[0]) * scale)),
+        max(1, round((clipped[3] - clipped[1]) * scale)),
+    )
+    return tuple(round(value) for value in clipped), size
+
+
+def _render_tiff_tile(reader, z, x, y):
+    """
+    Тайл из TIFF через TiffReader: распаковываются только полосы/плитки,
+    пересекающие тайл, а на мелких зумах строки и столбцы прореживаются
+    при чтении блоками, так что в памяти не держится весь растр.
+    """
+    box = tile_box(reader.width, reader.height, z, x, y)
+    if box is None:
+        return None
+
+    if reader.dtype != np.uint8 or reader.samples not in TIFF_MODES:
+        raise ValueError(f'Растр {reader.dtype} x{reader.samples} не поддерживается для тайлов')
+
+    (left, top, right, bottom), size = _clip(box, reader.width, reader.height)
+    # Прореживание оставляет не меньше 2 пикселей исходника на пиксель тайла
+    step = max(1, (right - left) // (size[0] * 2))
+    chunk = reader.chunk_height
+    rows = max(chunk, TILE_BLOCK_PIXELS // (right - left) // chunk * chunk)
+
+    parts = []
+    row = top
+    while row < bottom:
+        # Блоки выравниваются по полосам, чтобы не распаковывать их дважды
+        end = min(bottom, (row // chunk) * chunk + rows)
+        block = reader.read_window(left, row, right - left, end - row)
+        parts.append(block[(top - row) % step::step, ::step])
+        row = end
+
+    array = np.concatenate(parts)
+    if reader.samples == 1:
+        array = array[:, :, 0]
+    return _tile_png(Image.fromarray(array, TIFF_MODES[reader.samples]), size)
+
+
+@track('render')
+def render_tile(source_path, z, x, y):
+    """PNG-тайл z/x/y из растра или None, если тайл вне растра"""
+    if os.path.splitext(source_path)[1].lower() in TIFF_EXTENSIONS:
+        try:
+            with TiffReader(source_path) as reader:
+                return _render_tiff_tile(reader, z, x, y)
+        except TiffError:
+            # Сжатие или раскладку, которые TiffReader не читает, открывает Pillow
+            pass
+
+    with Image.open(source_path) as image:
+        width, height = image.size
+        box = tile_box(width, height, z, x, y)
+        if box is None:
+            return None
+
+        if image.mode not in ('RGB', 'RGBA', 'L', 'P'):
+            raise ValueError(f'Растр в режиме {image.mode} не поддерживается для тайлов')
+
+        # JPEG декодируется сразу в уменьшенном виде (DCT scaling),
+        # поэтому мелкие зумы не требуют полного декодирования снимка
+        factor = TILE_SIZE / (box[2] - box[0])
+        if factor < 1:
+            image.draft('RGB', (max(1, int(width * factor)), max(1, int(height * factor))))
+            draft_scale = image.size[0] / width
+            box = tuple(value * draft_scale for value in box)
+            width, height = image.size
+
+        clipped, size = _clip(box, width, height)
+        return _tile_png(image.crop(clipped), size)
+
+
+def get_tile(source_path, z, x, y):
+    """
+    Открытый на чтение PNG-тайл (генерируется при промахе) или None.
+
+    Ключ включает mtime исходника, так что перезаписанный снимок
+    не отдает устаревших тайлов, а старые записи уходят по LRU.
+    Возвращается файл, а не путь: запись может быть вытеснена другим
+    процессом в любой момент после обращения.
+    """
+    mtime = os.stat(source_path).st_mtime_ns
+    key = f'{source_path}:{mtime}:{z}/{x}/{y}'
+
+    cache = tile_cache()
+    cached = cache.open_entry(key, '.png')
+    if cached is not None:
+        return cached
+
+    data = render_tile(source_path, z, x, y)
+    if data is None:
+        return None
+    cache.put(key, data, '.png')
+    return io.BytesIO(data)
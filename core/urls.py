@@ -1,9 +1,25 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+if settings.ASYNC_VIEWS:
+    # Под ASGI: те же представления в пуле потоков с таймаутом
+    from . import async_views as views
+
 urlpatterns = [
     path('', views.index, name='index'),
     path('api/available-dates/', views.api_available_dates, name='available_dates'),
     path('api/image-for-date/', views.api_image_for_date, name='image_for_date'),
+    path('api/stats/', views.api_stats, name='stats'),
+    path('api/timeline/', views.api_timeline, name='timeline'),
+    path('api/timeseries/', views.api_timeseries, name='timeseries'),
+    path('api/search/', views.api_search, name='search'),
+    path('api/difference/', views.api_difference_submit, name='difference_submit'),
+    path('api/difference/<int:job_id>/', views.api_difference_status, name='difference_status'),
     path('download-product/', views.download_product, name='download_product'),
+    path('download-product/crop/', views.download_product_crop, name='download_product_crop'),
+    path('download-product/bulk/', views.download_product_bulk, name='download_product_bulk'),
+    path('preview/<int:image_id>/', views.preview_rendition, name='preview_rendition'),
+    path('tiles/<str:product>/<str:date>/<int:z>/<int:x>/<int:y>.png', views.map_tile, name='map_tile'),
+    path('metrics', views.metrics, name='metrics'),
 ]
\ No newline at end of file
@@ -2,7 +2,10 @@ import os
 import json
 from datetime import datetime
 from pathlib import Path
-from .models import SatelliteImage
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q, Subquery
+from django.db.models.functions import ExtractYear
+from .models import ProductSummary, SatelliteImage
 
 
 def parse_filename(filename):
@@ -25,6 +28,22 @@ def parse_filename(filename):
         return None
 
 
+def split_scene_name(filename):
+    """
+    Разбирает имя файла сцены без обращения к диску.
+
+    T45VUC_20240610T053649_TCI_10m.tiff -> ('T45VUC', '20240610T053649', 'TCI')
+    Возвращает None, если имя не похоже на сцену Sentinel-2.
+    """
+    base = os.path.splitext(filename)[0]
+    parts = base.split('_')
+
+    if len(parts) < 3 or len(parts[1]) < 8 or not parts[1][:8].isdigit():
+        return None
+
+    return parts[0], parts[1], parts[2]
+
+
 def get_available_dates(product_type=None):
     """Получает список доступных дат для продукта"""
     try:
@@ -40,42 +59,141 @@ def get_available_dates(product_type=None):
         return []
 
 
-def find_image_by_date(date_str, product_type='TC'):
+# Направления поиска ближайшей даты: не позже, не раньше или ближайшая с любой стороны
+NEAREST_DIRECTIONS = ('before', 'after', 'closest')
+
+
+def find_images_by_date(date_str, product_type='TCI', tile=None, direction='before'):
+    """
+    Снимки на дату или, если ее нет, на ближайшую дату в направлении direction.
+
+    Возвращает все тайлы найденной даты одним запросом: ближайшая дата
+    выбирается подзапросом по индексу (product_type, date).
+    Для 'closest' при равном удалении берется более ранняя дата.
+    Некорректная дата или направление поднимают ValueError.
     """
-    Быстрый поиск снимка по дате и типу продукта.
+    if direction not in NEAREST_DIRECTIONS:
+        raise ValueError(f'Unknown direction: {direction}')
+
+    date_obj = datetime.strptime(date_str, '%Y-%m-%d').date()
+
+    images = SatelliteImage.objects.filter(product_type=product_type)
+    if tile:
+        images = images.filter(tile=tile)
+
+    before = Q(date=Subquery(images.filter(date__lte=date_obj).order_by('-date').values('date')[:1]))
+    after = Q(date=Subquery(images.filter(date__gte=date_obj).order_by('date').values('date')[:1]))
+    nearest = {'before': before, 'after': after, 'closest': before | after}[direction]
+
+    found = list(images.filter(nearest).order_by('date', 'tile'))
+    if direction == 'closest' and found:
+        best = min({image.date for image in found}, key=lambda d: (abs((d - date_obj).days), d))
+        found = [image for image in found if image.date == best]
+
+    return found
+
+
+def find_image_by_date(date_str, product_type='TCI', direction='before'):
+    """
+    Быстрый поиск снимка по дате и типу продукта (один запрос).
     """
     try:
-        date_obj = datetime.strptime(date_str, '%Y-%m-%d').date()
-        return SatelliteImage.objects.get(date=date_obj, product_type=product_type)
-    except SatelliteImage.DoesNotExist:
-        # Пробуем найти ближайшую дату
-        images = SatelliteImage.objects.filter(
-            product_type=product_type,
-            date__lte=date_obj
-        ).order_by('-date')
-
-        if images.exists():
-            return images.first()
-        return None
+        images = find_images_by_date(date_str, product_type, direction=direction)
+        return images[0] if images else None
     except Exception as e:
         print(f"Error finding image: {e}")
         return None
 
 
+SUMMARY_FIELDS = ('product_type', 'year', 'tile', 'count', 'with_product', 'first_date', 'last_date')
+
+
+def summarize_images(product_types=None):
+    """
+    Один сгруппированный запрос по SatelliteImage: строки сводки
+    (продукт, год, тайл) с числом снимков, числом найденных файлов
+    продукта и первой/последней датой.
+    """
+    images = SatelliteImage.objects.all()
+    if product_types is not None:
+        images = images.filter(product_type__in=product_types)
+
+    return list(
+        images.annotate(year=ExtractYear('date'))
+        .values('product_type', 'year', 'tile')
+        .annotate(
+            count=Count('id'),
+            with_product=Count('id', filter=~Q(product_path='NOT_FOUND')),
+            first_date=Min('date'),
+            last_date=Max('date'),
+        )
+        .order_by()
+    )
+
+
+def refresh_product_summary(product_types=None):
+    """Пересчитывает ProductSummary для указанных продуктов (по умолчанию всех)"""
+    rows = summarize_images(product_types)
+
+    with transaction.atomic():
+        summary = ProductSummary.objects.all()
+        if product_types is not None:
+            summary = summary.filter(product_type__in=product_types)
+        summary.delete()
+        ProductSummary.objects.bulk_create([ProductSummary(**row) for row in rows])
+
+    return len(rows)
+
+
+def _add_to_group(group, row):
+    group['count'] += row['count']
+    group['with_product'] += row['with_product']
+    if group['first_date'] is None or row['first_date'] < group['first_date']:
+        group['first_date'] = row['first_date']
+    if group['last_date'] is None or row['last_date'] > group['last_date']:
+        group['last_date'] = row['last_date']
+
+
+def _new_group():
+    return {'count': 0, 'with_product': 0, 'first_date': None, 'last_date': None}
+
+
+def _finish_group(group):
+    group['coverage'] = group['with_product'] / group['count'] if group['count'] else 0.0
+    for field in ('first_date', 'last_date'):
+        if group[field] is not None:
+            group[field] = group[field].isoformat()
+    return group
+
+
 def get_product_stats():
-    """Статистика по продуктам"""
+    """
+    Статистика по продуктам: всего, по годам и по тайлам.
+
+    Читается только из ProductSummary (один запрос без обращения к
+    SatelliteImage); сводку поддерживает generate_index.
+    """
     stats = {}
     try:
-        for product_type, label in SatelliteImage.PRODUCT_TYPES:
-            count = SatelliteImage.objects.filter(product_type=product_type).count()
-            dates = SatelliteImage.objects.filter(product_type=product_type) \
-                .dates('date', 'year').order_by('-date')
-            stats[product_type] = {
-                'count': count,
-                'years': [d.year for d in dates],
-                'label': label
-            }
+        rows = list(ProductSummary.objects.values(*SUMMARY_FIELDS))
+
+        labels = dict(SatelliteImage.PRODUCT_TYPES)
+        for row in sorted(rows, key=lambda r: (r['product_type'], r['year'], r['tile'])):
+            product = stats.setdefault(row['product_type'], {
+                'label': labels.get(row['product_type'], row['product_type']),
+                **_new_group(),
+                'years': {},
+                'tiles': {},
+            })
+            _add_to_group(product, row)
+            _add_to_group(product['years'].setdefault(str(row['year']), _new_group()), row)
+            _add_to_group(product['tiles'].setdefault(row['tile'], _new_group()), row)
+
+        for product in stats.values():
+            _finish_group(product)
+            for group in list(product['years'].values()) + list(product['tiles'].values()):
+                _finish_group(group)
     except Exception as e:
         print(f"Error getting product stats: {e}")
 
-    return stats
\ No newline at end of file
+    return stats
@@ -1,178 +1,690 @@
 from django.shortcuts import render
-from django.http import JsonResponse, FileResponse
+from django.http import HttpResponse, JsonResponse, FileResponse, StreamingHttpResponse
 from django.conf import settings
-from pathlib import Path
-
-
+from django.views.decorators.cache import never_cache
+from django.views.decorators.csrf import ensure_csrf_cookie
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import require_GET, require_POST
+from django.db.models import Q
+from django.utils.http import content_disposition_header
+from PIL import Image
+import binascii
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+
+from .apicache import cached_catalog_data, catalog_cached
+from .catalog import get_catalog
+from .crop import WindowTooLarge, crop_response
+from .downloads import data_file, file_response, iter_zip
+from .footprints import get_tile_index, parse_bbox
+from .jobs import job_payload, submit_difference_job
+from .metrics import registry
+from .models import DifferenceJob, ImageStatistics, SatelliteImage
+from .renditions import FORMATS, RenditionBusy, available_formats, get_rendition
+from .tiles import get_tile
+from .utils import NEAREST_DIRECTIONS, find_images_by_date, get_product_stats
+
+
+@ensure_csrf_cookie
 def index(request):
     """Главная страница"""
     return render(request, 'core/index.html')
 
 
+@gzip_page
+@catalog_cached(60)
 def api_available_dates(request):
     """API: список доступных дат"""
     product_type = request.GET.get('product', 'TCI')
 
     try:
-        data_root = Path(settings.DATA_ROOT)
-        preview_dir = data_root / 'Sentinel-2' / 'preview' / product_type
-
-        dates = set()
-
-        if preview_dir.exists():
-            # Ищем все JPG файлы
-            for ext in ['.jpg', '.JPG']:
-                for file_path in preview_dir.rglob(f"*{ext}"):
-                    try:
-                        filename = file_path.name
-                        # Парсим дату из имени файла
-                        # Формат: T45VUC_20240610T053649_TCI.jpg
-                        parts = filename.split('_')
-                        if len(parts) >= 3:
-                            date_part = parts[1]  # 20240610T053649
-                            date_str = date_part[:8]  # YYYYMMDD
-                            formatted_date = f"{date_str[:4]}-{date_str[4:6]}-{date_str[6:8]}"
-                            dates.add(formatted_date)
-                    except:
-                        continue
-
-        # Сортируем по убыванию (новые сначала)
-        sorted_dates = sorted(list(dates), reverse=True)
-        return JsonResponse({'dates': sorted_dates})
+        # Даты берутся прямо из каталога в памяти процесса, без общего кэша:
+        # каталог сам отслеживает mtime директорий, и новые файлы видны
+        # до переиндексации
+        return JsonResponse({'dates': get_catalog().available_dates(product_type)})
+
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+@gzip_page
+@catalog_cached(300)
+def api_stats(request):
+    """
+    API: статистика по продуктам (всего, по годам, по тайлам, доля
+    найденных файлов продуктов). Читается из сводки ProductSummary.
+    """
+    try:
+        stats = cached_catalog_data('stats', [], get_product_stats)
+        return JsonResponse({
+            'total': sum(product['count'] for product in stats.values()),
+            'products': stats
+        })
 
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
 
+def _download_url(product_path):
+    if not product_path or product_path == 'NOT_FOUND':
+        return '#'
+    return f'/download-product/?path={product_path}'
+
+
+def _image_payload(tile, date_obj, product_type, preview_path, product_path, image_id=None):
+    payload = {
+        'preview_url': f'/media/{preview_path}',
+        'download_url': _download_url(product_path),
+        'tile': tile,
+        'date': date_obj.isoformat(),
+        'product_type': product_type
+    }
+
+    if image_id is not None:
+        # Уменьшенные копии превью (см. preview_rendition)
+        payload['thumbnail_url'] = f'/preview/{image_id}/?w=256&fmt=webp'
+        payload['display_url'] = f'/preview/{image_id}/?w=1024&fmt=webp'
+
+    return payload
+
+
+def _images_for_date(selected_date, product_type, tile, direction='before'):
+    """Описания снимков на дату из базы (некорректная дата - ValueError)"""
+    return [
+        _image_payload(image.tile, image.date, image.product_type,
+                       image.preview_path, image.product_path, image.pk)
+        for image in find_images_by_date(selected_date, product_type, tile, direction)
+    ]
+
+
+def _catalog_images_for_date(selected_date, product_type, tile, direction):
+    """
+    Запасной путь, пока база не проиндексирована: сцены каталога в памяти
+    с тем же поиском ближайшей даты, что и в базе
+    """
+    date_iso = datetime.strptime(selected_date, '%Y-%m-%d').date().isoformat()
+    return [
+        _image_payload(scene.tile, scene.date, scene.product,
+                       scene.preview_path, scene.product_path)
+        for scene in get_catalog().scenes_near_date(product_type, date_iso, tile, direction)
+    ]
+
+
+@gzip_page
+@catalog_cached(300)
 def api_image_for_date(request):
-    """API: информация о снимке на дату"""
+    """
+    API: информация о снимке на дату.
+
+    Снимок ищется в SatelliteImage: ближайшая дата не позже запрошенной
+    или, с ?nearest=after|closest, не раньше / ближайшая с любой стороны.
+    ?tile= ограничивает поиск одним тайлом, ?all_tiles=1 возвращает
+    все тайлы найденной даты списком images. Ответы кэшируются
+    до следующей переиндексации. Пока снимков нет в базе, тот же поиск
+    выполняется по каталогу в памяти.
+    """
     selected_date = request.GET.get('date')
     product_type = request.GET.get('product', 'TCI')
+    tile = request.GET.get('tile')
+    direction = request.GET.get('nearest', 'before')
+    all_tiles = request.GET.get('all_tiles') in ('1', 'true')
 
     if not selected_date:
         return JsonResponse({'error': 'Date parameter is required'}, status=400)
+    if direction not in NEAREST_DIRECTIONS:
+        return JsonResponse({'error': f'nearest must be one of {", ".join(NEAREST_DIRECTIONS)}'}, status=400)
 
     try:
-        data_root = Path(settings.DATA_ROOT)
-        date_str = selected_date.replace('-', '')  # 20240610
+        try:
+            images = cached_catalog_data(
+                'image_for_date', [product_type, selected_date, tile, direction],
+                lambda: _images_for_date(selected_date, product_type, tile, direction)
+            )
+        except ValueError:
+            return JsonResponse({'error': 'Invalid date format, expected YYYY-MM-DD'}, status=400)
 
-        # 1. Ищем превью (JPG)
-        preview_dir = data_root / 'Sentinel-2' / 'preview' / product_type
-        found_preview = None
-        tile = None
-        original_filename = None
+        if not images:
+            # Не кэшируется: каталог сам отслеживает изменения директорий
+            images = _catalog_images_for_date(selected_date, product_type, tile, direction)
 
-        if preview_dir.exists():
-            # Ищем файлы с этой датой
-            patterns = [
-                f"*{date_str}*{product_type}.jpg",
-                f"*{date_str}*{product_type}.JPG",
-            ]
+        if not images:
+            return JsonResponse({'error': 'Preview image not found'}, status=404)
 
-            for pattern in patterns:
-                matches = list(preview_dir.rglob(pattern))
-                if matches:
-                    found_preview = matches[0]
-                    original_filename = found_preview.stem  # T45VUC_20240610T053649_TCI
+        if all_tiles:
+            return JsonResponse({
+                'date': images[0]['date'],
+                'product_type': product_type,
+                'images': images
+            })
 
-                    # Извлекаем тайл
-                    parts = original_filename.split('_')
-                    if len(parts) >= 1:
-                        tile = parts[0]
-                    break
+        return JsonResponse(images[0])
 
-        if not found_preview:
-            return JsonResponse({'error': 'Preview image not found'}, status=404)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+TIMELINE_DEFAULT_LIMIT = 500
+TIMELINE_MAX_LIMIT = 5000
+
+
+def _encode_cursor(date_obj, tile):
+    return urlsafe_b64encode(f'{date_obj.isoformat()}|{tile}'.encode()).decode()
+
+
+def _decode_cursor(cursor):
+    """(дата, тайл) последней отданной записи; некорректный курсор - ValueError"""
+    try:
+        date_str, tile = urlsafe_b64decode(cursor.encode()).decode().split('|', 1)
+    except (UnicodeError, binascii.Error) as e:
+        raise ValueError(str(e))
+    return datetime.strptime(date_str, '%Y-%m-%d').date(), tile
+
+
+def _page_params(request):
+    """
+    (date_from, date_to, limit, after) из ?from=&to=&limit=&cursor=
+    или ValueError с текстом ошибки для ответа 400
+    """
+    try:
+        date_from = request.GET.get('from')
+        date_to = request.GET.get('to')
+        date_from = datetime.strptime(date_from, '%Y-%m-%d').date() if date_from else None
+        date_to = datetime.strptime(date_to, '%Y-%m-%d').date() if date_to else None
+    except ValueError:
+        raise ValueError('Invalid date format, expected YYYY-MM-DD')
+
+    try:
+        limit = int(request.GET.get('limit', TIMELINE_DEFAULT_LIMIT))
+    except ValueError:
+        raise ValueError('Limit must be an integer')
+    if not 1 <= limit <= TIMELINE_MAX_LIMIT:
+        raise ValueError(f'Limit must be between 1 and {TIMELINE_MAX_LIMIT}')
 
-        # 2. Получаем относительный путь для превью
-        preview_rel = str(found_preview.relative_to(data_root))
-        preview_url = f'/media/{preview_rel}'
-
-        # 3. Ищем файл продукта (TIFF)
-        product_dir = data_root / 'Sentinel-2' / product_type
-        product_file = None
-
-        if product_dir.exists():
-            # Варианты имен файлов продуктов:
-            # 1. T45VUC_20240610T053649_TCI.tiff (без _10m)
-            # 2. T45VUC_20240610T053649_TCI_10m.tiff (с _10m)
-
-            # Сначала ищем без _10m
-            year = date_str[:4]
-            search_dirs = [
-                product_dir / year,
-                product_dir
-            ]
-
-            # Варианты имен (сначала без _10m, потом с _10m)
-            filename_variants = [
-                f"{original_filename}.tiff",
-                f"{original_filename}.tif",
-                f"{original_filename}_10m.tiff",
-                f"{original_filename}_10m.tif",
-            ]
-
-            for search_dir in search_dirs:
-                if search_dir.exists():
-                    for filename in filename_variants:
-                        product_path = search_dir / filename
-                        if product_path.exists():
-                            product_file = product_path
-                            break
-                    if product_file:
-                        break
-
-            # Если не нашли по точному имени, ищем по паттерну
-            if not product_file:
-                patterns = [
-                    f"*{date_str}*{product_type}.tiff",
-                    f"*{date_str}*{product_type}.tif",
-                    f"*{date_str}*{product_type}*.tiff",
-                    f"*{date_str}*{product_type}*.tif",
+    cursor = request.GET.get('cursor')
+    try:
+        after = _decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise ValueError('Invalid cursor')
+
+    return date_from, date_to, limit, after
+
+
+def _timeline_page(product_type, date_from, date_to, tile, after, limit, tiles=None):
+    """
+    Страница снимков диапазона в порядке (дата, тайл) и курсор следующей.
+    tiles ограничивает выборку списком тайлов (поиск по bbox).
+    """
+    images = SatelliteImage.objects.filter(product_type=product_type)
+    if date_from:
+        images = images.filter(date__gte=date_from)
+    if date_to:
+        images = images.filter(date__lte=date_to)
+    if tile:
+        images = images.filter(tile=tile)
+    if tiles is not None:
+        images = images.filter(tile__in=tiles)
+    if after:
+        # Keyset-пагинация: продолжение строго после (дата, тайл) курсора
+        images = images.filter(Q(date__gt=after[0]) | Q(date=after[0], tile__gt=after[1]))
+
+    rows = list(
+        images.order_by('date', 'tile')
+        .values_list('id', 'tile', 'date', 'preview_path', 'product_path')[:limit + 1]
+    )
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1][2], rows[-1][1])
+
+    return {
+        'product_type': product_type,
+        'images': [
+            _image_payload(tile_name, date_obj, product_type, preview_path, product_path, image_id)
+            for image_id, tile_name, date_obj, preview_path, product_path in rows
+        ],
+        'next_cursor': next_cursor,
+    }
+
+
+@gzip_page
+@catalog_cached(300)
+def api_timeline(request):
+    """
+    API: все снимки продукта за период одним запросом.
+
+    ?product=&from=&to=&tile= - снимки в порядке (дата, тайл), страницами
+    по ?limit= (по умолчанию 500); следующая страница - ?cursor=<next_cursor>.
+    ?date=&nearest=before|after|closest - все тайлы ближайшей к дате даты.
+    """
+    product_type = request.GET.get('product', 'TCI')
+    tile = request.GET.get('tile')
+    selected_date = request.GET.get('date')
+
+    if selected_date:
+        direction = request.GET.get('nearest', 'closest')
+        if direction not in NEAREST_DIRECTIONS:
+            return JsonResponse({'error': f'nearest must be one of {", ".join(NEAREST_DIRECTIONS)}'}, status=400)
+
+        try:
+            images = cached_catalog_data(
+                'timeline_nearest', [product_type, selected_date, tile, direction],
+                lambda: [
+                    _image_payload(image.tile, image.date, image.product_type,
+                                   image.preview_path, image.product_path, image.pk)
+                    for image in find_images_by_date(selected_date, product_type, tile, direction)
                 ]
+            )
+        except ValueError:
+            return JsonResponse({'error': 'Invalid date format, expected YYYY-MM-DD'}, status=400)
+        except Exception as e:
+            return JsonResponse({'error': str(e)}, status=500)
 
-                for pattern in patterns:
-                    matches = list(product_dir.rglob(pattern))
-                    if matches:
-                        product_file = matches[0]
-                        break
+        return JsonResponse({'product_type': product_type, 'images': images, 'next_cursor': None})
 
-        if product_file:
-            product_rel = str(product_file.relative_to(data_root))
-            download_url = f'/download-product/?path={product_rel}'
-        else:
-            download_url = '#'
+    try:
+        date_from, date_to, limit, after = _page_params(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
 
-        return JsonResponse({
-            'preview_url': preview_url,
-            'download_url': download_url,
-            'tile': tile or 'T45VUC',
-            'date': selected_date,
-            'product_type': product_type
-        })
+    try:
+        page = cached_catalog_data(
+            'timeline', [product_type, date_from, date_to, tile, request.GET.get('cursor'), limit],
+            lambda: _timeline_page(product_type, date_from, date_to, tile, after, limit)
+        )
+        return JsonResponse(page)
+
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+
+def _search_page(product_type, tiles, footprints, date_from, date_to, after, limit):
+    """
+    Страница снимков тайлов из tiles с охватом тайла у каждого снимка.
+    Первая страница (без курсора) содержит и список найденных тайлов,
+    у которых есть снимки продукта.
+    """
+    # Тайлы реестра без снимков не попадают ни в IN (...), ни в ответ
+    indexed = set(
+        SatelliteImage.objects.filter(product_type=product_type)
+        .values_list('tile', flat=True).distinct()
+    )
+    tiles = [tile for tile in tiles if tile in indexed]
+
+    if not tiles:
+        page = {'product_type': product_type, 'images': [], 'next_cursor': None}
+    else:
+        page = _timeline_page(product_type, date_from, date_to, None, after, limit, tiles=tiles)
+
+    for image in page['images']:
+        image['bbox'] = list(footprints[image['tile']])
+    if after is None:
+        page['tiles'] = tiles
+    return page
+
+
+@gzip_page
+@catalog_cached(300)
+def api_search(request):
+    """
+    API: снимки, охват тайла которых пересекает ?bbox=запад,юг,восток,север
+    (градусы WGS84; запад > восток - bbox через антимеридиан).
+
+    Тайлы выбираются по сеточному индексу охватов (core.footprints), снимки -
+    тем же запросом, что и в /api/timeline/: ?product=&from=&to=, страницы
+    по ?limit= и ?cursor=.
+    """
+    product_type = request.GET.get('product', 'TCI')
+
+    try:
+        bbox = parse_bbox(request.GET.get('bbox'))
+        date_from, date_to, limit, after = _page_params(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    try:
+        index = get_tile_index()
+        if not len(index):
+            return JsonResponse({'error': 'Tile footprints are not loaded'}, status=503)
+
+        tiles = index.query(bbox)
+        page = cached_catalog_data(
+            'search', [product_type, ','.join(map(str, bbox)), date_from, date_to, request.GET.get('cursor'), limit, index.version],
+            lambda: _search_page(product_type, tiles, index.footprints, date_from, date_to, after, limit)
+        )
+        return JsonResponse(page)
+
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+def _timeseries(product_type, tile, date_from, date_to, with_histogram):
+    """Точки ряда из ImageStatistics (один запрос с JOIN) и сводка по ним"""
+    stats = ImageStatistics.objects.filter(image__product_type=product_type)
+    if tile:
+        stats = stats.filter(image__tile=tile)
+    if date_from:
+        stats = stats.filter(image__date__gte=date_from)
+    if date_to:
+        stats = stats.filter(image__date__lte=date_to)
+
+    fields = ['image__date', 'image__tile', 'min', 'max', 'mean', 'std', 'valid_fraction', 'valid_pixels']
+    if with_histogram:
+        fields += ['histogram', 'histogram_min', 'histogram_max']
+
+    points = []
+    for row in stats.order_by('image__date', 'image__tile').values(*fields):
+        row['date'] = row.pop('image__date').isoformat()
+        row['tile'] = row.pop('image__tile')
+        points.append(row)
+
+    # Среднее за период взвешивается числом валидных пикселей снимков
+    valid = [point for point in points if point['valid_pixels']]
+    pixels = sum(point['valid_pixels'] for point in valid)
+    summary = {
+        'images': len(points),
+        'mean': sum(point['mean'] * point['valid_pixels'] for point in valid) / pixels if pixels else None,
+        'min': min((point['min'] for point in valid), default=None),
+        'max': max((point['max'] for point in valid), default=None),
+    }
+
+    return {'product_type': product_type, 'tile': tile, 'points': points, 'summary': summary}
+
+
+@gzip_page
+@catalog_cached(300)
+def api_timeseries(request):
+    """
+    API: ряд статистики растров (min/max/mean/std, доля валидных пикселей)
+    по датам: ?product=&tile=&from=&to=, ?histogram=1 добавляет гистограммы.
+
+    Отвечает только из базы; статистику заполняет compute_raster_stats.
+    """
+    product_type = request.GET.get('product', 'NDVI')
+    tile = request.GET.get('tile')
+    with_histogram = request.GET.get('histogram') in ('1', 'true')
+
+    try:
+        date_from = request.GET.get('from')
+        date_to = request.GET.get('to')
+        date_from = datetime.strptime(date_from, '%Y-%m-%d').date() if date_from else None
+        date_to = datetime.strptime(date_to, '%Y-%m-%d').date() if date_to else None
+    except ValueError:
+        return JsonResponse({'error': 'Invalid date format, expected YYYY-MM-DD'}, status=400)
+
+    try:
+        data = cached_catalog_data(
+            'timeseries', [product_type, tile, date_from, date_to, with_histogram],
+            lambda: _timeseries(product_type, tile, date_from, date_to, with_histogram)
+        )
+        return JsonResponse(data)
 
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
 
 def download_product(request):
-    """Скачивание продукта"""
+    """
+    Скачивание продукта.
+
+    Поддерживает докачку (Range), условные запросы (ETag/Last-Modified)
+    и отдачу через фронт-прокси (settings.DOWNLOAD_ACCEL_MODE).
+    """
     file_path = request.GET.get('path')
 
     if not file_path:
         return JsonResponse({'error': 'File path is required'}, status=400)
 
     try:
-        full_path = Path(settings.DATA_ROOT) / file_path
+        full_path = data_file(file_path)
 
-        if full_path.exists():
-            return FileResponse(
-                open(full_path, 'rb'),
-                as_attachment=True,
-                filename=full_path.name
-            )
+        if full_path is not None:
+            return file_response(request, full_path)
         else:
             return JsonResponse({'error': 'File not found'}, status=404)
 
     except Exception as e:
-        return JsonResponse({'error': str(e)}, status=500)
\ No newline at end of file
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+def download_product_bulk(request):
+    """
+    ZIP-архив продуктов за период: ?product=&tile=&from=&to=.
+
+    Файлы находятся через SatelliteImage и отдаются одним потоком без
+    временных файлов (ZIP_STORED, ZIP64 для больших архивов). Число файлов
+    ограничено settings.BULK_DOWNLOAD_MAX_FILES; записи без файла пропускаются.
+    """
+    product_type = request.GET.get('product', 'TCI')
+    tile = request.GET.get('tile')
+
+    try:
+        date_from = request.GET.get('from')
+        date_to = request.GET.get('to')
+        date_from = datetime.strptime(date_from, '%Y-%m-%d').date() if date_from else None
+        date_to = datetime.strptime(date_to, '%Y-%m-%d').date() if date_to else None
+    except ValueError:
+        return JsonResponse({'error': 'Invalid date format, expected YYYY-MM-DD'}, status=400)
+
+    try:
+        images = SatelliteImage.objects.filter(product_type=product_type).exclude(product_path='NOT_FOUND')
+        if tile:
+            images = images.filter(tile=tile)
+        if date_from:
+            images = images.filter(date__gte=date_from)
+        if date_to:
+            images = images.filter(date__lte=date_to)
+
+        max_files = getattr(settings, 'BULK_DOWNLOAD_MAX_FILES', 1000)
+        paths = list(images.order_by('date', 'tile').values_list('product_path', flat=True)[:max_files + 1])
+        if len(paths) > max_files:
+            return JsonResponse({'error': f'More than {max_files} files, narrow the date range'}, status=400)
+
+        files = []
+        for relative_path in paths:
+            full_path = data_file(relative_path)
+            if full_path is not None:
+                files.append((full_path.name, full_path))
+
+        if not files:
+            return JsonResponse({'error': 'No product files found'}, status=404)
+
+        filename = f"{product_type}_{tile or 'all'}_{date_from or 'start'}_{date_to or 'end'}.zip"
+        response = StreamingHttpResponse(iter_zip(files), content_type='application/zip')
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+        return response
+
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+def download_product_crop(request):
+    """
+    Скачивание окна продукта как GeoTIFF.
+
+    ?window=x,y,ширина,высота - окно в пикселях, ?bbox=xmin,ymin,xmax,ymax -
+    в координатах файла (для Sentinel-2 метры UTM). Читаются только полосы
+    или плитки исходника, пересекающие окно; размер окна ограничен
+    settings.CROP_MAX_PIXELS.
+    """
+    file_path = request.GET.get('path')
+    window = request.GET.get('window')
+    bbox = request.GET.get('bbox')
+
+    if not file_path:
+        return JsonResponse({'error': 'File path is required'}, status=400)
+    if bool(window) == bool(bbox):
+        return JsonResponse({'error': 'Exactly one of window or bbox is required'}, status=400)
+
+    try:
+        full_path = data_file(file_path)
+        if full_path is None:
+            return JsonResponse({'error': 'File not found'}, status=404)
+        if full_path.suffix.lower() not in ('.tif', '.tiff'):
+            return JsonResponse({'error': 'Only TIFF products can be cropped'}, status=400)
+
+        try:
+            return crop_response(request, full_path, window, bbox)
+        except WindowTooLarge as e:
+            return JsonResponse({'error': str(e)}, status=413)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+def map_tile(request, product, date, z, x, y):
+    """
+    Тайл карты z/x/y (PNG) для снимка продукта на дату.
+
+    ?tile= выбирает тайл MGRS (по умолчанию первый за дату),
+    ?source=product режет тайлы из файла продукта вместо превью.
+    """
+    tile = request.GET.get('tile')
+    source = request.GET.get('source', 'preview')
+
+    try:
+        date_obj = datetime.strptime(date, '%Y-%m-%d').date()
+    except ValueError:
+        return JsonResponse({'error': 'Invalid date format, expected YYYY-MM-DD'}, status=400)
+
+    try:
+        images = SatelliteImage.objects.filter(product_type=product, date=date_obj)
+        if tile:
+            images = images.filter(tile=tile)
+
+        image = images.order_by('tile').first()
+        if image is None:
+            return JsonResponse({'error': 'Image not found'}, status=404)
+
+        relative_path = image.product_path if source == 'product' else image.preview_path
+        full_path = data_file(relative_path)
+        if full_path is None:
+            return JsonResponse({'error': 'File not found'}, status=404)
+
+        try:
+            tile_file = get_tile(str(full_path), z, x, y)
+        except Image.DecompressionBombError:
+            return JsonResponse({'error': 'Image is too large to render'}, status=400)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        if tile_file is None:
+            return JsonResponse({'error': 'Tile out of range'}, status=404)
+
+        response = FileResponse(tile_file, content_type='image/png')
+        response['Cache-Control'] = 'public, max-age=86400'
+        return response
+
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+def preview_rendition(request, image_id):
+    """
+    Уменьшенная копия превью снимка: ?w=<ширина>&fmt=webp|jpeg|png.
+
+    Копии кэшируются на диске с ключом по mtime исходника.
+    """
+    fmt = request.GET.get('fmt', 'webp')
+    if fmt not in FORMATS or fmt not in available_formats():
+        return JsonResponse({'error': f'Unsupported format: {fmt}'}, status=400)
+
+    try:
+        width = int(request.GET.get('w', 256))
+    except ValueError:
+        return JsonResponse({'error': 'Width must be an integer'}, status=400)
+    if width <= 0:
+        return JsonResponse({'error': 'Width must be positive'}, status=400)
+
+    try:
+        image = SatelliteImage.objects.filter(pk=image_id).first()
+        if image is None:
+            return JsonResponse({'error': 'Image not found'}, status=404)
+
+        full_path = data_file(image.preview_path)
+        if full_path is None:
+            return JsonResponse({'error': 'File not found'}, status=404)
+
+        try:
+            rendition_file, content_type = get_rendition(str(full_path), width, fmt)
+        except RenditionBusy:
+            response = JsonResponse({'error': 'Server is busy, try again later'}, status=503)
+            response['Retry-After'] = '1'
+            return response
+        except Image.DecompressionBombError:
+            return JsonResponse({'error': 'Image is too large to render'}, status=400)
+
+        response = FileResponse(rendition_file, content_type=content_type)
+        response['Cache-Control'] = 'public, max-age=86400'
+        return response
+
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+@never_cache
+@require_POST
+def api_difference_submit(request):
+    """
+    API: постановка расчета разницы в очередь.
+
+    Параметры формы: date1, date2, product (по умолчанию TCI), tile.
+    Если результат уже есть в кэше, сразу отвечает 200 со статусом done и
+    ссылками на результат; иначе возвращает id задания (202 для нового),
+    расчет выполняет run_workers.
+    """
+    product_type = request.POST.get('product', 'TCI')
+    tile = request.POST.get('tile', '')
+
+    try:
+        date1 = datetime.strptime(request.POST.get('date1', ''), '%Y-%m-%d').date()
+        date2 = datetime.strptime(request.POST.get('date2', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return JsonResponse({'error': 'Invalid date format, expected YYYY-MM-DD'}, status=400)
+
+    if date1 == date2:
+        return JsonResponse({'error': 'Dates must differ'}, status=400)
+
+    try:
+        job, created = submit_difference_job(date1, date2, product_type, tile)
+        payload = job_payload(job)
+        payload['status_url'] = f'/api/difference/{job.id}/'
+        return JsonResponse(payload, status=202 if created else 200)
+
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+@never_cache
+@require_GET
+def api_difference_status(request, job_id):
+    """
+    API: состояние задания на расчет разницы и ссылки на результат.
+
+    Только читает задание: готовое задание, результат которого уже
+    вытеснен из кэша, отдается со статусом expired, а снова в очередь
+    его ставит повторная отправка в api_difference_submit.
+    """
+    try:
+        job = DifferenceJob.objects.filter(pk=job_id).first()
+        if job is None:
+            return JsonResponse({'error': 'Job not found'}, status=404)
+
+        return JsonResponse(job_payload(job))
+
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+@never_cache
+@require_GET
+def metrics(request):
+    """
+    Метрики в текстовом формате Prometheus: число запросов, гистограммы
+    длительности и операции с базой/файлами по имени маршрута.
+    Счетчики свои у каждого процесса сервера.
+    """
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,23 @@
+"""
+Функции, выполняемые в процессах пула run_workers.
+
+Процессы стартуют через spawn, поэтому модуль не импортирует модели
+на верхнем уровне: Django настраивается в init_worker.
+"""
+import django
+
+
+def init_worker():
+    """Инициализация Django в процессе пула"""
+    django.setup()
+
+
+def run_difference(date1, date2, product_type, tile):
+    """Расчет разницы; статус задания пишет только главный процесс"""
+    from django.db import connections
+    from core.management.commands.generate_difference import generate_difference
+
+    try:
+        return generate_difference(date1, date2, product_type, tile or None)
+    finally:
+        connections.close_all()
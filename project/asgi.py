@@ -0,0 +1,7 @@
+import os
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+# Под ASGI маршруты используют асинхронные представления (core.async_views)
+os.environ.setdefault('DJANGO_ASYNC_VIEWS', '1')
+application = get_asgi_application()
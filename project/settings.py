@@ -18,6 +18,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Первым: Server-Timing и метрики /metrics учитывают всю цепочку
+    'core.middleware.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -64,6 +66,63 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'data')
 # Ваши специфичные настройки
 DATA_ROOT = os.path.join(BASE_DIR, 'data')
 
+# Общий для всех процессов кэш ответов API, которые читают базу (снимки,
+# таймлайн, статистика); списки дат отдает каталог в памяти процесса.
+# Ключи включают штамп версии каталога, который меняет generate_index
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'django'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+CATALOG_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Как часто (в секундах) каталог снимков в памяти проверяет mtime директорий
+CATALOG_CHECK_INTERVAL = 5
+
+# Реестр охватов тайлов MGRS для /api/search/ (заполняет import_tile_footprints)
+# и размер ячейки сетки пространственного индекса в градусах
+TILE_FOOTPRINTS_FILE = os.path.join(DATA_ROOT, 'index_files', 'tile_footprints.json')
+TILE_INDEX_CELL_DEGREES = 1.0
+
+# Отдача файлов продуктов фронт-прокси: None (отдает Django),
+# 'nginx' (X-Accel-Redirect) или 'apache' (X-Sendfile)
+DOWNLOAD_ACCEL_MODE = None
+# internal location nginx, который указывает на DATA_ROOT
+DOWNLOAD_ACCEL_PREFIX = '/protected-data/'
+
+# Наибольшее окно /download-product/crop/ в пикселях (5000x5000)
+CROP_MAX_PIXELS = 25_000_000
+
+# Сколько файлов можно скачать одним ZIP-архивом (/download-product/bulk/)
+BULK_DOWNLOAD_MAX_FILES = 1000
+
+# Кэш тайлов карты (/tiles/...): директория и предельный размер
+TILE_CACHE_DIR = os.path.join(BASE_DIR, 'cache', 'tiles')
+TILE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Уменьшенные копии превью (/preview/<id>/?w=&fmt=)
+RENDITION_CACHE_DIR = os.path.join(BASE_DIR, 'cache', 'renditions')
+RENDITION_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# Сколько превью процесс может декодировать одновременно и сколько ждать слот
+PREVIEW_MAX_DECODES = 2
+PREVIEW_DECODE_TIMEOUT = 10
+
+# Результаты generate_difference (кэш по исходным файлам; отдаются через /media/,
+# поэтому директория должна лежать внутри MEDIA_ROOT)
+DIFF_CACHE_DIR = os.path.join(MEDIA_ROOT, 'diff_results')
+DIFF_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+# Асинхронные представления для ASGI (project/asgi.py включает их через окружение):
+# размер пула потоков для блокирующего ввода-вывода и таймаут запроса в секундах
+ASYNC_VIEWS = os.environ.get('DJANGO_ASYNC_VIEWS') == '1'
+ASYNC_IO_WORKERS = 16
+ASYNC_VIEW_TIMEOUT = 15
+# Сколько потоков пула могут висеть в вызовах к архиву после таймаута;
+# при достижении предела запросы к архиву сразу получают 503
+ASYNC_STORAGE_STUCK_LIMIT = 12
+
 # Интернационализация
 LANGUAGE_CODE = 'ru-ru'
 TIME_ZONE = 'Europe/Moscow'